@@ -1,7 +1,6 @@
 import os
 from pathlib import Path
 from django.contrib.messages import constants as messages
-import dj_database_url
 from dotenv import load_dotenv
 
 # ===============================
@@ -9,18 +8,23 @@ from dotenv import load_dotenv
 # ===============================
 BASE_DIR = Path(__file__).resolve().parent.parent
 
-# Load .env (UTF-8 first, fallback to UTF-16 if keys are missing)
-try:
-    load_dotenv(BASE_DIR / ".env")
-except Exception:
-    pass
-
-if not os.getenv("STRIPE_SECRET_KEY") or not os.getenv("STRIPE_PUBLIC_KEY"):
+# Load .env in a single pass; the encoding (UTF-8 or UTF-16, as written by
+# some Windows editors) is picked from the byte order mark.
+def _load_env(path):
+    try:
+        with open(path, "rb") as fh:
+            bom = fh.read(2)
+    except OSError:
+        return
+    encoding = "utf-16" if bom in (b"\xff\xfe", b"\xfe\xff") else "utf-8"
     try:
-        load_dotenv(BASE_DIR / ".env", encoding="utf-16")
+        load_dotenv(path, encoding=encoding)
     except Exception:
         pass
 
+
+_load_env(BASE_DIR / ".env")
+
 # ===============================
 # Security / Debug
 # ===============================
@@ -72,16 +76,22 @@ INSTALLED_APPS = [
     'django.contrib.staticfiles',
     'main',
     'home',
-    'django_extensions',
 ]
 
+# Dev-only apps stay out of production workers' boot
+if DEBUG or os.environ.get("DJANGO_DEV_APPS", "").lower() == "true":
+    INSTALLED_APPS += ['django_extensions']
+
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',   # Important for static files on Heroku
+    'main.memory.MemoryMiddleware',   # per-view RSS growth, see main/memory.py
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
+    'main.slow_queries.SlowQueryMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'main.profiling.ProfilingMiddleware',   # staff-only, opt-in per request
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -99,6 +109,7 @@ TEMPLATES = [
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
                 'main.context_processors.cart_item_count',
+                'main.context_processors.currency',
             ],
         },
     },
@@ -109,21 +120,131 @@ WSGI_APPLICATION = 'candy_shop.wsgi.application'
 # ===============================
 # Database (Postgres if DATABASE_URL exists; otherwise SQLite locally)
 # ===============================
+# DB_POOL picks how workers hold Postgres connections:
+# - "persistent" (default): one connection per worker thread, kept for 10 min
+#   and health-checked before reuse, so a connection dropped by Heroku
+#   Postgres maintenance is replaced instead of failing a request.
+# - "pool": a psycopg 3 pool per worker shared by its threads (DB_POOL_MIN /
+#   DB_POOL_MAX / DB_POOL_TIMEOUT); idle threads don't pin a connection.
+# - "pgbouncer": DATABASE_URL points at PgBouncer in transaction mode. The
+#   bouncer can hand each transaction a different server connection, so
+#   server-side cursors (which live on one connection) are turned off.
+DB_POOL = os.environ.get("DB_POOL", "persistent").lower()
+
 if "DATABASE_URL" in os.environ and os.environ["DATABASE_URL"]:
+    import dj_database_url
+
     DATABASES = {
         "default": dj_database_url.config(
-            conn_max_age=600,
+            # Pooled connections go back to the pool after each request.
+            conn_max_age=0 if DB_POOL == "pool" else 600,
+            conn_health_checks=True,
             ssl_require=True,  # only for external/Postgres DB
         )
     }
+    if DB_POOL == "pool":
+        DATABASES["default"]["OPTIONS"]["pool"] = {
+            "min_size": int(os.environ.get("DB_POOL_MIN", "1")),
+            # One per gunicorn thread is enough; more only idles on the server.
+            "max_size": int(os.environ.get("DB_POOL_MAX", os.environ.get("GUNICORN_THREADS", "4"))),
+            "timeout": float(os.environ.get("DB_POOL_TIMEOUT", "10")),
+            "max_idle": 300,
+        }
+    elif DB_POOL == "pgbouncer":
+        DATABASES["default"]["DISABLE_SERVER_SIDE_CURSORS"] = True
 else:
     DATABASES = {
         "default": {
             "ENGINE": "django.db.backends.sqlite3",
             "NAME": BASE_DIR / "db.sqlite3",
+            # Same connection reuse as production so `manage.py db_pool_stats`
+            # shows what each mode does (SQLite has no pool of its own).
+            "CONN_MAX_AGE": 0 if DB_POOL == "pool" else 600,
+            "CONN_HEALTH_CHECKS": True,
         }
     }
 
+# Optional read replica for catalog and order-history reads (see
+# main/db_router.py). Locally two SQLite files work too, e.g.
+# REPLICA_DATABASE_URL=sqlite:///replica.sqlite3 with a copy of db.sqlite3.
+REPLICA_MAX_LAG = float(os.environ.get("REPLICA_MAX_LAG", "5"))
+REPLICA_STICKY_SECONDS = float(os.environ.get("REPLICA_STICKY_SECONDS", "15"))
+
+if os.environ.get("REPLICA_DATABASE_URL"):
+    import dj_database_url
+
+    _replica_url = os.environ["REPLICA_DATABASE_URL"]
+    DATABASES["replica"] = dj_database_url.parse(
+        _replica_url,
+        conn_max_age=DATABASES["default"]["CONN_MAX_AGE"],
+        conn_health_checks=True,
+        ssl_require=_replica_url.startswith("postgres"),
+    )
+    if _replica_url.startswith("postgres"):
+        # Same DB_POOL mode as the primary. A SQLite primary has no OPTIONS.
+        _default_options = DATABASES["default"].get("OPTIONS", {})
+        if "pool" in _default_options:
+            DATABASES["replica"].setdefault("OPTIONS", {})["pool"] = _default_options["pool"]
+        DATABASES["replica"]["DISABLE_SERVER_SIDE_CURSORS"] = DB_POOL == "pgbouncer"
+    # Tests run against one database.
+    DATABASES["replica"]["TEST"] = {"MIRROR": "default"}
+    DATABASE_ROUTERS = ["main.db_router.ReplicaRouter"]
+    MIDDLEWARE.insert(
+        MIDDLEWARE.index("django.contrib.auth.middleware.AuthenticationMiddleware") + 1,
+        "main.db_router.ReplicaMiddleware",
+    )
+
+# ===============================
+# Cache (Redis when REDIS_URL is set, e.g. Heroku Key-Value Store)
+# ===============================
+if os.environ.get("REDIS_URL"):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.environ["REDIS_URL"],
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
+    }
+
+# How long a worker may serve a cached catalog version before re-reading it.
+# Bumps delete the key, so with a shared cache (Redis) this only bounds
+# staleness for the per-process locmem cache.
+CATALOG_VERSION_CACHE_TIMEOUT = int(os.environ.get("CATALOG_VERSION_CACHE_TIMEOUT", "30"))
+
+# s-maxage for catalog pages served to anonymous visitors (see main/edge_cache.py)
+ANONYMOUS_CACHE_SECONDS = int(os.environ.get("ANONYMOUS_CACHE_SECONDS", "300"))
+
+# Statements slower than this are logged, EXPLAINed and aggregated in the
+# admin (see main/slow_queries.py); 0 turns the log off. ANALYZE runs a slow
+# SELECT a second time, so it is opt-in.
+SLOW_QUERY_MS = float(os.environ.get("SLOW_QUERY_MS", "200"))
+SLOW_QUERY_EXPLAIN_ANALYZE = os.environ.get("SLOW_QUERY_EXPLAIN_ANALYZE", "false").lower() == "true"
+
+# Staff request profiles kept in media storage (see main/profiling.py)
+PROFILE_KEEP = int(os.environ.get("PROFILE_KEEP", "50"))
+
+# Per-view memory tracking in each worker (see main/memory.py). tracemalloc
+# is off unless MEMORY_TRACE_FRAMES is set (or staff start it at
+# /diagnostics/memory/); it then snapshots every MEMORY_SAMPLE_EVERY-th request.
+MEMORY_TRACKING = os.environ.get("MEMORY_TRACKING", "true").lower() == "true"
+MEMORY_TRACE_FRAMES = int(os.environ.get("MEMORY_TRACE_FRAMES", "0"))
+MEMORY_SAMPLE_EVERY = max(1, int(os.environ.get("MEMORY_SAMPLE_EVERY", "50")))
+
+# How often each worker checks the catalog version to rebuild its typeahead
+# index (see main/search_index.py); suggestions can lag this far behind.
+SUGGEST_REFRESH_SECONDS = int(os.environ.get("SUGGEST_REFRESH_SECONDS", "10"))
+# Most products in that index (best sellers first; 0 = all). Every worker
+# builds its own copy: 10k products take ~3s and ~5 MB.
+SUGGEST_MAX_PRODUCTS = int(os.environ.get("SUGGEST_MAX_PRODUCTS", "10000"))
+
+# Rate limits on login/signup, add-to-cart and contact (see main/ratelimit.py)
+RATELIMIT_ENABLED = os.environ.get("RATELIMIT_ENABLED", "true").lower() == "true"
+
 # ===============================
 # Password validation
 # ===============================
@@ -148,10 +269,40 @@ USE_TZ = True
 STATIC_URL = '/static/'
 STATICFILES_DIRS = [BASE_DIR / 'candy_shop' / 'static']
 STATIC_ROOT = BASE_DIR / 'staticfiles'
-STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 
-MEDIA_URL = '/media/'
+# Production builds (DATABASE_URL set, as on Heroku) minify, fingerprint and
+# precompress (gzip + brotli) assets during collectstatic; locally the plain
+# storage keeps runserver and tests working without a collectstatic run.
+STORAGES = {
+    "default": {
+        "BACKEND": "django.core.files.storage.FileSystemStorage",
+    },
+    "staticfiles": {
+        "BACKEND": (
+            "candy_shop.storage.MinifiedCompressedManifestStaticFilesStorage"
+            if os.environ.get("DATABASE_URL")
+            else "django.contrib.staticfiles.storage.StaticFilesStorage"
+        ),
+    },
+}
+
+# Size budgets (bytes, gzip-compressed) checked by `manage.py check_asset_budget`
+# after collectstatic. css/critical.css is inlined in every page, so it is
+# measured uncompressed and kept well inside the first TCP round trip.
+STATIC_ASSET_BUDGETS = {
+    "css/style.css": 4608,
+    "js/main.js": 1536,
+    "js/typeahead.js": 768,
+    "css/critical.css": 6 * 1024,
+}
+
+MEDIA_URL = os.environ.get('MEDIA_URL', '/media/')
 MEDIA_ROOT = BASE_DIR / 'media'
+# Whether MEDIA_URL is actually served. Nothing serves MEDIA_ROOT once DEBUG
+# is off, and Heroku's filesystem is wiped on every restart, so in production
+# this stays off (pages link the original image_url) until the default
+# storage points at public, persistent storage and MEDIA_URL at its address.
+MEDIA_PUBLIC = os.environ.get('MEDIA_PUBLIC', str(DEBUG)).lower() == 'true'
 
 # ===============================
 # Messages tags
@@ -184,6 +335,13 @@ LOGOUT_REDIRECT_URL = 'home'
 # ===============================
 STRIPE_PUBLIC_KEY = os.environ.get("STRIPE_PUBLIC_KEY", "")
 STRIPE_SECRET_KEY = os.environ.get("STRIPE_SECRET_KEY", "")
-STRIPE_WEBHOOK_SECRET = os.environ.get("STRIPE_WEBHOOK_SECRET", "")  # leave empty if not used
-STRIPE_CURRENCY = os.environ.get("STRIPE_CURRENCY", "usd")  # match your $ display
+# Signing secret of the /stripe/webhook/ endpoint (checkout.session.completed,
+# .expired and .async_payment_*); leave empty if not used.
+STRIPE_WEBHOOK_SECRET = os.environ.get("STRIPE_WEBHOOK_SECRET", "")
+STRIPE_CURRENCY = os.environ.get("STRIPE_CURRENCY", "usd")  # the currency prices are stored in
 DOMAIN = os.environ.get("DOMAIN", "https://candy-shop-2-main-47a1afb34434.herokuapp.com")
+
+# Display currencies: rates against STRIPE_CURRENCY, re-read when the file
+# changes (see main/currency.py). The visitor's pick is kept in a cookie.
+CURRENCY_RATES_FILE = Path(os.environ.get("CURRENCY_RATES_FILE", BASE_DIR / "currency_rates.json"))
+CURRENCY_COOKIE_NAME = "currency"
@@ -15,6 +15,38 @@ document.addEventListener('DOMContentLoaded', () => {
     });
   }
 
+  // SESSION STATE for shared-cached pages: CSRF token + cart badge
+  const stateUrl = document.body.dataset.sessionStateUrl;
+  if (stateUrl) {
+    const state = fetch(stateUrl, { credentials: 'same-origin' })
+      .then((res) => res.json())
+      .then((data) => {
+        document.querySelectorAll('[data-csrf-token]').forEach((input) => {
+          input.value = data.csrf_token;
+        });
+        document.querySelectorAll('[data-cart-count]').forEach((el) => {
+          el.textContent = data.cart_item_count;
+        });
+        return data;
+      });
+
+    // Hold back submits that happen before the token has arrived
+    document.querySelectorAll('form').forEach((form) => {
+      const input = form.querySelector('[data-csrf-token]');
+      if (!input) return;
+      form.addEventListener('submit', (event) => {
+        if (input.value) return;
+        event.preventDefault();
+        state.then(() => form.submit()).catch(() => form.submit());
+      });
+    });
+  }
+
+  // Selects that submit their form on change (currency picker)
+  document.querySelectorAll('select[data-autosubmit]').forEach((select) => {
+    select.addEventListener('change', () => select.form.requestSubmit());
+  });
+
   // OPTIONAL: Dynamic insert (only if you use placeholders)
   const insertIfPlaceholderExists = (id, html) => {
     const el = document.getElementById(id);
@@ -0,0 +1,41 @@
+// typeahead.js – suggestions for the header search box from /products/suggest/
+
+document.addEventListener('DOMContentLoaded', () => {
+  const input = document.querySelector('[data-suggest-url]');
+  const list = input && document.getElementById(input.getAttribute('list'));
+  if (!list) return;
+
+  let urls = {};
+  let timer;
+  let controller;
+
+  input.addEventListener('input', () => {
+    clearTimeout(timer);
+    const query = input.value.trim();
+    if (query.length < 2) return;
+    timer = setTimeout(() => {
+      if (controller) controller.abort();
+      controller = new AbortController();
+      fetch(`${input.dataset.suggestUrl}?q=${encodeURIComponent(query)}`, { signal: controller.signal })
+        .then((res) => res.json())
+        .then((data) => {
+          urls = {};
+          list.replaceChildren(...data.results.map((item) => {
+            urls[item.name] = item.url;
+            const option = document.createElement('option');
+            option.value = item.name;
+            return option;
+          }));
+        })
+        .catch(() => {});
+    }, 150);
+  });
+
+  // Picking a suggestion goes straight to the product
+  input.form.addEventListener('submit', (event) => {
+    const url = urls[input.value];
+    if (!url) return;
+    event.preventDefault();
+    window.location.href = url;
+  });
+});
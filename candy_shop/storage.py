@@ -0,0 +1,134 @@
+"""
+Static files storage for production builds.
+
+On top of WhiteNoise's fingerprinting and gzip/brotli compression,
+collectstatic minifies CSS/JS and writes ``css/critical.css``: the rules
+from ``css/style.css`` needed to paint the header of ``base.html``. That
+file is inlined by ``{% critical_css %}`` so the full stylesheet can load
+without blocking rendering.
+"""
+import re
+
+from django.core.files.base import ContentFile
+from django.template.loader import get_template
+from whitenoise.storage import CompressedManifestStaticFilesStorage
+
+CRITICAL_SOURCE = "css/style.css"
+CRITICAL_TEMPLATE = "base.html"
+CRITICAL_OUTPUT = "css/critical.css"
+
+# Selectors that always apply to the first paint.
+ALWAYS_CRITICAL_TAGS = {"*", "html", "body", ":root"}
+
+
+def minify_css(source):
+    import rcssmin
+
+    return rcssmin.cssmin(source)
+
+
+def minify_js(source):
+    import rjsmin
+
+    return rjsmin.jsmin(source)
+
+
+MINIFIERS = {
+    ".css": minify_css,
+    ".js": minify_js,
+}
+
+
+def _above_the_fold(html):
+    """Tags, classes and ids used before ``<main`` in ``html``."""
+    head = html.split("<main", 1)[0]
+    tags = set(re.findall(r"<([a-zA-Z][\w-]*)", head))
+    classes = set()
+    for value in re.findall(r'class="([^"]*)"', head):
+        classes.update(value.split())
+    ids = set(re.findall(r'id="([^"]*)"', head))
+    return {t.lower() for t in tags} | ALWAYS_CRITICAL_TAGS, classes, ids
+
+
+def _selector_is_critical(selector, tags, classes, ids):
+    selector = re.sub(r"::?[\w-]+(\([^)]*\))?", "", selector)  # drop pseudo-classes/elements
+    selector = re.sub(r"\[[^\]]*\]", "", selector)  # drop attribute selectors
+    if not selector.strip():
+        return True
+    used_classes = set(re.findall(r"\.([\w-]+)", selector))
+    used_ids = set(re.findall(r"#([\w-]+)", selector))
+    used_tags = {t.lower() for t in re.findall(r"(?:^|[\s>+~])([a-zA-Z][\w-]*|\*)", selector)}
+    return used_classes <= classes and used_ids <= ids and used_tags <= tags
+
+
+def _split_blocks(css):
+    """Yield (prelude, body) for every top-level ``prelude { body }`` block."""
+    depth = 0
+    start = 0
+    prelude = ""
+    for i, char in enumerate(css):
+        if char == "{":
+            if depth == 0:
+                prelude = css[start:i].strip()
+                start = i + 1
+            depth += 1
+        elif char == "}":
+            depth -= 1
+            if depth == 0:
+                yield prelude, css[start:i]
+                start = i + 1
+        elif char == ";" and depth == 0:
+            start = i + 1  # skip statements such as @import
+
+
+def extract_critical_css(css, html):
+    tags, classes, ids = _above_the_fold(html)
+    css = re.sub(r"/\*.*?\*/", "", css, flags=re.S)
+    out = []
+    for prelude, body in _split_blocks(css):
+        if prelude.startswith("@media") or prelude.startswith("@supports"):
+            inner = extract_critical_css(body, html)
+            if inner:
+                out.append(f"{prelude}{{{inner}}}")
+        elif prelude.startswith("@"):
+            continue  # @font-face, @keyframes, ... aren't needed for first paint
+        elif any(_selector_is_critical(s, tags, classes, ids) for s in prelude.split(",")):
+            out.append(f"{prelude}{{{body.strip()}}}")
+    return "".join(out)
+
+
+class MinifiedCompressedManifestStaticFilesStorage(CompressedManifestStaticFilesStorage):
+    """Minify CSS/JS before WhiteNoise hashes and compresses them."""
+
+    def post_process(self, paths, dry_run=False, **options):
+        if not dry_run:
+            paths = dict(paths)
+            for path in paths:
+                if self._minify(path):
+                    # Hash and compress the minified copy instead of the source file.
+                    paths[path] = (self, path)
+            if CRITICAL_SOURCE in paths:
+                self._write_critical_css()
+        yield from super().post_process(paths, dry_run, **options)
+
+    def _minify(self, path):
+        name = path.lower()
+        ext = name[name.rfind("."):]
+        if ext not in MINIFIERS or ".min." in name or not self.exists(path):
+            return False
+        with self.open(path) as fh:
+            try:
+                source = fh.read().decode("utf-8")
+            except UnicodeDecodeError:
+                return False
+        self.delete(path)
+        self._save(path, ContentFile(MINIFIERS[ext](source).encode("utf-8")))
+        return True
+
+    def _write_critical_css(self):
+        with self.open(CRITICAL_SOURCE) as fh:
+            css = fh.read().decode("utf-8")
+        html = get_template(CRITICAL_TEMPLATE).template.source
+        if self.exists(CRITICAL_OUTPUT):
+            self.delete(CRITICAL_OUTPUT)
+        self._save(CRITICAL_OUTPUT, ContentFile(extract_critical_css(css, html).encode("utf-8")))
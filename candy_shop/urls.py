@@ -1,3 +1,5 @@
+from django.conf import settings
+from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import path, include
 
@@ -8,3 +10,7 @@ urlpatterns = [
     path('', include('main.urls')),
     path('accounts/', include('django.contrib.auth.urls')),
 ]
+
+# Product thumbnails under MEDIA_ROOT; static() only adds the route when
+# DEBUG is on. Production needs public storage, see MEDIA_PUBLIC.
+urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
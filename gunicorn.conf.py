@@ -0,0 +1,131 @@
+"""
+Gunicorn configuration (loaded by the Procfile).
+
+Every value can be overridden from the environment so dyno sizes and
+load-test profiles (see `manage.py benchmark_gunicorn`) don't need code
+changes.
+"""
+import os
+import resource
+import threading
+import time
+
+_env = os.environ.get
+
+
+def _memory_limit_mb():
+    """Container memory limit (cgroup v2, then v1), or None if unlimited."""
+    for path in ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory/memory.limit_in_bytes"):
+        try:
+            with open(path) as fh:
+                value = fh.read().strip()
+        except OSError:
+            continue
+        if value.isdigit() and int(value) < 1 << 60:
+            return int(value) // (1024 * 1024)
+    return None
+
+
+def _default_workers():
+    # I/O-bound (Stripe, Postgres): 2 x CPU + 1, but never more workers
+    # than fit in the dyno's memory next to the preloaded master.
+    cpus = os.cpu_count() or 1
+    workers = 2 * cpus + 1
+    memory = _memory_limit_mb()
+    if memory:
+        per_worker = int(_env("GUNICORN_WORKER_MEMORY_MB", "120"))
+        workers = min(workers, max(1, (memory - per_worker) // per_worker))
+    return workers
+
+
+bind = f"0.0.0.0:{_env('PORT', '8000')}"
+# Heroku sets WEB_CONCURRENCY per dyno size; honour it when present.
+workers = int(_env("WEB_CONCURRENCY") or _default_workers())
+
+# Threads let a worker keep serving while one request waits on Stripe.
+worker_class = _env("GUNICORN_WORKER_CLASS", "gthread")
+threads = int(_env("GUNICORN_THREADS", "4"))
+
+# Import Django once in the master; forked workers share those pages copy-on-write.
+preload_app = _env("GUNICORN_PRELOAD", "true").lower() == "true"
+
+# Recycle workers to cap slow memory growth, staggered so they don't all
+# restart at once.
+max_requests = int(_env("GUNICORN_MAX_REQUESTS", "1000"))
+max_requests_jitter = int(_env("GUNICORN_MAX_REQUESTS_JITTER", "100"))
+
+# The Heroku router gives up after 30s; stop a stuck worker before that so it
+# is restarted instead of holding the connection. Stripe calls need a few
+# seconds at most.
+timeout = int(_env("GUNICORN_TIMEOUT", "25"))
+graceful_timeout = int(_env("GUNICORN_GRACEFUL_TIMEOUT", "20"))
+keepalive = int(_env("GUNICORN_KEEPALIVE", "5"))
+
+# An empty GUNICORN_ACCESSLOG turns the access log off.
+accesslog = _env("GUNICORN_ACCESSLOG", "-") or None
+loglevel = _env("GUNICORN_LOGLEVEL", "info")
+
+# Log per-worker stats every N requests (0 disables).
+STATS_EVERY = int(_env("GUNICORN_STATS_EVERY", "500"))
+
+_stats = {"requests": 0, "total": 0.0, "max": 0.0}
+_stats_lock = threading.Lock()
+
+
+def post_fork(server, worker):
+    _stats.update(requests=0, total=0.0, max=0.0)
+    if server.cfg.preload_app:
+        # Nothing should have connected in the master, but never share a socket.
+        from django.db import connections
+
+        connections.close_all()
+
+
+def post_worker_init(worker):
+    # Start building the typeahead index in the background; suggestions
+    # stay empty until it is ready but never wait on (or hit) the database,
+    # and the worker can serve right away.
+    from main import memory, search_index
+
+    search_index.start()
+    # Measure this worker from here, not from the (preloaded) master.
+    memory.reset()
+
+
+def pre_request(worker, req):
+    req._started = time.perf_counter()
+
+
+def post_request(worker, req, environ, resp):
+    elapsed = time.perf_counter() - getattr(req, "_started", time.perf_counter())
+    with _stats_lock:
+        _stats["requests"] += 1
+        _stats["total"] += elapsed
+        _stats["max"] = max(_stats["max"], elapsed)
+        due = STATS_EVERY and _stats["requests"] % STATS_EVERY == 0
+    if due:
+        _log_stats(worker)
+
+
+def worker_exit(server, worker):
+    _log_stats(worker)
+
+
+def _log_stats(worker):
+    requests = _stats["requests"]
+    if not requests:
+        return
+    rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    from django.conf import settings
+    from main import memory
+    from main.dbpool import pool_stats
+
+    db = pool_stats()
+    worker.log.info(
+        "worker %s: %d requests, avg %.1f ms, max %.1f ms, peak RSS %.0f MB, "
+        "db connects %d, pool size %s, pool waiting %s",
+        worker.pid, requests, _stats["total"] / requests * 1000, _stats["max"] * 1000, rss_mb,
+        db["connections_opened"], db.get("pool_size", "-"), db.get("requests_waiting", "-"),
+    )
+    if settings.MEMORY_TRACKING:
+        worker.log.info("worker %s: %s", worker.pid, memory.summary())
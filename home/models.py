@@ -10,6 +10,9 @@ class Message(models.Model):
 
     class Meta:
         ordering = ["-created_at"]
+        indexes = [
+            models.Index(fields=["created_at"], name="message_created_idx"),
+        ]
 
     def __str__(self):
         return f"{self.name} - {self.subject or self.message[:30]}"
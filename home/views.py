@@ -2,19 +2,22 @@ from django.shortcuts import render, redirect
 from django.core.mail import send_mail
 from django.conf import settings
 from django.contrib import messages
+from django.views.decorators.http import condition
 
 from .forms import ContactForm
 from .models import TeamMember, Message
 from  main.models import Product
+from main.catalog import catalog_page_etag, catalog_page_last_modified
+from main.edge_cache import anonymous_cache_page
+from main.ratelimit import ratelimit
 
 
-# Home page - shows latest products
+# Home page - shows latest products (cart badge comes from the context processor)
+@anonymous_cache_page
+@condition(etag_func=catalog_page_etag, last_modified_func=catalog_page_last_modified)
 def home(request):
-    cart = request.session.get('cart', {})
-    cart_count = sum(item['quantity'] for item in cart.values())
     latest_products = Product.objects.all().order_by('-id')[:3]
     return render(request, 'home/home.html', {
-        'cart_count': cart_count,
         'latest_products': latest_products,
     })
 
@@ -29,7 +32,8 @@ def team(request):
     team_members = TeamMember.objects.all()
     return render(request, 'home/team.html', {'team_members': team_members})
 
-# Contact form
+# Contact form (each POST sends two emails)
+@ratelimit("5/h", key="ip")
 def contact(request):
     if request.method == 'POST':
         form = ContactForm(request.POST)
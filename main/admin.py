@@ -1,5 +1,22 @@
-from django.contrib import admin
+from datetime import timedelta
+
+from django.contrib import admin, messages
+from django.contrib.admin import helpers
+from django.core.exceptions import PermissionDenied
+from django.db.models import Sum
+from django.http import FileResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404, redirect
+from django.template.response import TemplateResponse
+from django.urls import path, reverse
+from django.utils.html import format_html
+from django.utils import timezone
+
+from .exports import EXPORT_FORMATS
+from .forms import PriceAdjustmentForm, PriceImportForm, RestockForm
+from . import inventory
+from .money import format_money
 from .models import (
+    Category,
     Product,
     Coupon,
     Cart,
@@ -7,18 +24,155 @@ from .models import (
     GiftCertificate,
     Order,
     OrderItem,
+    DailySales,
+    DailyProductSales,
+    DailyCouponSales,
+    RequestProfile,
+    Review,
+    SlowQuery,
 )
+from .paginators import EstimatedCountPaginator
+from .pricing import CHUNK_SIZE, parse_csv, preview_prices, preview_rows, update_prices, update_prices_from_rows
+from .profiling import QUERY_PARAM, TOKEN_MAX_AGE, make_token
+
+
+def money_column(field, description=None, ordering=True):
+    """
+    A list_display/readonly_fields column showing a cents field (or a
+    method returning cents) as '12.50'.
+    """
+    name = field.removesuffix("_cents")
+
+    @admin.display(
+        description=description or name.replace("_", " "),
+        ordering=field if ordering else None,
+    )
+    def column(obj):
+        value = getattr(obj, field)
+        return format_money(value() if callable(value) else value)
+
+    column.__name__ = name
+    return column
+
+
+@admin.register(Category)
+class CategoryAdmin(admin.ModelAdmin):
+    list_display = ("name", "slug", "position")
+    list_editable = ("position",)
+    prepopulated_fields = {"slug": ("name",)}
 
 
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
-    list_display = ("name", "price")
+    list_display = ("name", "category", money_column("price_cents"), "stock", "average_rating", "rating_count")
+    list_filter = ("category",)
+    list_select_related = ("category",)
     search_fields = ("name",)
+    actions = ("adjust_prices", "restock")
+    change_list_template = "admin/main/product/change_list.html"
+
+    def get_readonly_fields(self, request, obj=None):
+        # A save() would overwrite reservations taken meanwhile; existing
+        # products are restocked through the action (main/inventory.py).
+        if obj is not None:
+            return ("stock",) + tuple(super().get_readonly_fields(request, obj))
+        return super().get_readonly_fields(request, obj)
+
+    # Kept up to date with F() deltas by checkouts, restocks and reviews;
+    # writing back the values loaded with the form would undo those.
+    CONCURRENT_FIELDS = ("stock", "rating_count", "rating_sum")
+
+    def save_model(self, request, obj, form, change):
+        if not change:
+            return super().save_model(request, obj, form, change)
+        concrete = {field.name for field in obj._meta.concrete_fields}
+        obj.save(update_fields=[
+            name for name in form.fields if name in concrete and name not in self.CONCURRENT_FIELDS
+        ])
+
+    # Bulk price and stock changes run as set-based UPDATEs (see
+    # main/pricing.py and main/inventory.py) instead of one save() per product.
+    def _action_page(self, request, template, context):
+        context = {
+            **self.admin_site.each_context(request),
+            "opts": self.model._meta,
+            "chunk_size": CHUNK_SIZE,
+            **context,
+        }
+        return TemplateResponse(request, template, context)
+
+    @admin.action(description="Adjust prices of selected products", permissions=["change"])
+    def adjust_prices(self, request, queryset):
+        submitted = "_preview" in request.POST or "_apply" in request.POST
+        form = PriceAdjustmentForm(request.POST if submitted else None)
+        preview = None
+        if submitted and form.is_valid():
+            if "_apply" in request.POST:
+                changed = update_prices(queryset, form.adjustment())
+                self.message_user(request, f"Changed the price of {changed} products.", messages.SUCCESS)
+                return None
+            preview = preview_prices(queryset, form.adjustment())
+        return self._action_page(request, "admin/main/product/adjust_prices.html", {
+            "title": "Adjust prices",
+            "form": form,
+            "preview": preview,
+            "count": queryset.count(),
+            "selected": request.POST.getlist(helpers.ACTION_CHECKBOX_NAME),
+            "select_across": request.POST.get("select_across") == "1",
+            "action_checkbox_name": helpers.ACTION_CHECKBOX_NAME,
+        })
+
+    @admin.action(description="Restock selected products", permissions=["change"])
+    def restock(self, request, queryset):
+        form = RestockForm(request.POST if "_apply" in request.POST else None)
+        if form.is_bound and form.is_valid():
+            changed = inventory.restock(
+                queryset.values_list("pk", flat=True), form.cleaned_data["quantity"], form.cleaned_data["track"]
+            )
+            self.message_user(request, f"Changed the stock of {changed} products.", messages.SUCCESS)
+            return None
+        return self._action_page(request, "admin/main/product/restock.html", {
+            "title": "Restock",
+            "form": form,
+            "count": queryset.count(),
+            "selected": request.POST.getlist(helpers.ACTION_CHECKBOX_NAME),
+            "select_across": request.POST.get("select_across") == "1",
+            "action_checkbox_name": helpers.ACTION_CHECKBOX_NAME,
+        })
+
+    def get_urls(self):
+        return [
+            path(
+                "import-prices/",
+                self.admin_site.admin_view(self.import_prices_view),
+                name="main_product_import_prices",
+            ),
+        ] + super().get_urls()
+
+    def import_prices_view(self, request):
+        if not self.has_change_permission(request):
+            raise PermissionDenied
+        form = PriceImportForm(request.POST or None, request.FILES or None)
+        preview = errors = None
+        if request.method == "POST" and form.is_valid():
+            rows, errors = parse_csv(form.cleaned_data["file"], *form.rounding_rule())
+            # Nothing is applied from a file with mistakes in it.
+            if not errors and not form.cleaned_data["dry_run"]:
+                changed = update_prices_from_rows(rows)
+                self.message_user(request, f"Changed the price of {changed} products.", messages.SUCCESS)
+                return redirect("admin:main_product_changelist")
+            preview = preview_rows(rows)
+        return self._action_page(request, "admin/main/product/import_prices.html", {
+            "title": "Import prices",
+            "form": form,
+            "preview": preview,
+            "errors": errors,
+        })
 
 
 @admin.register(GiftCertificate)
 class GiftCertificateAdmin(admin.ModelAdmin):
-    list_display = ("code", "recipient_name", "amount", "status", "created_at")
+    list_display = ("code", "recipient_name", money_column("amount_cents"), "status", "created_at")
     list_filter = ("status", "created_at")
     search_fields = ("code", "recipient_name", "recipient_email")
     readonly_fields = ("code", "created_at")
@@ -35,26 +189,250 @@ class CouponAdmin(admin.ModelAdmin):
 @admin.register(Cart)
 class CartAdmin(admin.ModelAdmin):
     list_display = ("user", "created_at", "updated_at")
-    search_fields = ("user__username",)
+    list_select_related = ("user",)
+    search_fields = ("^user__username",)
+    raw_id_fields = ("user",)
     readonly_fields = ("created_at", "updated_at")
 
 
 @admin.register(CartItem)
 class CartItemAdmin(admin.ModelAdmin):
-    list_display = ("cart", "product", "quantity", "total_price")
-    search_fields = ("cart__user__username", "product__name")
-    readonly_fields = ("cart", "product", "quantity", "total_price")
+    list_display = ("cart", "product", "quantity", money_column("total_cents", "total", ordering=False))
+    list_select_related = ("cart__user", "product")
+    search_fields = ("^cart__user__username", "^product__name")
+    readonly_fields = ("cart", "product", "quantity", money_column("total_cents", "total", ordering=False))
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
+def _streaming_export(queryset, fmt):
+    iter_lines, content_type = EXPORT_FORMATS[fmt]
+    filename = f"orders-{timezone.now():%Y%m%d-%H%M%S}.{fmt}"
+    response = StreamingHttpResponse(iter_lines(queryset), content_type=content_type)
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
 
 
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
-    list_display = ("id", "user", "date", "total", "coupon", "discount_amount")
-    list_filter = ("date", "coupon")
-    search_fields = ("user__username",)
-    readonly_fields = ("date", "total", "discount_amount")
+    list_display = ("id", "user", "date", money_column("total_cents"), "coupon", money_column("discount_cents"))
+    list_filter = ("date", "coupon", "currency")
+    list_select_related = ("user", "coupon")
+    search_fields = ("=id", "^user__username")
+    readonly_fields = ("date", money_column("total_cents"), money_column("discount_cents"))
+    exclude = ("total_cents", "discount_cents")
+    raw_id_fields = ("user", "coupon")
+    date_hierarchy = "date"
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    actions = ("export_csv", "export_jsonl")
+
+    @admin.action(description="Export selected orders as CSV")
+    def export_csv(self, request, queryset):
+        return _streaming_export(queryset, "csv")
+
+    @admin.action(description="Export selected orders as JSONL")
+    def export_jsonl(self, request, queryset):
+        return _streaming_export(queryset, "jsonl")
 
 
 @admin.register(OrderItem)
 class OrderItemAdmin(admin.ModelAdmin):
-    list_display = ("order", "product", "quantity", "price", "line_total")
-    search_fields = ("order__user__username", "product__name")
+    list_display = (
+        "order", "product", "quantity", money_column("price_cents"),
+        money_column("line_total_cents", "line total", ordering=False),
+    )
+    list_select_related = ("order__user", "product")
+    search_fields = ("=order__id", "^order__user__username", "^product__name")
+    raw_id_fields = ("order", "product")
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
+@admin.register(Review)
+class ReviewAdmin(admin.ModelAdmin):
+    # Moderation only: reviews come from customers through main/reviews.py,
+    # which keeps the product's rating aggregates in step. Deleting is fine
+    # (a post_delete signal subtracts the rating).
+    list_display = ("product", "user", "rating", "created_at")
+    list_filter = ("rating", "created_at")
+    list_select_related = ("product", "user")
+    search_fields = ("^product__name", "^user__username", "body")
+    readonly_fields = ("product", "user", "rating", "body", "created_at")
+
+    def has_add_permission(self, request):
+        return False
+
+
+# --- Reporting (reads only the rollup tables) ---
+class ReadOnlyRollupAdmin(admin.ModelAdmin):
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(DailySales)
+class DailySalesAdmin(ReadOnlyRollupAdmin):
+    list_display = (
+        "day", "orders", "units", money_column("revenue_cents"), money_column("discount_cents"),
+        "gift_certificates", money_column("gift_cents", "gift total"),
+    )
+    date_hierarchy = "day"
+    change_list_template = "admin/main/dailysales/change_list.html"
+    dashboard_days = 30
+
+    def changelist_view(self, request, extra_context=None):
+        since = timezone.localdate() - timedelta(days=self.dashboard_days - 1)
+        summary = DailySales.objects.filter(day__gte=since).aggregate(
+            orders=Sum("orders"),
+            units=Sum("units"),
+            revenue_cents=Sum("revenue_cents"),
+            discount_cents=Sum("discount_cents"),
+            gift_certificates=Sum("gift_certificates"),
+            gift_cents=Sum("gift_cents"),
+        )
+        top_products = (
+            DailyProductSales.objects.filter(day__gte=since)
+            .values("product__name")
+            .annotate(units=Sum("units"), revenue_cents=Sum("revenue_cents"))
+            .order_by("-revenue_cents")[:10]
+        )
+        coupons = (
+            DailyCouponSales.objects.filter(day__gte=since)
+            .values("coupon__code")
+            .annotate(orders=Sum("orders"), discount_cents=Sum("discount_cents"))
+            .order_by("-discount_cents")[:10]
+        )
+        extra_context = {
+            **(extra_context or {}),
+            "dashboard_days": self.dashboard_days,
+            "summary": summary,
+            "top_products": top_products,
+            "coupons": coupons,
+        }
+        return super().changelist_view(request, extra_context=extra_context)
+
+
+@admin.register(DailyProductSales)
+class DailyProductSalesAdmin(ReadOnlyRollupAdmin):
+    list_display = ("day", "product", "units", money_column("revenue_cents"))
+    list_select_related = ("product",)
+    date_hierarchy = "day"
+
+
+@admin.register(DailyCouponSales)
+class DailyCouponSalesAdmin(ReadOnlyRollupAdmin):
+    list_display = ("day", "coupon", "orders", money_column("discount_cents"))
+    list_select_related = ("coupon",)
+    date_hierarchy = "day"
+
+
+# --- Diagnostics ---
+@admin.register(RequestProfile)
+class RequestProfileAdmin(admin.ModelAdmin):
+    list_display = ("created_at", "method", "path", "status_code", "duration", "queries", "user", "download")
+    list_filter = ("method", "status_code")
+    list_select_related = ("user",)
+    search_fields = ("path",)
+    date_hierarchy = "created_at"
+    fields = ("created_at", "user", "method", "path", "status_code", "duration", "queries", "download", "summary_text")
+    readonly_fields = fields
+    change_list_template = "admin/main/requestprofile/change_list.html"
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    @admin.display(description="time", ordering="duration_ms")
+    def duration(self, obj):
+        return f"{obj.duration_ms:.0f} ms"
+
+    @admin.display(description="SQL", ordering="query_count")
+    def queries(self, obj):
+        return f"{obj.query_count} ({obj.query_ms:.0f} ms)"
+
+    @admin.display(description="pstats")
+    def download(self, obj):
+        url = reverse("admin:main_requestprofile_download", args=[obj.pk])
+        return format_html('<a href="{}">{}</a>', url, obj.profile.name.rsplit("/", 1)[-1])
+
+    @admin.display(description="summary")
+    def summary_text(self, obj):
+        return format_html('<pre style="white-space: pre; overflow-x: auto;">{}</pre>', obj.summary)
+
+    def get_urls(self):
+        return [
+            path(
+                "<int:pk>/download/",
+                self.admin_site.admin_view(self.download_view),
+                name="main_requestprofile_download",
+            ),
+        ] + super().get_urls()
+
+    def download_view(self, request, pk):
+        # Served through the admin, never from MEDIA_URL: profiles show code paths.
+        if not self.has_view_permission(request):
+            return self.admin_site.login(request)
+        profile = get_object_or_404(RequestProfile, pk=pk)
+        return FileResponse(
+            profile.profile.open("rb"), as_attachment=True, filename=profile.profile.name.rsplit("/", 1)[-1]
+        )
+
+    def changelist_view(self, request, extra_context=None):
+        extra_context = {
+            **(extra_context or {}),
+            "profile_param": QUERY_PARAM,
+            "profile_token": make_token(request.user),
+            "profile_token_minutes": TOKEN_MAX_AGE // 60,
+        }
+        return super().changelist_view(request, extra_context=extra_context)
+
+
+@admin.register(SlowQuery)
+class SlowQueryAdmin(admin.ModelAdmin):
+    # Worst offenders (by total time spent) first. Delete rows to reset them.
+    list_display = ("short_sql", "count", "total", "average", "slowest", "view", "last_seen")
+    list_filter = ("view",)
+    search_fields = ("sql", "view", "location")
+    fields = (
+        "fingerprint", "count", "total", "average", "slowest", "first_seen", "last_seen",
+        "view", "location", "sql_text", "explain_text",
+    )
+    readonly_fields = fields
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    @admin.display(description="SQL")
+    def short_sql(self, obj):
+        return obj.sql[:120]
+
+    @admin.display(description="total", ordering="total_ms")
+    def total(self, obj):
+        return f"{obj.total_ms / 1000:.1f} s"
+
+    @admin.display(description="avg")
+    def average(self, obj):
+        return f"{obj.avg_ms:.0f} ms"
+
+    @admin.display(description="max", ordering="max_ms")
+    def slowest(self, obj):
+        return f"{obj.max_ms:.0f} ms"
+
+    @admin.display(description="SQL")
+    def sql_text(self, obj):
+        return format_html('<pre style="white-space: pre-wrap;">{}</pre>', obj.sql)
+
+    @admin.display(description="EXPLAIN (slowest run)")
+    def explain_text(self, obj):
+        return format_html('<pre style="white-space: pre; overflow-x: auto;">{}</pre>', obj.explain or "-")
@@ -0,0 +1,125 @@
+"""
+Catalog version tracking.
+
+Every change to a Product bumps a single CatalogVersion row. Views use the
+version (cached, so normally no DB hit) for ETag/Last-Modified headers and
+as a cache key for anything derived from the catalog: price tables, facet
+counts, the feed and the search index.
+
+Ratings and sold-out badges only change how listings look, so reviews and
+stock bump a separate listing version instead. That one is only part of
+page ETags, and the derived caches above survive it.
+"""
+import hashlib
+
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .edge_cache import is_anonymous_cacheable
+from .models import CatalogVersion
+
+CATALOG_VERSION_KEY = "catalog:versions"
+
+
+def _state():
+    """(catalog version, listing version, updated_at)"""
+    state = cache.get(CATALOG_VERSION_KEY)
+    if state is None:
+        row = CatalogVersion.objects.filter(pk=1).values_list("version", "listing_version", "updated_at").first()
+        state = row or (0, 0, timezone.now().replace(microsecond=0))
+        cache.set(CATALOG_VERSION_KEY, state, settings.CATALOG_VERSION_CACHE_TIMEOUT)
+    return state
+
+
+def get_catalog_version():
+    """Return (version, updated_at) for the product catalog."""
+    version, _, updated_at = _state()
+    return version, updated_at
+
+
+def catalog_version():
+    return _state()[0]
+
+
+def listing_version():
+    return _state()[1]
+
+
+def catalog_last_modified():
+    """When the catalog or a listing last changed."""
+    return _state()[2]
+
+
+def _bump(field):
+    now = timezone.now()
+    updated = CatalogVersion.objects.filter(pk=1).update(**{field: F(field) + 1}, updated_at=now)
+    if not updated:
+        CatalogVersion.objects.create(pk=1, updated_at=now, **{field: 1})
+    # Drop the cached version only once the new data is visible to other
+    # connections, so nobody caches new ETags for old content.
+    transaction.on_commit(lambda: cache.delete(CATALOG_VERSION_KEY))
+
+
+def bump_catalog_version():
+    """Record a catalog change. Bulk updates that skip signals must call this once."""
+    _bump("version")
+
+
+def bump_listing_version():
+    """Record a change to ratings or stock badges only; catalog caches are kept."""
+    _bump("listing_version")
+
+
+# --- condition() helpers for catalog pages ---
+def _has_pending_messages(request):
+    return len(get_messages(request)) > 0
+
+
+def catalog_page_etag(request, *args, **kwargs):
+    """
+    ETag for pages built from the catalog, listings and exchange rates
+    plus the visitor's cart badge and display currency.
+
+    Returns None (no conditional handling) when flash messages are waiting,
+    since those must be rendered exactly once. Anonymous cacheable pages
+    depend on nothing but the catalog, listings, the rates and the URL.
+    """
+    # currency imports this module.
+    from .currency import rates_digest
+
+    if is_anonymous_cacheable(request):
+        parts = [catalog_version(), listing_version(), rates_digest(), request.get_full_path()]
+        return hashlib.md5(repr(parts).encode()).hexdigest()
+    if _has_pending_messages(request):
+        return None
+    cart = request.session.get("cart", {})
+    parts = [
+        catalog_version(),
+        listing_version(),
+        rates_digest(),
+        request.get_full_path(),
+        request.user.pk or 0,
+        request.COOKIES.get(settings.CURRENCY_COOKIE_NAME, ""),
+        sum(item.get("quantity", 1) for item in cart.values() if isinstance(item, dict)),
+    ]
+    return hashlib.md5(repr(parts).encode()).hexdigest()
+
+
+def catalog_page_last_modified(request, *args, **kwargs):
+    # Only pages that depend on nothing but the catalog can use dates:
+    # visitors with a session may have a cart badge or messages.
+    if not is_anonymous_cacheable(request):
+        return None
+    return catalog_last_modified()
+
+
+def catalog_feed_etag(request, *args, **kwargs):
+    return f"catalog-{catalog_version()}"
+
+
+def catalog_feed_last_modified(request, *args, **kwargs):
+    return catalog_last_modified()
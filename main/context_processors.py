@@ -1,4 +1,11 @@
+from .currency import currencies, get_currency
+
+
 def cart_item_count(request):
+    # Shared-cached pages must not read the session; main.js fills the badge in.
+    if getattr(request, 'anonymous_cacheable', False):
+        return {'cart_item_count': 0}
+
     cart = request.session.get('cart', {})
     count = 0
 
@@ -12,3 +19,9 @@ def cart_item_count(request):
         count = len(cart)
     
     return {'cart_item_count': count}
+
+
+def currency(request):
+    # Shared-cached pages never carry the currency cookie, so this is the
+    # base currency there.
+    return {'currency': get_currency(request), 'currencies': currencies()}
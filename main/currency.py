@@ -0,0 +1,126 @@
+"""
+Display currencies and precomputed price tables.
+
+Prices are stored in cents of the base currency (STRIPE_CURRENCY). Other
+currencies come from a local rates file (CURRENCY_RATES_FILE), e.g.
+
+    {"base": "usd", "rates": {"eur": "0.86", "sek": "10.60"}}
+
+where a rate is how much of that currency one unit of ``base`` buys. The
+file is re-read when its mtime changes, so updating it needs no restart.
+
+For each currency a worker keeps a {product_id: cents} table of the
+prices it has displayed. Tables are keyed by the catalog version and a
+digest of the rates, so a price change (which bumps the version) or a new
+rates file simply starts a new table. A product is converted the first
+time it is shown and looked up after that; nothing ever converts (or
+loads) the whole catalog inside a request.
+
+The table is for display only. The cached version can be up to
+CATALOG_VERSION_CACHE_TIMEOUT stale, so the cart and checkout convert the
+price_cents they have just loaded instead (convert_to).
+
+The visitor's choice lives in a cookie, not the session, so it doesn't
+create sessions. A request carrying it is not shared-cacheable (see
+main/edge_cache.py).
+"""
+import hashlib
+import json
+import os
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+from .catalog import catalog_version
+from .money import convert
+
+# (file stamp, {code: rate against the base currency}, digest)
+_rates = (None, None, None)
+# currency -> ((catalog version, rates digest), table), the current table of this process
+_tables = {}
+
+
+def base_currency():
+    return settings.STRIPE_CURRENCY.lower()
+
+
+def _read_rates(path, base):
+    with open(path, encoding="utf-8") as fh:
+        data = json.load(fh)
+    rates = {code.lower(): Decimal(str(rate)) for code, rate in data.get("rates", {}).items()}
+    rates[data.get("base", base).lower()] = Decimal(1)
+    if base not in rates:
+        raise ImproperlyConfigured(f"{path} has no rate for the base currency {base!r}.")
+    # The file may quote against another currency; rebase on ours.
+    pivot = rates[base]
+    return {code: rate / pivot for code, rate in rates.items()}
+
+
+def _load():
+    global _rates
+    path = settings.CURRENCY_RATES_FILE
+    base = base_currency()
+    try:
+        stamp = (str(path), os.stat(path).st_mtime_ns, base)
+    except OSError:
+        stamp = (None, None, base)
+    if _rates[0] != stamp:
+        rates = _read_rates(path, base) if stamp[0] else {base: Decimal(1)}
+        digest = hashlib.md5(json.dumps(sorted((c, str(r)) for c, r in rates.items())).encode()).hexdigest()
+        _rates = (stamp, rates, digest[:12])
+    return _rates
+
+
+def rates():
+    """{currency code: rate against the base currency}, base included."""
+    return _load()[1]
+
+
+def rates_digest():
+    """Changes whenever the rates do; part of price cache keys and ETags."""
+    return _load()[2]
+
+
+def currencies():
+    """Selectable currency codes, base first."""
+    base = base_currency()
+    return [base] + sorted(code for code in rates() if code != base)
+
+
+def normalize(code):
+    """A known currency code, or the base currency."""
+    code = (code or "").lower()
+    return code if code in rates() else base_currency()
+
+
+def get_currency(request):
+    """The visitor's display currency (remembered on the request)."""
+    currency = getattr(request, "display_currency", None)
+    if currency is None:
+        currency = normalize(request.COOKIES.get(settings.CURRENCY_COOKIE_NAME))
+        request.display_currency = currency
+    return currency
+
+
+def convert_to(cents, currency):
+    """Base-currency cents -> cents in ``currency``."""
+    return convert(cents, rates()[currency])
+
+
+def price_table(currency):
+    """This worker's {product_id: price in ``currency`` cents} for the current catalog."""
+    key = (catalog_version(), rates_digest())
+    memo = _tables.get(currency)
+    if memo is None or memo[0] != key:
+        memo = _tables[currency] = (key, {})
+    return memo[1]
+
+
+def price_of(product, currency):
+    """``product``'s display price in ``currency`` cents, from the table."""
+    table = price_table(currency)
+    cents = table.get(product.pk)
+    if cents is None:
+        cents = table[product.pk] = convert_to(product.price_cents, currency)
+    return cents
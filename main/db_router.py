@@ -0,0 +1,142 @@
+"""
+Read-replica routing for catalog and order-history reads.
+
+Only active when REPLICA_DATABASE_URL is set (see settings). Reads of
+REPLICA_MODELS go to the replica when all of these hold:
+
+- the request is a GET/HEAD passing through ReplicaMiddleware (management
+  commands, POSTs and background work always use the primary);
+- the visitor hasn't written replicated data in the last
+  REPLICA_STICKY_SECONDS (read-your-writes: the order they just placed
+  shows up in their purchase history) and nothing in this request has;
+- no transaction is open on the primary;
+- the replica answers and lags no more than REPLICA_MAX_LAG seconds;
+- for catalog models, the catalog hasn't changed within REPLICA_MAX_LAG, so a
+  page is never cached under a new catalog version with old content.
+"""
+import threading
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from django.utils import timezone
+
+REPLICA = "replica"
+STICKY_COOKIE = "db_primary"
+
+CATALOG_MODELS = {"main.product", "main.productrecommendation"}
+REPLICA_MODELS = CATALOG_MODELS | {
+    "main.order",
+    "main.orderitem",
+    "main.dailysales",
+    "main.dailyproductsales",
+    "main.dailycouponsales",
+}
+
+# Re-measure the replica's lag at most this often per process.
+LAG_CHECK_INTERVAL = 5
+
+_use_replica = ContextVar("use_replica", default=False)
+_wrote = ContextVar("wrote_replicated_data", default=False)
+
+_lag_lock = threading.Lock()
+_lag_state = {"checked": float("-inf"), "lag": None}
+
+POSTGRES_LAG_SQL = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+"""
+
+
+def _measure_lag():
+    """Replica lag in seconds, or None if the replica can't be reached."""
+    connection = connections[REPLICA]
+    try:
+        with connection.cursor() as cursor:
+            if connection.vendor == "postgresql":
+                cursor.execute(POSTGRES_LAG_SQL)
+                return float(cursor.fetchone()[0])
+            # Other backends (the local SQLite stand-in) don't replicate.
+            cursor.execute("SELECT 1")
+            return 0.0
+    except DatabaseError:
+        connection.close()
+        return None
+
+
+def replica_lag():
+    now = time.monotonic()
+    with _lag_lock:
+        if now - _lag_state["checked"] >= LAG_CHECK_INTERVAL:
+            _lag_state["lag"] = _measure_lag()
+            _lag_state["checked"] = now
+        return _lag_state["lag"]
+
+
+def replica_is_usable():
+    lag = replica_lag()
+    return lag is not None and lag <= settings.REPLICA_MAX_LAG
+
+
+def _catalog_settled():
+    from .catalog import catalog_last_modified
+
+    age = (timezone.now() - catalog_last_modified()).total_seconds()
+    return age > settings.REPLICA_MAX_LAG
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        label = model._meta.label_lower
+        if label not in REPLICA_MODELS or not _use_replica.get() or _wrote.get():
+            return None
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return None
+        if not replica_is_usable():
+            return None
+        if label in CATALOG_MODELS and not _catalog_settled():
+            return None
+        return REPLICA
+
+    def db_for_write(self, model, **hints):
+        if model._meta.label_lower in REPLICA_MODELS:
+            _wrote.set(True)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases hold the same data.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # The replica gets its schema (and data) from the primary.
+        return False if db == REPLICA else None
+
+
+class ReplicaMiddleware:
+    """Lets safe requests read from the replica and pins writers to the primary."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        pinned = request.COOKIES.get(STICKY_COOKIE) == "1"
+        use_token = _use_replica.set(request.method in ("GET", "HEAD") and not pinned)
+        wrote_token = _wrote.set(False)
+        try:
+            response = self.get_response(request)
+            if _wrote.get():
+                response.set_cookie(
+                    STICKY_COOKIE, "1",
+                    max_age=int(settings.REPLICA_STICKY_SECONDS),
+                    secure=request.is_secure(),
+                    httponly=True,
+                    samesite="Lax",
+                )
+            return response
+        finally:
+            _use_replica.reset(use_token)
+            _wrote.reset(wrote_token)
@@ -0,0 +1,62 @@
+"""
+Connection metrics for the DB_POOL modes (see settings.DATABASES).
+
+Counts are per process: gunicorn logs them with its per-worker stats and
+``manage.py db_pool_stats`` prints them after a load run.
+"""
+import threading
+import time
+
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+_lock = threading.Lock()
+_opened = {}
+
+
+def _count_connection(sender, connection, **kwargs):
+    with _lock:
+        _opened[connection.alias] = _opened.get(connection.alias, 0) + 1
+
+
+connection_created.connect(_count_connection, dispatch_uid="main.dbpool.count_connection")
+
+
+def connections_opened(alias="default"):
+    """
+    How many times this process connected to ``alias``; in "pool" mode each
+    checkout from the pool counts, so compare it with the pool's own
+    connections_num.
+    """
+    return _opened.get(alias, 0)
+
+
+def pool_stats(alias="default"):
+    """
+    A flat dict of connection metrics for ``alias``.
+
+    In "pool" mode this includes psycopg_pool's own counters (pool_size,
+    pool_available, requests_waiting, requests_wait_ms, connections_lost,
+    ...); otherwise only what is tracked here.
+    """
+    connection = connections[alias]
+    stats = {
+        "vendor": connection.vendor,
+        "conn_max_age": connection.settings_dict["CONN_MAX_AGE"],
+        "health_checks": connection.settings_dict["CONN_HEALTH_CHECKS"],
+        "server_side_cursors": not connection.settings_dict.get("DISABLE_SERVER_SIDE_CURSORS", False),
+        "connections_opened": connections_opened(alias),
+    }
+    pool = getattr(connection, "pool", None)
+    if pool is not None:
+        stats.update(pool.get_stats())
+    return stats
+
+
+def check_connection(alias="default"):
+    """Round-trip a trivial query; returns the latency in ms."""
+    start = time.perf_counter()
+    with connections[alias].cursor() as cursor:
+        cursor.execute("SELECT 1")
+        cursor.fetchone()
+    return (time.perf_counter() - start) * 1000
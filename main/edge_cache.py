@@ -0,0 +1,52 @@
+"""
+Shared (CDN/front cache) caching of catalog pages for anonymous visitors.
+
+A request with no session or messages cookie is rendered without touching
+the session, CSRF token or message storage, so the HTML is identical for
+every such visitor. The response is then marked ``public`` with an
+``s-maxage``. main.js fills in the CSRF token and cart badge from
+``/session-state/``.
+
+The front cache must pass requests that carry a session, messages or
+currency cookie straight to the app (bypass rule on those cookie names).
+Those visitors get the normal private, per-user page.
+"""
+from functools import wraps
+
+from django.conf import settings
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.utils.cache import patch_cache_control
+
+
+def is_anonymous_cacheable(request):
+    cacheable = getattr(request, "anonymous_cacheable", None)
+    if cacheable is None:
+        cacheable = (
+            request.method in ("GET", "HEAD")
+            and settings.SESSION_COOKIE_NAME not in request.COOKIES
+            and CookieStorage.cookie_name not in request.COOKIES
+            and settings.CURRENCY_COOKIE_NAME not in request.COOKIES
+        )
+        request.anonymous_cacheable = cacheable
+    return cacheable
+
+
+def anonymous_cache_page(view_func):
+    """Mark the response shared-cacheable for anonymous visitors, private otherwise."""
+
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        cacheable = is_anonymous_cacheable(request)
+        response = view_func(request, *args, **kwargs)
+        if cacheable and response.status_code in (200, 304) and not response.cookies:
+            patch_cache_control(
+                response,
+                public=True,
+                max_age=0,
+                s_maxage=settings.ANONYMOUS_CACHE_SECONDS,
+            )
+        else:
+            patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+    return wrapper
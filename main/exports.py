@@ -0,0 +1,131 @@
+import csv
+import json
+
+from .currency import base_currency
+from .models import Order, OrderItem
+from .money import format_money
+
+
+# Columns written for every exported line; amounts as decimals ('12.50') in the base currency,
+# with the currency the customer paid in and its rate against the base. One row per OrderItem;
+# orders without product lines (gift certificate only) still get a single row.
+ORDER_FIELDS = (
+    "id", "date", "user__username", "user__email", "total_cents",
+    "discount_cents", "coupon__code", "gift_cents", "gift_recipient", "gift_code",
+    "currency", "exchange_rate",
+)
+ITEM_FIELDS = ("order_id", "product_id", "product__name", "quantity", "price_cents")
+
+CSV_HEADER = [
+    "order_id", "date", "username", "email", "order_total",
+    "discount_amount", "coupon", "gift_amount", "gift_recipient", "gift_code",
+    "currency", "exchange_rate",
+    "product_id", "product_name", "quantity", "unit_price", "line_total",
+]
+
+DEFAULT_CHUNK_SIZE = 2000
+
+
+class Echo:
+    """File-like object that hands back what is written (for csv.writer)."""
+
+    def write(self, value):
+        return value
+
+
+def iter_orders_with_items(queryset=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Yield (order_tuple, [item_tuples]) pairs without building model instances.
+
+    Orders are read in keyset pages (``id > last id``) and the lines for each
+    page are fetched with one extra query, so memory stays flat no matter
+    how many orders are exported. Unlike a server-side cursor this holds no
+    transaction open between pages, so it also works behind PgBouncer in
+    transaction mode.
+    """
+    if queryset is None:
+        queryset = Order.objects.all()
+    rows = queryset.order_by("id").values_list(*ORDER_FIELDS)
+    last_id = None
+    while True:
+        page = rows if last_id is None else rows.filter(id__gt=last_id)
+        chunk = list(page[:chunk_size])
+        if not chunk:
+            return
+        last_id = chunk[-1][0]
+        items = {}
+        item_rows = (
+            OrderItem.objects.filter(order_id__in=[row[0] for row in chunk])
+            .order_by("order_id", "id")
+            .values_list(*ITEM_FIELDS)
+        )
+        for item in item_rows:
+            items.setdefault(item[0], []).append(item)
+        for row in chunk:
+            yield row, items.get(row[0], [])
+
+
+def _order_columns(order):
+    (order_id, date, username, email, total,
+     discount, coupon, gift_amount, gift_recipient, gift_code, currency, rate) = order
+    return [
+        order_id, date.isoformat() if date else "", username, email, format_money(total),
+        format_money(discount), coupon or "", format_money(gift_amount), gift_recipient, gift_code,
+        currency or base_currency(), str(rate),
+    ]
+
+
+def iter_csv_rows(queryset=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    yield CSV_HEADER
+    for order, items in iter_orders_with_items(queryset, chunk_size):
+        columns = _order_columns(order)
+        if not items:
+            yield columns + ["", "", "", "", ""]
+            continue
+        for _, product_id, product_name, quantity, price in items:
+            yield columns + [
+                product_id, product_name, quantity, format_money(price), format_money(price * quantity),
+            ]
+
+
+def iter_csv_lines(queryset=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    writer = csv.writer(Echo())
+    for row in iter_csv_rows(queryset, chunk_size):
+        yield writer.writerow(row)
+
+
+def iter_jsonl_lines(queryset=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    for order, items in iter_orders_with_items(queryset, chunk_size):
+        (order_id, date, username, email, total,
+         discount, coupon, gift_amount, gift_recipient, gift_code, currency, rate) = order
+        record = {
+            "order_id": order_id,
+            "date": date.isoformat() if date else None,
+            "username": username,
+            "email": email,
+            "total": format_money(total),
+            "discount_amount": format_money(discount),
+            "coupon": coupon,
+            "gift_amount": format_money(gift_amount),
+            "gift_recipient": gift_recipient,
+            "gift_code": gift_code,
+            "currency": currency or base_currency(),
+            "exchange_rate": str(rate),
+            "items": [
+                {
+                    "product_id": product_id,
+                    "product_name": product_name,
+                    "quantity": quantity,
+                    "unit_price": format_money(price),
+                    "line_total": format_money(price * quantity),
+                }
+                for _, product_id, product_name, quantity, price in items
+            ],
+        }
+        yield json.dumps(record, ensure_ascii=False) + "\n"
+
+
+EXPORT_FORMATS = {
+    "csv": (iter_csv_lines, "text/csv; charset=utf-8"),
+    "jsonl": (iter_jsonl_lines, "application/x-ndjson; charset=utf-8"),
+}
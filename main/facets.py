@@ -0,0 +1,128 @@
+"""
+Faceted browsing of the catalog: search, category, price bucket and sort.
+
+Every filter/sort combination maps onto one of the Product indexes
+(category, then the sort column, then id), and a price bucket is a range
+on price_cents. Facet counts, i.e. how many products each category and
+price bucket would show, come from one aggregate query with a filtered
+COUNT per option. They are cached per catalog version and filter
+combination, and the total doubles as the paginator's count.
+
+Each facet is counted with the other facets applied but not itself, so
+after picking a category the other categories still show their counts.
+"""
+import hashlib
+
+from django.core.cache import cache
+from django.db.models import Count, Q
+
+from .catalog import catalog_version
+from .models import Category, Product
+
+# (key, low, high) in base-currency cents; high is exclusive, None = open.
+PRICE_BUCKETS = (
+    ("0-200", 0, 200),
+    ("200-300", 200, 300),
+    ("300-500", 300, 500),
+    ("500-", 500, None),
+)
+_BUCKETS = {key: (low, high) for key, low, high in PRICE_BUCKETS}
+
+SORTS = {
+    "name": ("Name", ("name", "id")),
+    "price": ("Price: low to high", ("price_cents", "id")),
+    "-price": ("Price: high to low", ("-price_cents", "-id")),
+    "newest": ("Newest", ("-created_at", "-id")),
+}
+DEFAULT_SORT = "name"
+
+FACET_CACHE_TIMEOUT = 60 * 60
+
+
+def categories():
+    """All categories in display order, cached per catalog version."""
+    key = f"catalog:categories:{catalog_version()}"
+    result = cache.get(key)
+    if result is None:
+        result = list(Category.objects.all())
+        cache.set(key, result, FACET_CACHE_TIMEOUT)
+    return result
+
+
+def parse(params):
+    """The filters in a query dict; unknown values fall back to 'any'."""
+    slugs = {category.slug: category for category in categories()}
+    price = params.get("price", "")
+    sort = params.get("sort", "")
+    return {
+        "q": params.get("q", "").strip(),
+        "category": slugs.get(params.get("category", "")),
+        "price": price if price in _BUCKETS else "",
+        "sort": sort if sort in SORTS else DEFAULT_SORT,
+    }
+
+
+def _search_q(filters):
+    return Q(name__icontains=filters["q"]) if filters["q"] else Q()
+
+
+def _category_q(filters):
+    return Q(category=filters["category"]) if filters["category"] else Q()
+
+
+def _price_q(key):
+    if not key:
+        return Q()
+    low, high = _BUCKETS[key]
+    q = Q(price_cents__gte=low)
+    if high is not None:
+        q &= Q(price_cents__lt=high)
+    return q
+
+
+def filtered_products(filters):
+    return (
+        Product.objects.filter(_search_q(filters), _category_q(filters), _price_q(filters["price"]))
+        .order_by(*SORTS[filters["sort"]][1])
+    )
+
+
+def _count(q):
+    return Count("id", filter=q) if q else Count("id")
+
+
+def facet_counts(filters):
+    """
+    {'total': n, 'any_category': n, 'any_price': n,
+     'categories': {category id: n}, 'prices': {bucket key: n}}
+    """
+    category = filters["category"]
+    parts = [catalog_version(), filters["q"], category.pk if category else None, filters["price"]]
+    key = "catalog:facets:" + hashlib.md5(repr(parts).encode()).hexdigest()
+    counts = cache.get(key)
+    if counts is not None:
+        return counts
+
+    all_categories = categories()
+    category_q = _category_q(filters)
+    price_q = _price_q(filters["price"])
+    aggregates = {
+        "total": _count(category_q & price_q),
+        "any_category": _count(price_q),
+        "any_price": _count(category_q),
+    }
+    for c in all_categories:
+        aggregates[f"category_{c.pk}"] = _count(Q(category_id=c.pk) & price_q)
+    for i, (bucket, _, _) in enumerate(PRICE_BUCKETS):
+        aggregates[f"price_{i}"] = _count(_price_q(bucket) & category_q)
+    row = Product.objects.filter(_search_q(filters)).aggregate(**aggregates)
+
+    counts = {
+        "total": row["total"],
+        "any_category": row["any_category"],
+        "any_price": row["any_price"],
+        "categories": {c.pk: row[f"category_{c.pk}"] for c in all_categories},
+        "prices": {bucket: row[f"price_{i}"] for i, (bucket, _, _) in enumerate(PRICE_BUCKETS)},
+    }
+    cache.set(key, counts, FACET_CACHE_TIMEOUT)
+    return counts
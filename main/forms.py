@@ -2,6 +2,9 @@ from django import forms
 from django.contrib.auth.models import User
 from django.contrib.auth.forms import UserCreationForm
 
+from .money import MoneyFormField, to_cents
+from .pricing import MAX_PERCENT, MODES, ROUNDINGS, PriceAdjustment
+
 # --- Registration Form ---
 class RegistrationForm(UserCreationForm):
     """
@@ -73,3 +76,98 @@ class RegistrationForm(UserCreationForm):
         if commit:
             user.save()
         return user
+
+
+# --- Review Form ---
+class ReviewForm(forms.Form):
+    rating = forms.TypedChoiceField(
+        choices=[(n, "★" * n) for n in range(5, 0, -1)],
+        coerce=int,
+    )
+    body = forms.CharField(
+        required=False,
+        max_length=2000,
+        widget=forms.Textarea(attrs={
+            'rows': 4,
+            'placeholder': 'What did you think?',
+            'class': 'form-input rounded-md border-gray-300',
+        })
+    )
+
+
+# --- Bulk price changes (admin, see pricing.py) ---
+class PriceRoundingForm(forms.Form):
+    rounding = forms.ChoiceField(choices=ROUNDINGS, required=False)
+    rounding_amount = MoneyFormField(
+        required=False,
+        min_value=0,
+        help_text="The multiple (1.00 for whole units, 0.50 …) or, for “ending in”, the cents (0.95, 0.99).",
+    )
+
+    def clean(self):
+        cleaned = super().clean()
+        rounding = cleaned.get("rounding")
+        amount = cleaned.get("rounding_amount")
+        if rounding == "ending" and (amount is None or amount >= 100):
+            self.add_error("rounding_amount", "Give the ending as cents below 1.00, e.g. 0.95.")
+        elif rounding and rounding != "ending" and not amount:
+            self.add_error("rounding_amount", "Give the multiple to round to, e.g. 1.00.")
+        return cleaned
+
+    def rounding_rule(self):
+        return self.cleaned_data["rounding"], self.cleaned_data["rounding_amount"] or 0
+
+
+class PriceAdjustmentForm(PriceRoundingForm):
+    mode = forms.ChoiceField(choices=MODES)
+    value = forms.DecimalField(
+        max_digits=10,
+        decimal_places=2,
+        help_text="A percent (10, -12.5) or an amount (5.00, -2.50); for “set”, the new price.",
+    )
+    field_order = ["mode", "value", "rounding", "rounding_amount"]
+
+    def clean(self):
+        cleaned = super().clean()
+        mode = cleaned.get("mode")
+        value = cleaned.get("value")
+        if value is not None:
+            if mode == "percent" and not -100 < value <= MAX_PERCENT:
+                self.add_error("value", f"The percent must be above -100 and at most {MAX_PERCENT}.")
+            elif mode == "set" and value < 0:
+                self.add_error("value", "A price can't be negative.")
+        return cleaned
+
+    def adjustment(self):
+        # to_cents also turns a percent into basis points (12.5 -> 1250).
+        return PriceAdjustment(self.cleaned_data["mode"], to_cents(self.cleaned_data["value"]), *self.rounding_rule())
+
+
+class PriceImportForm(PriceRoundingForm):
+    file = forms.FileField(
+        help_text="CSV with an id column and, per row, one of price, percent or amount.",
+    )
+    dry_run = forms.BooleanField(
+        required=False,
+        initial=True,
+        help_text="Only show what would change.",
+    )
+    field_order = ["file", "rounding", "rounding_amount", "dry_run"]
+
+
+class RestockForm(forms.Form):
+    quantity = forms.IntegerField(
+        help_text="Added to the current stock; negative to write stock off (never below zero).",
+    )
+    track = forms.BooleanField(
+        required=False,
+        label="Start tracking",
+        help_text="Products without stock tracking start at this quantity.",
+    )
+
+    def clean_quantity(self):
+        quantity = self.cleaned_data["quantity"]
+        if not quantity:
+            raise forms.ValidationError("Give a quantity other than 0.")
+        return quantity
+
@@ -0,0 +1,209 @@
+"""
+Stock tracking for limited products.
+
+Stock is taken with a conditional UPDATE (``WHERE stock >= qty``) when a
+Stripe checkout starts, so concurrent buyers never oversell and never wait
+on a read-check-write round trip. The taken stock is recorded as a
+StockReservation: confirmed (deleted) when the order is saved or Stripe
+reports the session paid, or given back when the checkout is canceled or
+expires.
+
+A reservation past its expiry is not simply given back: the buyer may
+have paid and never come back to the success page. The sweeper asks
+Stripe about the checkout session first and only returns the stock of
+sessions that can no longer be paid.
+"""
+import uuid
+from collections import Counter
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .catalog import bump_listing_version
+from .models import Product, StockReservation
+from .payments import checkout_status
+
+# Stripe checkout sessions live at least 30 minutes; keep stock a little
+# longer so a payment that completes at the last second still has it.
+CHECKOUT_TTL = timedelta(minutes=30)
+RESERVATION_GRACE = timedelta(minutes=10)
+# Sessions Stripe still reports open (or couldn't be asked about) are
+# looked at again after this long.
+RECHECK_DELAY = timedelta(minutes=10)
+
+
+class OutOfStock(Exception):
+    def __init__(self, product_id):
+        super().__init__(f"Product {product_id} is out of stock")
+        self.product_id = product_id
+
+
+def reserve(lines, now=None):
+    """
+    Take stock for ``lines`` ([(product_id, quantity)]) all-or-nothing.
+
+    Returns the reservation token (None if nothing is stock-tracked).
+    Raises OutOfStock, leaving stock untouched, if any line can't be met.
+    """
+    wanted = Counter()
+    for product_id, quantity in lines:
+        wanted[int(product_id)] += int(quantity)
+
+    tracked = set(
+        Product.objects.filter(pk__in=wanted, stock__isnull=False).values_list("pk", flat=True)
+    )
+    if not tracked:
+        return None
+
+    now = now or timezone.now()
+    token = uuid.uuid4()
+    with transaction.atomic():
+        # Fixed order so two carts with the same products can't deadlock.
+        for product_id in sorted(tracked):
+            taken = Product.objects.filter(pk=product_id, stock__gte=wanted[product_id]).update(
+                stock=F("stock") - wanted[product_id]
+            )
+            if not taken:
+                raise OutOfStock(product_id)
+        StockReservation.objects.bulk_create([
+            StockReservation(
+                token=token,
+                product_id=product_id,
+                quantity=wanted[product_id],
+                expires_at=now + CHECKOUT_TTL + RESERVATION_GRACE,
+            )
+            for product_id in sorted(tracked)
+        ])
+        # Listings show "Sold out", so only that transition invalidates them.
+        if Product.objects.filter(pk__in=tracked, stock=0).exists():
+            bump_listing_version()
+    return token
+
+
+def _give_back(reservations):
+    returned = Counter()
+    for product_id, quantity in reservations:
+        returned[product_id] += quantity
+    if Product.objects.filter(pk__in=returned, stock=0).exists():
+        bump_listing_version()
+    for product_id in sorted(returned):
+        Product.objects.filter(pk=product_id, stock__isnull=False).update(
+            stock=F("stock") + returned[product_id]
+        )
+
+
+def restock(product_ids, quantity, track=False):
+    """
+    Add ``quantity`` to the stock of ``product_ids`` in one UPDATE, relative
+    to whatever is there now, so concurrent reservations are kept. A
+    negative quantity writes stock off, but never below zero; those
+    products are left as they are. With ``track``, products that aren't
+    stock-tracked yet start at ``quantity``. Returns how many changed.
+    """
+    products = Product.objects.filter(pk__in=product_ids)
+    with transaction.atomic():
+        was_sold_out = products.filter(stock=0).exists()
+        changed = products.filter(stock__gte=max(-quantity, 0)).update(stock=F("stock") + quantity)
+        if track and quantity >= 0:
+            changed += products.filter(stock__isnull=True).update(stock=quantity)
+        if changed and (was_sold_out or products.filter(stock=0).exists()):
+            bump_listing_version()
+    return changed
+
+
+def attach_session(token, session_id):
+    """Record the Stripe checkout session that ``token`` holds stock for."""
+    if token:
+        StockReservation.objects.filter(token=token).update(stripe_session_id=session_id)
+
+
+def _release_rows(rows):
+    """Give back and delete (id, product_id, quantity) rows the caller has locked."""
+    _give_back((product_id, quantity) for _, product_id, quantity in rows)
+    StockReservation.objects.filter(id__in=[row[0] for row in rows]).delete()
+
+
+def release(token):
+    """Give the stock held by ``token`` back (checkout canceled)."""
+    if not token:
+        return
+    with transaction.atomic():
+        _release_rows(list(
+            StockReservation.objects.select_for_update()
+            .filter(token=token)
+            .values_list("id", "product_id", "quantity")
+        ))
+
+
+def confirm(token):
+    """The order was paid for: the stock stays taken, drop the reservation."""
+    if token:
+        StockReservation.objects.filter(token=token).delete()
+
+
+def confirm_session(session_id):
+    """Stripe reports the session paid (webhook): the stock stays taken."""
+    if session_id:
+        StockReservation.objects.filter(stripe_session_id=session_id).delete()
+
+
+def release_session(session_id):
+    """Stripe reports the session expired (webhook): give its stock back."""
+    if not session_id:
+        return
+    with transaction.atomic():
+        _release_rows(list(
+            StockReservation.objects.select_for_update()
+            .filter(stripe_session_id=session_id)
+            .values_list("id", "product_id", "quantity")
+        ))
+
+
+def release_expired_batch(batch_size=500, now=None):
+    """
+    Settle up to ``batch_size`` reservations past their expiry (oldest
+    first). Returns rows settled; 0 once none are left.
+
+    Each checkout session is looked up at Stripe, outside the transaction:
+    paid ones are confirmed, ones that can no longer be paid (or never got
+    a session) are given back, and open ones are looked at again after
+    RECHECK_DELAY. Locked rows are skipped so the sweeper never waits on a
+    checkout that is confirming or releasing at the same moment.
+    """
+    now = now or timezone.now()
+    due = list(
+        StockReservation.objects.filter(expires_at__lt=now)
+        .order_by("expires_at")
+        .values_list("token", "stripe_session_id")[:batch_size]
+    )
+    status = {}
+    for token, session_id in due:
+        if token not in status:
+            status[token] = checkout_status(session_id) if session_id else "expired"
+
+    with transaction.atomic():
+        rows = list(
+            StockReservation.objects.select_for_update(skip_locked=True)
+            .filter(token__in=status, expires_at__lt=now)
+            .values_list("id", "token", "product_id", "quantity")
+        )
+        by_status = {"paid": [], "expired": [], "open": []}
+        for pk, token, product_id, quantity in rows:
+            by_status[status[token]].append((pk, product_id, quantity))
+        _release_rows(by_status["expired"])
+        StockReservation.objects.filter(id__in=[row[0] for row in by_status["paid"]]).delete()
+        StockReservation.objects.filter(id__in=[row[0] for row in by_status["open"]]).update(
+            expires_at=now + RECHECK_DELAY
+        )
+    return len(rows)
+
+
+def release_expired(batch_size=500, now=None):
+    """Settle every expired reservation in batches. Returns rows settled."""
+    now = now or timezone.now()
+    released = 0
+    while count := release_expired_batch(batch_size, now):
+        released += count
+    return released
@@ -0,0 +1,159 @@
+"""
+Batched cleanup of data that only grows: expired sessions, idle carts,
+old contact messages and expired stock reservations.
+
+Every task walks an index (expire_date, updated_at, created_at,
+expires_at) in small batches and deletes by primary key, one short
+transaction per batch, so only the rows being deleted are ever locked.
+All tasks share the run's Throttle (pause between batches, time budget).
+On Postgres each batch also sets a lock_timeout: a batch that would queue
+behind a busy row gives up instead of holding up checkout, and that task
+waits for the next run.
+"""
+import gzip
+import json
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.contrib.sessions.models import Session
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from home.models import Message
+
+from .inventory import release_expired_batch
+from .models import Cart, CartItem, StockReservation
+
+DEFAULT_BATCH_SIZE = 1000
+LOCK_TIMEOUT = "2s"
+
+# Logged-in carts nobody has touched for this long are dropped; anonymous
+# carts live in the session and go with it.
+CART_RETENTION = timedelta(days=60)
+# Contact messages are archived to storage, then deleted, this long after
+# they came in once they have been read; unread ones only when they expire.
+MESSAGE_RETENTION = timedelta(days=365)
+UNREAD_MESSAGE_EXPIRY = timedelta(days=3 * 365)
+MESSAGE_ARCHIVE_DIR = "archive/messages"
+
+
+class Throttle:
+    """Batch pacing shared by all tasks of one run."""
+
+    def __init__(self, sleep=0.0, max_seconds=None):
+        self.sleep = sleep
+        self.deadline = time.monotonic() + max_seconds if max_seconds else None
+
+    def expired(self):
+        return self.deadline is not None and time.monotonic() >= self.deadline
+
+    def pause(self):
+        if self.sleep:
+            time.sleep(self.sleep)
+
+
+@contextmanager
+def _batch_transaction():
+    with transaction.atomic():
+        if connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                cursor.execute(f"SET LOCAL lock_timeout = '{LOCK_TIMEOUT}'")
+        yield
+
+
+def _paced(run_batch, throttle):
+    """Call ``run_batch`` (one transaction each) until it returns 0 or the time budget is spent."""
+    while not throttle.expired():
+        with _batch_transaction():
+            count = run_batch()
+        if not count:
+            return
+        yield count
+        throttle.pause()
+
+
+def run_batches(queryset, delete_batch, batch_size, throttle):
+    """
+    Hand primary keys from ``queryset`` (ordered along an index) to
+    ``delete_batch`` until nothing matches or the time budget is spent.
+    Yields the number of rows per batch; a batch that hits the lock
+    timeout is rolled back and raises OperationalError.
+    """
+
+    def batch():
+        ids = list(queryset.values_list("pk", flat=True)[:batch_size])
+        if ids:
+            delete_batch(ids)
+        return len(ids)
+
+    return _paced(batch, throttle)
+
+
+# --- what each task removes: (rows due at ``now`` in index order, delete) ---
+def _delete_sessions(keys):
+    Session.objects.filter(session_key__in=keys).delete()
+
+
+def _delete_carts(ids):
+    CartItem.objects.filter(cart_id__in=ids).delete()
+    Cart.objects.filter(id__in=ids).delete()
+
+
+def _archive_messages(ids):
+    rows = list(Message.objects.filter(id__in=ids).order_by("id").values())
+    if not rows:
+        # Deleted by someone else since the batch was picked.
+        return
+    archived = [row["id"] for row in rows]
+    lines = "".join(json.dumps(row, cls=DjangoJSONEncoder) + "\n" for row in rows)
+    # One file per batch, written before the rows go: a failed save rolls
+    # the batch back instead of losing messages.
+    name = f"{MESSAGE_ARCHIVE_DIR}/messages-{min(archived)}-{max(archived)}.jsonl.gz"
+    default_storage.save(name, ContentFile(gzip.compress(lines.encode())))
+    Message.objects.filter(id__in=archived).delete()
+
+
+TASKS = {
+    # What `clearsessions` does, minus the single unbounded DELETE.
+    "sessions": (
+        lambda now: Session.objects.filter(expire_date__lt=now).order_by("expire_date"),
+        _delete_sessions,
+    ),
+    "carts": (
+        lambda now: Cart.objects.filter(updated_at__lt=now - CART_RETENTION).order_by("updated_at"),
+        _delete_carts,
+    ),
+    "messages": (
+        lambda now: Message.objects.filter(
+            Q(is_read=True, created_at__lt=now - MESSAGE_RETENTION) | Q(created_at__lt=now - UNREAD_MESSAGE_EXPIRY)
+        ).order_by("created_at"),
+        _archive_messages,
+    ),
+    "reservations": (
+        lambda now: StockReservation.objects.filter(expires_at__lt=now).order_by("expires_at"),
+        None,
+    ),
+}
+
+
+def pending(name, now=None):
+    """How many rows task ``name`` would remove right now."""
+    due, _ = TASKS[name]
+    return due(now or timezone.now()).count()
+
+
+def run_task(name, now, batch_size, throttle):
+    """Yield the number of rows removed per batch by task ``name``."""
+    due, delete_batch = TASKS[name]
+    if delete_batch is None:
+        # Stock has to go back too, and only once Stripe says the checkout
+        # can't be paid any more; release_expired_batch picks (and skips
+        # rows a checkout holds) on its own.
+        yield from _paced(lambda: release_expired_batch(batch_size, now), throttle)
+        return
+    yield from run_batches(due(now), delete_batch, batch_size, throttle)
@@ -0,0 +1,130 @@
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Environment overrides understood by gunicorn.conf.py
+PROFILES = {
+    "sync": {"GUNICORN_WORKER_CLASS": "sync", "GUNICORN_THREADS": "1", "GUNICORN_PRELOAD": "false"},
+    "sync-preload": {"GUNICORN_WORKER_CLASS": "sync", "GUNICORN_THREADS": "1", "GUNICORN_PRELOAD": "true"},
+    "gthread": {"GUNICORN_WORKER_CLASS": "gthread", "GUNICORN_THREADS": "4", "GUNICORN_PRELOAD": "false"},
+    "gthread-preload": {"GUNICORN_WORKER_CLASS": "gthread", "GUNICORN_THREADS": "4", "GUNICORN_PRELOAD": "true"},
+}
+
+DEFAULT_PATHS = ["/", "/products/", "/products/feed.json", "/about/", "/cart/", "/account/"]
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _fetch(url):
+    # Pretend to be behind the Heroku router so SECURE_SSL_REDIRECT doesn't kick in.
+    request = urllib.request.Request(url, headers={"X-Forwarded-Proto": "https"})
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=30) as response:
+            response.read()
+            ok = response.status < 400
+    except urllib.error.HTTPError as e:
+        ok = e.code < 400
+    except OSError:
+        ok = False
+    return time.perf_counter() - start, ok
+
+
+def load_test(base_url, paths, total, concurrency):
+    urls = [base_url + paths[i % len(paths)] for i in range(total)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(_fetch, urls))
+    elapsed = time.perf_counter() - start
+    latencies = sorted(latency for latency, _ in results)
+    return {
+        "rps": total / elapsed,
+        "p50": latencies[len(latencies) // 2] * 1000,
+        "p95": latencies[int(len(latencies) * 0.95) - 1] * 1000,
+        "p99": latencies[int(len(latencies) * 0.99) - 1] * 1000,
+        "errors": sum(1 for _, ok in results if not ok),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Start gunicorn with each worker profile (sync/gthread, with and without "
+        "preload) and load-test the shop's main URLs against it."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--profiles", nargs="+", choices=sorted(PROFILES), default=list(PROFILES))
+        parser.add_argument("--paths", nargs="+", default=DEFAULT_PATHS)
+        parser.add_argument("--requests", type=int, default=2000)
+        parser.add_argument("--concurrency", type=int, default=32)
+        parser.add_argument("--workers", type=int, help="WEB_CONCURRENCY for every profile.")
+        parser.add_argument("--url", help="Load-test an already running server instead of starting gunicorn.")
+
+    def handle(self, *args, **options):
+        if options["url"]:
+            self._report(options["url"], load_test(
+                options["url"].rstrip("/"), options["paths"], options["requests"], options["concurrency"],
+            ))
+            return
+
+        self.stdout.write(f"{'profile':18} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7}")
+        for name in options["profiles"]:
+            result = self._run_profile(name, options)
+            self._report(name, result)
+
+    def _report(self, name, r):
+        self.stdout.write(
+            f"{name:18} {r['rps']:>8.0f} {r['p50']:>8.1f} {r['p95']:>8.1f} {r['p99']:>8.1f} {r['errors']:>7}"
+        )
+
+    def _run_profile(self, name, options):
+        port = _free_port()
+        env = {
+            **os.environ,
+            **PROFILES[name],
+            "PORT": str(port),
+            "GUNICORN_ACCESSLOG": "",
+            "GUNICORN_LOGLEVEL": "warning",
+            "RATELIMIT_ENABLED": "false",
+        }
+        if options["workers"]:
+            env["WEB_CONCURRENCY"] = str(options["workers"])
+        config = settings.BASE_DIR / "gunicorn.conf.py"
+        process = subprocess.Popen(
+            [sys.executable, "-m", "gunicorn", "candy_shop.wsgi", "--config", str(config)],
+            cwd=settings.BASE_DIR,
+            env=env,
+        )
+        base_url = f"http://127.0.0.1:{port}"
+        try:
+            self._wait_until_up(port, process)
+            load_test(base_url, options["paths"], min(200, options["requests"]), options["concurrency"])  # warm up
+            return load_test(base_url, options["paths"], options["requests"], options["concurrency"])
+        finally:
+            process.terminate()
+            process.wait(timeout=30)
+
+    @staticmethod
+    def _wait_until_up(port, process, timeout=30):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise CommandError("gunicorn exited during startup")
+            try:
+                with socket.create_connection(("127.0.0.1", port), 1):
+                    return
+            except OSError:
+                time.sleep(0.1)
+        raise CommandError("gunicorn did not start in time")
@@ -0,0 +1,63 @@
+import random
+import timeit
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.core.management.base import BaseCommand
+
+from main.money import format_money, percent_of
+
+
+def _decimal_cart(prices, quantities, percent):
+    # The old path: Decimal prices, quantize per line, discount in Decimal,
+    # then Decimal(str()) -> cents for Stripe.
+    subtotal = Decimal("0")
+    for price, quantity in zip(prices, quantities):
+        subtotal += (price * quantity).quantize(Decimal("0.01"))
+    discount = (subtotal * percent / 100).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+    total = subtotal - discount
+    cents = int((Decimal(str(total)) * 100).quantize(Decimal("1"), rounding=ROUND_HALF_UP))
+    return cents, str(total)
+
+
+def _cents_cart(prices, quantities, percent):
+    subtotal = 0
+    for price, quantity in zip(prices, quantities):
+        subtotal += price * quantity
+    total = subtotal - percent_of(subtotal, percent)
+    return total, format_money(total)
+
+
+class Command(BaseCommand):
+    help = (
+        "Micro-benchmark of cart totals: the old Decimal arithmetic against "
+        "integer cents. Pure Python, no database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--lines", type=int, default=20, help="Cart lines per total.")
+        parser.add_argument("--number", type=int, default=20000, help="Totals per timing run.")
+        parser.add_argument("--repeat", type=int, default=5)
+
+    def handle(self, *args, **options):
+        rng = random.Random(42)
+        cents = [rng.randrange(50, 5000) for _ in range(options["lines"])]
+        decimals = [Decimal(c) / 100 for c in cents]
+        quantities = [rng.randrange(1, 6) for _ in cents]
+        percent = Decimal("12.5")
+
+        old = _decimal_cart(decimals, quantities, percent)
+        new = _cents_cart(cents, quantities, percent)
+        if old != new:
+            self.stderr.write(self.style.WARNING(f"Results differ: decimal {old}, cents {new}"))
+
+        for label, func, prices in (
+            ("decimal", _decimal_cart, decimals),
+            ("cents", _cents_cart, cents),
+        ):
+            best = min(timeit.repeat(
+                lambda: func(prices, quantities, percent),
+                number=options["number"],
+                repeat=options["repeat"],
+            ))
+            per_total = best / options["number"] * 1e6
+            self.stdout.write(f"{label:>8}: {per_total:7.2f} µs per {options['lines']}-line total")
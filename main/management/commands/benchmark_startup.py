@@ -0,0 +1,73 @@
+import os
+import statistics
+import subprocess
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+# What a gunicorn worker does before it can serve its first request.
+BOOT_SCRIPT = (
+    "import time; t = time.perf_counter(); "
+    "import candy_shop.wsgi; "
+    "from django.urls import get_resolver; get_resolver().url_patterns; "
+    "print(f'BOOT {time.perf_counter() - t:.6f}')"
+)
+
+
+def parse_importtime(stderr):
+    """Yield (module, self_us, cumulative_us) from ``python -X importtime`` output."""
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        yield name.strip(), int(self_us), int(cumulative_us)
+
+
+class Command(BaseCommand):
+    help = "Measure worker cold start: total boot time and import time per module."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repeat", type=int, default=5, help="Boots to time (median is reported).")
+        parser.add_argument("--top", type=int, default=25, help="Slowest packages to list.")
+        parser.add_argument("--budget", type=float, help="Fail if the median boot exceeds this many seconds.")
+
+    def _boot(self, importtime=False):
+        cmd = [sys.executable]
+        if importtime:
+            cmd += ["-X", "importtime"]
+        cmd += ["-c", BOOT_SCRIPT]
+        env = {**os.environ, "DJANGO_SETTINGS_MODULE": os.environ.get("DJANGO_SETTINGS_MODULE", "candy_shop.settings")}
+        result = subprocess.run(cmd, capture_output=True, text=True, env=env)
+        if result.returncode:
+            raise CommandError(result.stderr.strip().splitlines()[-1])
+        boot = float(result.stdout.split("BOOT ")[-1])
+        return boot, result.stderr
+
+    def handle(self, *args, **options):
+        boots = [self._boot()[0] for _ in range(options["repeat"])]
+        median = statistics.median(boots)
+
+        _, stderr = self._boot(importtime=True)
+        modules = list(parse_importtime(stderr))
+        # Sum each module's own (self) time into its top-level package, so
+        # time is charged to the package that actually spent it.
+        packages = {}
+        counts = {}
+        for name, self_us, _ in modules:
+            root = name.split(".")[0]
+            packages[root] = packages.get(root, 0) + self_us
+            counts[root] = counts.get(root, 0) + 1
+
+        self.stdout.write(f"{'package':32} {'modules':>8} {'import ms':>10}")
+        for name, self_us in sorted(packages.items(), key=lambda kv: -kv[1])[:options["top"]]:
+            self.stdout.write(f"{name:32} {counts[name]:>8} {self_us / 1000:>10.1f}")
+        self.stdout.write(
+            f"\nBoot (wsgi + URLconf): median {median * 1000:.0f} ms over {len(boots)} runs "
+            f"(min {min(boots) * 1000:.0f}, max {max(boots) * 1000:.0f}); "
+            f"{len(modules)} modules imported"
+        )
+        if "stripe" in packages:
+            self.stdout.write(self.style.WARNING("stripe is imported at boot."))
+
+        if options["budget"] is not None and median > options["budget"]:
+            raise CommandError(f"Boot median {median:.3f}s exceeds budget {options['budget']:.3f}s")
@@ -0,0 +1,63 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+
+from main.inventory import OutOfStock, reserve
+from main.models import Product, StockReservation
+
+
+class Command(BaseCommand):
+    help = (
+        "Many parallel buyers race for one limited product. Checks that exactly "
+        "`stock` checkouts succeed and reports throughput. Uses a throwaway product."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--stock", type=int, default=100)
+        parser.add_argument("--buyers", type=int, default=500)
+        parser.add_argument("--workers", type=int, default=16)
+        parser.add_argument("--quantity", type=int, default=1)
+
+    def handle(self, *args, **options):
+        product = Product.objects.create(
+            name="benchmark_stock (temporary)",
+            description="",
+            price_cents=100,
+            stock=options["stock"],
+        )
+        try:
+            sold, failed, elapsed = self._race(product.id, options)
+            product.refresh_from_db()
+        finally:
+            StockReservation.objects.filter(product_id=product.id).delete()
+            Product.objects.filter(pk=product.id).delete()
+
+        expected = min(options["buyers"], options["stock"] // options["quantity"])
+        self.stdout.write(
+            f"{options['buyers']} buyers, {options['workers']} workers, "
+            f"{connection.vendor}: {sold} sold, {failed} out of stock, "
+            f"stock left {product.stock}, {elapsed:.2f}s "
+            f"({options['buyers'] / elapsed:.0f} checkouts/s)"
+        )
+        if sold != expected or product.stock != options["stock"] - sold * options["quantity"]:
+            raise CommandError(f"Oversold or lost stock: expected {expected} sales.")
+        self.stdout.write(self.style.SUCCESS("No oversell."))
+
+    def _race(self, product_id, options):
+        def buy(_):
+            try:
+                reserve([(product_id, options["quantity"])])
+                return True
+            except OutOfStock:
+                return False
+            finally:
+                connections.close_all()
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options["workers"]) as pool:
+            results = list(pool.map(buy, range(options["buyers"])))
+        elapsed = time.perf_counter() - start
+        sold = sum(results)
+        return sold, len(results) - sold, elapsed
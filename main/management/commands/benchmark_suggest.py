@@ -0,0 +1,70 @@
+import random
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+
+from main.search_index import SuggestIndex, build_index
+
+WORDS = (
+    "sour sweet salty fizzy gummy chewy crunchy chocolate caramel toffee fudge "
+    "licorice cherry lemon apple raspberry strawberry blueberry watermelon mango "
+    "vanilla peanut marshmallow bubblegum cola mint tropical rainbow hearts bears "
+    "drops twists rings slices cubes clusters strips skulls clouds bottles mix bag"
+).split()
+
+
+def _synthetic_rows(count, rng):
+    for pk in range(1, count + 1):
+        name = " ".join(rng.sample(WORDS, 3)).title()
+        description = " ".join(rng.choice(WORDS) for _ in range(25))
+        yield pk, f"{name} {pk}", description
+
+
+class Command(BaseCommand):
+    help = (
+        "Build the typeahead index and time lookups: build time, size and "
+        "per-query latency. Uses the catalog, or --synthetic N fake products."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--synthetic", type=int, default=0, help="Index N generated products instead.")
+        parser.add_argument("--queries", type=int, default=5000)
+
+    def handle(self, *args, **options):
+        rng = random.Random(42)
+        tracemalloc.start()
+        start = time.perf_counter()
+        if options["synthetic"]:
+            index = SuggestIndex(0, _synthetic_rows(options["synthetic"], rng))
+        else:
+            index = build_index()
+        built = time.perf_counter() - start
+        size, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        self.stdout.write(
+            f"{len(index.products)} products, {len(index.terms)} terms, {len(index.trigrams)} trigrams: "
+            f"built in {built * 1000:.0f} ms, ~{size / 1024 / 1024:.1f} MB"
+        )
+
+        queries = []
+        for _ in range(options["queries"]):
+            word = rng.choice(WORDS)
+            kind = rng.random()
+            if kind < 0.6:
+                queries.append(word[:rng.randint(1, len(word))])  # typing
+            elif kind < 0.8:
+                queries.append(f"{rng.choice(WORDS)} {word[:3]}")  # second word
+            else:
+                i = rng.randrange(len(word))
+                queries.append(word[:i] + word[i + 1:])  # typo
+
+        timings = []
+        for query in queries:
+            start = time.perf_counter()
+            index.suggest(query)
+            timings.append(time.perf_counter() - start)
+        timings.sort()
+        p50 = timings[len(timings) // 2] * 1e6
+        p99 = timings[int(len(timings) * 0.99)] * 1e6
+        self.stdout.write(f"{len(queries)} queries: p50 {p50:.0f} µs, p99 {p99:.0f} µs, max {timings[-1] * 1e6:.0f} µs")
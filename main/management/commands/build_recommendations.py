@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from main.recommendations import (
+    DEFAULT_BATCH_SIZE,
+    TOP_K,
+    rebuild_recommendations,
+    update_recommendations,
+)
+
+
+class Command(BaseCommand):
+    help = "Update the 'customers also bought' index from new orders (run from the scheduler)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+        parser.add_argument("--top-k", type=int, default=TOP_K)
+        parser.add_argument(
+            "--rebuild",
+            action="store_true",
+            help="Drop the index and rebuild it from the full order history.",
+        )
+
+    def handle(self, *args, **options):
+        run = rebuild_recommendations if options["rebuild"] else update_recommendations
+        processed = run(batch_size=options["batch_size"], k=options["top_k"])
+        self.stdout.write(self.style.SUCCESS(f"Indexed {processed} orders."))
@@ -0,0 +1,32 @@
+import gzip
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from candy_shop.storage import CRITICAL_OUTPUT
+
+
+class Command(BaseCommand):
+    help = (
+        "Fail when built static assets exceed STATIC_ASSET_BUDGETS. "
+        "Run after collectstatic, like an offline Lighthouse budget."
+    )
+
+    def handle(self, *args, **options):
+        root = settings.STATIC_ROOT
+        over = []
+        for path, budget in settings.STATIC_ASSET_BUDGETS.items():
+            file = root / path
+            if not file.exists():
+                raise CommandError(f"{file} not found, run collectstatic first.")
+            data = file.read_bytes()
+            # Inlined CSS is sent as part of every HTML page, so count raw bytes.
+            size = len(data) if path == CRITICAL_OUTPUT else len(gzip.compress(data, 9))
+            status = "ok" if size <= budget else "OVER"
+            self.stdout.write(f"{status:4}  {path:24} {size:>8} / {budget} bytes")
+            if size > budget:
+                over.append(path)
+
+        if over:
+            raise CommandError(f"Asset budget exceeded: {', '.join(over)}")
+        self.stdout.write(self.style.SUCCESS("All assets within budget."))
@@ -0,0 +1,50 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import close_old_connections, connections
+from django.core.management.base import BaseCommand
+
+from main.dbpool import check_connection, pool_stats
+
+
+class Command(BaseCommand):
+    help = (
+        "Run simulated requests from several threads (like a gthread worker) "
+        "and print the connection metrics for the configured DB_POOL mode."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=4)
+        parser.add_argument("--requests", type=int, default=200, help="Requests per thread.")
+        parser.add_argument("--database", default="default")
+
+    def _worker(self, alias, count):
+        latencies = []
+        try:
+            for _ in range(count):
+                # The same bookkeeping Django does on request_started/finished.
+                close_old_connections()
+                latencies.append(check_connection(alias))
+                close_old_connections()
+        finally:
+            connections[alias].close()
+        return latencies
+
+    def handle(self, *args, **options):
+        alias = options["database"]
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options["threads"]) as pool:
+            results = pool.map(
+                self._worker, [alias] * options["threads"], [options["requests"]] * options["threads"]
+            )
+            latencies = sorted(ms for thread in results for ms in thread)
+        elapsed = time.perf_counter() - start
+
+        self.stdout.write(
+            f"{len(latencies)} requests in {elapsed:.2f}s from {options['threads']} threads: "
+            f"p50 {latencies[len(latencies) // 2]:.2f} ms, "
+            f"p95 {latencies[int(len(latencies) * 0.95) - 1]:.2f} ms, "
+            f"max {latencies[-1]:.2f} ms"
+        )
+        for key, value in pool_stats(alias).items():
+            self.stdout.write(f"  {key:22} {value}")
@@ -0,0 +1,45 @@
+from datetime import datetime, time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from main.exports import DEFAULT_CHUNK_SIZE, EXPORT_FORMATS
+from main.models import Order
+
+
+def _parse_date(value):
+    try:
+        return datetime.strptime(value, "%Y-%m-%d").date()
+    except ValueError:
+        raise CommandError(f"Invalid date '{value}', expected YYYY-MM-DD.")
+
+
+class Command(BaseCommand):
+    help = "Stream orders with their lines, gift amounts and discounts as CSV or JSONL."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--format", choices=sorted(EXPORT_FORMATS), default="csv")
+        parser.add_argument("--output", "-o", help="File to write to (default: stdout).")
+        parser.add_argument("--since", help="First order date to include (YYYY-MM-DD).")
+        parser.add_argument("--until", help="Last order date to include (YYYY-MM-DD).")
+        parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        queryset = Order.objects.all()
+        tz = timezone.get_current_timezone()
+        if options["since"]:
+            since = _parse_date(options["since"])
+            queryset = queryset.filter(date__gte=datetime.combine(since, time.min, tzinfo=tz))
+        if options["until"]:
+            until = _parse_date(options["until"])
+            queryset = queryset.filter(date__lte=datetime.combine(until, time.max, tzinfo=tz))
+
+        iter_lines, _ = EXPORT_FORMATS[options["format"]]
+        lines = iter_lines(queryset, chunk_size=options["chunk_size"])
+
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8", newline="") as fh:
+                fh.writelines(lines)
+        else:
+            for line in lines:
+                self.stdout.write(line, ending="")
@@ -0,0 +1,276 @@
+import random
+import string
+import time
+from array import array
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from itertools import islice
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from main.catalog import bump_catalog_version
+from main.models import FREE_SHIPPING_CENTS, Category, Coupon, GiftCertificate, Order, OrderItem, Product
+from main.money import percent_of, to_cents
+
+WORDS = (
+    "sour sweet salty fizzy gummy chewy crunchy chocolate caramel toffee fudge "
+    "licorice cherry lemon apple raspberry strawberry blueberry watermelon mango "
+    "vanilla peanut marshmallow bubblegum cola mint tropical rainbow hearts bears "
+    "drops twists rings slices cubes clusters strips skulls clouds bottles mix bag"
+).split()
+FIRST_NAMES = "Alva Elsa Maja Wilma Ella Astrid Noah Hugo William Liam Oscar Lucas Nils Sara Ida".split()
+LAST_NAMES = "Andersson Johansson Karlsson Nilsson Eriksson Larsson Olsson Persson Svensson Berg".split()
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+@contextmanager
+def _explicit_dates(*fields):
+    """Let bulk_create keep the dates we set on auto_now_add fields."""
+    saved = [field.auto_now_add for field in fields]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, value in zip(fields, saved):
+            field.auto_now_add = value
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill the database with deterministic fake users, products, orders with "
+        "items, gift certificates, coupons and session carts for scale tests, e.g. "
+        "--users 1000000 --products 50000 --orders 3000000. Rows are generated and "
+        "inserted in chunks, so memory stays flat apart from the user and product "
+        "ids (8 bytes each) kept for foreign keys. The same --seed and --until "
+        "give the same data; running again adds another set."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=1000)
+        parser.add_argument("--products", type=int, default=1000)
+        parser.add_argument("--orders", type=int, default=5000)
+        parser.add_argument("--max-items", type=int, default=6, help="Most order lines per order.")
+        parser.add_argument("--gift-certificates", type=int, default=500)
+        parser.add_argument("--coupons", type=int, default=50)
+        parser.add_argument("--sessions", type=int, default=1000, help="Anonymous sessions with a cart.")
+        parser.add_argument("--days", type=int, default=730, help="History spread over this many days.")
+        parser.add_argument("--until", type=str, help="Last day of history, YYYY-MM-DD (default today).")
+        parser.add_argument("--chunk-size", type=int, default=5000)
+        parser.add_argument("--seed", type=int, default=42)
+        parser.add_argument("--prefix", default="fake", help="Start of generated usernames and codes.")
+
+    def handle(self, *args, **options):
+        if not options["prefix"].isalnum() or len(options["prefix"]) > 8:
+            raise CommandError("--prefix must be at most 8 letters or digits.")
+        try:
+            until = datetime.fromisoformat(options["until"]).date() if options["until"] else timezone.localdate()
+        except ValueError:
+            raise CommandError("--until must be YYYY-MM-DD.")
+        self.rng = random.Random(options["seed"])
+        self.chunk_size = options["chunk_size"]
+        self.prefix = options["prefix"]
+        self.end = timezone.make_aware(datetime.combine(until + timedelta(days=1), datetime.min.time()))
+        self.span = timedelta(days=options["days"])
+
+        self._users(options["users"])
+        self._products(options["products"])
+        self._coupons(options["coupons"])
+        self._orders(options["orders"], options["max_items"])
+        self._gift_certificates(options["gift_certificates"])
+        self._sessions(options["sessions"])
+        self.stdout.write(self.style.SUCCESS(
+            "Done. Run update_sales_rollups --rebuild and build_recommendations to bring the derived tables up to date."
+        ))
+
+    def _date(self, i, count):
+        """The i-th of count dates, spread over the history in order with some jitter."""
+        step = self.span / max(count, 1)
+        return self.end - self.span + step * i + step * self.rng.random()
+
+    def _insert(self, label, model, rows, count, **kwargs):
+        start = time.perf_counter()
+        done = 0
+        for chunk in _chunks(rows, self.chunk_size):
+            with transaction.atomic():
+                created = model.objects.bulk_create(chunk, **kwargs)
+            done += len(chunk)
+            yield created
+            self.stdout.write(f"\r{label}: {done}/{count}", ending="")
+            self.stdout.flush()
+        if count:
+            elapsed = time.perf_counter() - start
+            self.stdout.write(f"\r{label}: {done} in {elapsed:.1f}s ({done / max(elapsed, 1e-9):.0f}/s)")
+
+    def _run(self, label, model, rows, count, **kwargs):
+        for _ in self._insert(label, model, rows, count, **kwargs):
+            pass
+
+    def _name(self):
+        return self.rng.choice(FIRST_NAMES), self.rng.choice(LAST_NAMES)
+
+    def _users(self, count):
+        first = User.objects.filter(username__startswith=self.prefix).count()
+        # One hash for everyone: hashing each password would take hours at scale.
+        password = make_password("fake-password", salt="generatefakedata")
+
+        def rows():
+            for n in range(first, first + count):
+                first_name, last_name = self._name()
+                yield User(
+                    username=f"{self.prefix}{n:07d}",
+                    email=f"{self.prefix}{n:07d}@example.com",
+                    first_name=first_name,
+                    last_name=last_name,
+                    password=password,
+                    date_joined=self._date(n - first, count),
+                )
+
+        self._run("users", User, rows(), count)
+        self.user_ids = array("q", User.objects.order_by().values_list("id", flat=True).iterator())
+
+    def _products(self, count):
+        category_ids = list(Category.objects.values_list("id", flat=True)) or [None]
+
+        def rows():
+            for n in range(count):
+                words = self.rng.sample(WORDS, 3)
+                yield Product(
+                    name=f"{' '.join(words).title()} {n}"[:100],
+                    description=" ".join(self.rng.choice(WORDS) for _ in range(self.rng.randint(15, 60))),
+                    price_cents=self.rng.randrange(500, 20000, 5),
+                    category_id=self.rng.choice(category_ids),
+                    created_at=self._date(n, count),
+                    stock=None if self.rng.random() < 0.7 else self.rng.randint(0, 500),
+                )
+
+        self._run("products", Product, rows(), count)
+        if count:
+            # bulk_create sends no post_save; one bump refreshes catalog caches.
+            bump_catalog_version()
+        self.product_ids = array("q")
+        self.product_prices = array("q")
+        for pk, price in Product.objects.order_by().values_list("id", "price_cents").iterator():
+            self.product_ids.append(pk)
+            self.product_prices.append(price)
+
+    def _coupons(self, count):
+        first = Coupon.objects.filter(code__startswith=self.prefix.upper()).count()
+
+        def rows():
+            for n in range(first, first + count):
+                kind = self.rng.choice(("percent", "amount", "freeship"))
+                value = {"percent": self.rng.choice((5, 10, 15, 20)), "amount": self.rng.choice((20, 50, 100))}
+                yield Coupon(
+                    code=f"{self.prefix.upper()}{n:06d}",
+                    type=kind,
+                    value=value.get(kind, 0),
+                    label=f"Fake {kind} coupon",
+                    active=self.rng.random() < 0.8,
+                    usage_limit=self.rng.choice((None, 100, 1000)),
+                )
+
+        self._run("coupons", Coupon, rows(), count)
+        self.coupons = list(Coupon.objects.filter(active=True).only("id", "type", "value"))
+
+    def _order(self, i, count, max_items):
+        lines = []
+        for index in self.rng.sample(range(len(self.product_ids)), min(self.rng.randint(1, max_items), len(self.product_ids))):
+            lines.append((self.product_ids[index], self.rng.randint(1, 5), self.product_prices[index]))
+        subtotal = sum(quantity * price for _, quantity, price in lines)
+        coupon = self.rng.choice(self.coupons) if self.coupons and self.rng.random() < 0.1 else None
+        discount = 0
+        if coupon is not None:
+            # Same rules as Order.recalculate_total.
+            if coupon.type == "percent":
+                discount = percent_of(subtotal, coupon.value)
+            elif coupon.type == "amount":
+                discount = min(to_cents(coupon.value), subtotal)
+            else:
+                discount = FREE_SHIPPING_CENTS
+        order = Order(
+            user_id=self.rng.choice(self.user_ids),
+            date=self._date(i, count),
+            coupon=coupon,
+            discount_cents=discount,
+            total_cents=subtotal - discount,
+        )
+        return order, lines
+
+    def _orders(self, count, max_items):
+        if count and not (self.user_ids and self.product_ids):
+            raise CommandError("Orders need at least one user and one product.")
+        pending = []
+
+        def rows():
+            for i in range(count):
+                order, lines = self._order(i, count, max_items)
+                pending.append(lines)
+                yield order
+
+        start = time.perf_counter()
+        items = 0
+        with _explicit_dates(Order._meta.get_field("date")):
+            # Each chunk of orders comes back with ids; its lines go in right after.
+            for orders in self._insert("orders", Order, rows(), count):
+                order_items = [
+                    OrderItem(order_id=order.pk, product_id=product_id, quantity=quantity, price_cents=price)
+                    for order, lines in zip(orders, pending)
+                    for product_id, quantity, price in lines
+                ]
+                pending.clear()
+                OrderItem.objects.bulk_create(order_items, batch_size=self.chunk_size)
+                items += len(order_items)
+        if count:
+            self.stdout.write(f"order items: {items} (with the orders, {time.perf_counter() - start:.1f}s)")
+
+    def _gift_certificates(self, count):
+        first = GiftCertificate.objects.filter(code__startswith=self.prefix.upper()).count()
+
+        def rows():
+            for n in range(first, first + count):
+                first_name, last_name = self._name()
+                yield GiftCertificate(
+                    code=f"{self.prefix.upper()}{n:08d}",
+                    recipient_name=f"{first_name} {last_name}",
+                    recipient_email=f"{first_name}.{last_name}{n}@example.com".lower(),
+                    amount_cents=self.rng.choice((10000, 20000, 25000, 50000)),
+                    status=self.rng.choice(("pending", "issued", "issued", "redeemed")),
+                    created_at=self._date(n - first, count),
+                )
+
+        with _explicit_dates(GiftCertificate._meta.get_field("created_at")):
+            self._run("gift certificates", GiftCertificate, rows(), count)
+
+    def _sessions(self, count):
+        if count and not self.product_ids:
+            raise CommandError("Session carts need at least one product.")
+        alphabet = string.ascii_lowercase + string.digits
+        expires = timezone.now() + timedelta(seconds=settings.SESSION_COOKIE_AGE)
+
+        def rows():
+            for _ in range(count):
+                cart = {}
+                for _ in range(self.rng.randint(1, 8)):
+                    pk = self.rng.choice(self.product_ids)
+                    item = cart.setdefault(str(pk), {"name": f"Product {pk}", "image_url": None, "quantity": 0})
+                    item["quantity"] += 1
+                yield Session(
+                    session_key="".join(self.rng.choices(alphabet, k=32)),
+                    session_data=Session.objects.encode({"cart": cart}),
+                    expire_date=expires,
+                )
+
+        # A rerun with the same seed generates the same keys.
+        self._run("sessions", Session, rows(), count, ignore_conflicts=True)
@@ -0,0 +1,41 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from main.images import ingest_product_image
+from main.models import Product
+
+
+class Command(BaseCommand):
+    help = "Download product images into MEDIA_ROOT and generate responsive AVIF/WebP thumbnails."
+
+    def add_arguments(self, parser):
+        parser.add_argument("product_ids", nargs="*", type=int, help="Only these products.")
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Re-fetch images for products that were already ingested.",
+        )
+
+    def handle(self, *args, **options):
+        if not settings.MEDIA_PUBLIC:
+            self.stderr.write(self.style.WARNING(
+                "MEDIA_PUBLIC is off: pages keep using the original image URLs until media is publicly served."
+            ))
+        products = Product.objects.exclude(image_url__isnull=True).exclude(image_url="")
+        if options["product_ids"]:
+            products = products.filter(id__in=options["product_ids"])
+        if not options["force"]:
+            products = products.filter(image_hash="")
+
+        done = failed = 0
+        for product in products.iterator():
+            try:
+                ingest_product_image(product)
+            except Exception as e:
+                failed += 1
+                self.stderr.write(f"{product.id} {product.name}: {e}")
+                continue
+            done += 1
+            self.stdout.write(f"{product.id} {product.name}: {product.image_hash[:12]}")
+
+        self.stdout.write(self.style.SUCCESS(f"Ingested {done} images, {failed} failed."))
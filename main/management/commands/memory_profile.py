@@ -0,0 +1,67 @@
+import gc
+import tracemalloc
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+
+from main.memory import DEFAULT_FRAMES, diff_sites, rss_bytes
+
+
+def _mb(size):
+    return f"{size / 1024 / 1024:+.2f} MB"
+
+
+class Command(BaseCommand):
+    help = (
+        "Request each URL repeatedly under tracemalloc and report, per URL, the "
+        "peak allocation of one request, what the repeats left allocated "
+        "(growth here is a leak or an unbounded cache) and where it was allocated."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("paths", nargs="+", help="URLs to request, e.g. /products/ /cart/")
+        parser.add_argument("--repeat", type=int, default=50)
+        parser.add_argument("--user", help="Log in as this user first (order history, staff pages).")
+        parser.add_argument("--frames", type=int, default=DEFAULT_FRAMES)
+        parser.add_argument("--top", type=int, default=10, help="Allocation sites to list per URL.")
+
+    def handle(self, *args, **options):
+        host = next((h for h in settings.ALLOWED_HOSTS if h and h != "*" and not h.startswith(".")), "localhost")
+        client = Client(HTTP_HOST=host)
+        if options["user"]:
+            user = User.objects.filter(username=options["user"]).first()
+            if user is None:
+                raise CommandError(f"No user {options['user']!r}.")
+            client.force_login(user)
+
+        tracemalloc.start(options["frames"])
+        try:
+            for path in options["paths"]:
+                self._profile(client, path, options)
+        finally:
+            tracemalloc.stop()
+
+    def _profile(self, client, path, options):
+        # The first request fills caches and imports lazily loaded modules.
+        status = client.get(path, secure=True).status_code
+        gc.collect()
+        before = tracemalloc.take_snapshot()
+        rss_before = rss_bytes()
+        peak = 0
+        for _ in range(options["repeat"]):
+            start = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            client.get(path, secure=True)
+            peak = max(peak, tracemalloc.get_traced_memory()[1] - start)
+        gc.collect()
+        sites = diff_sites(tracemalloc.take_snapshot(), before)
+
+        self.stdout.write(
+            f"{path} [{status}] x{options['repeat']}: peak per request {_mb(peak)}, "
+            f"retained {_mb(sum(sites.values()))}, RSS {_mb(rss_bytes() - rss_before)}"
+        )
+        for site, size in sites.most_common(options["top"]):
+            if size > 0:
+                self.stdout.write(f"  {_mb(size):>12}  {site}")
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from main.reviews import reconcile_ratings
+
+
+class Command(BaseCommand):
+    help = "Rebuild Product.rating_count/rating_sum from the reviews table, in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        fixed = reconcile_ratings(batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Corrected ratings on {fixed} products."))
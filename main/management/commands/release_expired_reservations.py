@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from main.inventory import release_expired
+
+
+class Command(BaseCommand):
+    help = (
+        "Settle expired stock reservations (run every few minutes): stock of checkouts Stripe "
+        "reports paid stays taken, stock of abandoned ones is given back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        released = release_expired(batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Settled {released} expired reservations."))
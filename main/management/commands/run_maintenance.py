@@ -0,0 +1,52 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import OperationalError
+from django.utils import timezone
+
+from main.maintenance import DEFAULT_BATCH_SIZE, TASKS, Throttle, pending, run_task
+
+
+class Command(BaseCommand):
+    help = (
+        "Purge expired sessions, idle carts, old read contact messages (archived first) "
+        "and expired stock reservations in small batches. Safe to schedule during "
+        "trading hours."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("tasks", nargs="*", choices=list(TASKS), help="Default: all tasks.")
+        parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+        parser.add_argument("--sleep", type=float, default=0.05, help="Seconds to pause between batches.")
+        parser.add_argument("--max-seconds", type=float, help="Stop starting new batches after this long.")
+        parser.add_argument("--dry-run", action="store_true", help="Only count what is due.")
+
+    def handle(self, *args, **options):
+        names = options["tasks"] or list(TASKS)
+        now = timezone.now()
+
+        if options["dry_run"]:
+            for name in names:
+                self.stdout.write(f"{name:14} {pending(name, now):>9} rows due")
+            return
+
+        throttle = Throttle(options["sleep"], options["max_seconds"])
+        for name in names:
+            start = time.monotonic()
+            rows = batches = 0
+            try:
+                for count in run_task(name, now, options["batch_size"], throttle):
+                    rows += count
+                    batches += 1
+                    if options["verbosity"] > 1:
+                        self.stdout.write(f"  {name}: batch {batches}, {rows} rows so far")
+            except OperationalError as e:
+                self.stderr.write(self.style.WARNING(f"{name}: stopped, rows are busy ({e})"))
+            elapsed = time.monotonic() - start
+            self.stdout.write(
+                f"{name:14} {rows:>9} rows {batches:>6} batches {elapsed:>7.2f}s "
+                f"{rows / elapsed if elapsed else 0:>9.0f} rows/s"
+            )
+            if throttle.expired():
+                self.stdout.write(self.style.WARNING("Time budget spent; the rest waits for the next run."))
+                break
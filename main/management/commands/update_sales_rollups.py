@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from main.rollups import DEFAULT_BATCH_SIZE, rebuild_sales_rollups, update_sales_rollups
+
+
+class Command(BaseCommand):
+    help = "Fold new orders into the daily sales rollup tables (run from the scheduler)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+        parser.add_argument(
+            "--rebuild",
+            action="store_true",
+            help="Drop all rollups and rebuild them from the full order history.",
+        )
+
+    def handle(self, *args, **options):
+        run = rebuild_sales_rollups if options["rebuild"] else update_sales_rollups
+        processed = run(batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Rolled up {processed} orders."))
@@ -0,0 +1,225 @@
+"""
+Memory diagnostics for gunicorn workers.
+
+Each worker keeps a table with one row per view:
+
+- how many requests it served and how much the worker's resident set
+  (RSS) grew while serving them. A leak shows up as a view whose total
+  keeps climbing. A one-off spike, such as a whole-catalog render, shows
+  up as a large max;
+- while tracemalloc is on, the Python memory each request left behind and
+  the peak it reached. Every MEMORY_SAMPLE_EVERY-th request is also
+  snapshotted before and after, and its top allocation sites are added up
+  per view.
+
+tracemalloc slows down every allocation, so it only runs when
+MEMORY_TRACE_FRAMES is set or when staff start it from
+/diagnostics/memory/. That page is JSON for staff only and reports on the
+worker that served it: its RSS, the per-view table and the top sites
+allocated since tracing started or the baseline was reset, i.e. what the
+worker has accumulated across requests. `manage.py memory_profile` takes
+the same measurements over a list of URLs in one process.
+
+The numbers are per process. With gthread workers, concurrent requests
+share them, so one request's growth includes whatever other threads
+allocated at the same time. Sampling many requests evens that out.
+"""
+import itertools
+import os
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+TOP_SITES = 15
+DEFAULT_FRAMES = 10
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+_STDLIB = os.path.dirname(os.__file__) + os.sep
+_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+_lock = threading.Lock()
+_views = {}
+_baseline = {"snapshot": None, "rss": 0, "since": time.time()}
+_requests = itertools.count(1)
+
+
+def rss_bytes():
+    """The process's current resident set size."""
+    try:
+        with open("/proc/self/statm") as fh:
+            return int(fh.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        # No /proc (macOS): the peak is the best we have.
+        return peak_rss_bytes()
+
+
+def peak_rss_bytes():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _snapshot():
+    return tracemalloc.take_snapshot().filter_traces(_FILTERS)
+
+
+def _short(filename):
+    base = str(settings.BASE_DIR) + os.sep
+    if filename.startswith(base):
+        return filename[len(base):]
+    _, marker, rest = filename.rpartition("site-packages" + os.sep)
+    if marker:
+        return rest
+    if filename.startswith(_STDLIB):
+        return filename[len(_STDLIB):]
+    return filename
+
+
+def _site(traceback):
+    """'file:line', plus the innermost project frame when that is elsewhere."""
+    frames = list(traceback)  # oldest first
+    innermost = frames[-1]
+    label = f"{_short(innermost.filename)}:{innermost.lineno}"
+    base = str(settings.BASE_DIR) + os.sep
+    for frame in reversed(frames):
+        if frame.filename.startswith(base) and "site-packages" not in frame.filename:
+            if frame is not innermost:
+                label += f" (from {_short(frame.filename)}:{frame.lineno})"
+            break
+    return label
+
+
+def diff_sites(new, old):
+    """Counter of site -> bytes allocated between two snapshots."""
+    sites = Counter()
+    for stat in new.compare_to(old, "traceback"):
+        if stat.size_diff:
+            sites[_site(stat.traceback)] += stat.size_diff
+    return sites
+
+
+def _top(sites, limit):
+    return [{"site": site, "bytes": size} for site, size in sites.most_common(limit) if size > 0]
+
+
+def reset():
+    """Clear the per-view table and take a new baseline."""
+    with _lock:
+        _views.clear()
+        _baseline.update(
+            snapshot=_snapshot() if tracemalloc.is_tracing() else None,
+            rss=rss_bytes(),
+            since=time.time(),
+        )
+
+
+def start_tracing(frames=None):
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(frames or settings.MEMORY_TRACE_FRAMES or DEFAULT_FRAMES)
+    reset()
+
+
+def stop_tracing():
+    tracemalloc.stop()
+    reset()
+
+
+def _record(view, rss_growth, retained=0, peak=0, sites=None):
+    with _lock:
+        stats = _views.get(view)
+        if stats is None:
+            stats = _views[view] = {
+                "requests": 0, "rss_growth": 0, "max_rss_growth": 0,
+                "retained": 0, "max_peak": 0, "sampled": 0, "sites": Counter(),
+            }
+        stats["requests"] += 1
+        stats["rss_growth"] += rss_growth
+        stats["max_rss_growth"] = max(stats["max_rss_growth"], rss_growth)
+        stats["retained"] += retained
+        stats["max_peak"] = max(stats["max_peak"], peak)
+        if sites is not None:
+            stats["sampled"] += 1
+            stats["sites"].update(sites)
+
+
+def report(limit=TOP_SITES):
+    """This worker's memory state, as served by /diagnostics/memory/."""
+    tracing = tracemalloc.is_tracing()
+    with _lock:
+        views = [
+            {
+                "view": view,
+                **{key: value for key, value in stats.items() if key != "sites"},
+                "top_sites": _top(stats["sites"], limit),
+            }
+            for view, stats in _views.items()
+        ]
+        baseline = dict(_baseline)
+    views.sort(key=lambda row: row["rss_growth"], reverse=True)
+
+    result = {
+        "pid": os.getpid(),
+        "rss_bytes": rss_bytes(),
+        "peak_rss_bytes": peak_rss_bytes(),
+        "rss_growth_since_baseline": rss_bytes() - baseline["rss"],
+        "baseline_age_seconds": round(time.time() - baseline["since"]),
+        "tracing": tracing,
+        "views": views,
+    }
+    if tracing:
+        current, peak = tracemalloc.get_traced_memory()
+        result.update(traced_bytes=current, traced_peak_bytes=peak)
+        if baseline["snapshot"] is not None:
+            result["top_sites_since_baseline"] = _top(diff_sites(_snapshot(), baseline["snapshot"]), limit)
+    return result
+
+
+def summary(limit=3):
+    """One line for the gunicorn stats log: RSS and the fastest-growing views."""
+    with _lock:
+        growing = sorted(_views.items(), key=lambda item: item[1]["rss_growth"], reverse=True)[:limit]
+    views = ", ".join(f"{view} +{stats['rss_growth'] / 1024 / 1024:.1f} MB" for view, stats in growing)
+    return f"RSS {rss_bytes() / 1024 / 1024:.0f} MB; growth by view: {views or '-'}"
+
+
+class MemoryMiddleware:
+    def __init__(self, get_response):
+        if not settings.MEMORY_TRACKING:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if settings.MEMORY_TRACE_FRAMES:
+            start_tracing()
+        else:
+            reset()
+
+    def __call__(self, request):
+        tracing = tracemalloc.is_tracing()
+        sample = tracing and next(_requests) % settings.MEMORY_SAMPLE_EVERY == 0
+        before = _snapshot() if sample else None
+        if tracing:
+            traced_before = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        rss_before = rss_bytes()
+
+        response = self.get_response(request)
+
+        rss_growth = rss_bytes() - rss_before
+        match = request.resolver_match
+        view = match.view_name if match is not None else "-"
+        # tracemalloc may have been stopped by this very request.
+        if tracing and tracemalloc.is_tracing():
+            traced_after, peak = tracemalloc.get_traced_memory()
+            sites = diff_sites(_snapshot(), before) if sample else None
+            _record(view, rss_growth, traced_after - traced_before, peak - traced_before, sites)
+        else:
+            _record(view, rss_growth)
+        return response
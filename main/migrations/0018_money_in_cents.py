@@ -0,0 +1,135 @@
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import BigIntegerField, DecimalField, ExpressionWrapper, F, Value
+from django.db.models.functions import Cast, Coalesce, Round
+
+import main.money
+
+# (model, [(old decimal field, new cents field)])
+CONVERSIONS = [
+    ("product", [("price", "price_cents")]),
+    ("order", [("total", "total_cents"), ("discount_amount", "discount_cents"), ("gift_amount", "gift_cents")]),
+    ("orderitem", [("price", "price_cents")]),
+    ("giftcertificate", [("amount", "amount_cents")]),
+    ("dailysales", [("revenue", "revenue_cents"), ("discount_total", "discount_cents"), ("gift_total", "gift_cents")]),
+    ("dailyproductsales", [("revenue", "revenue_cents")]),
+    ("dailycouponsales", [("discount_total", "discount_cents")]),
+]
+
+
+def decimals_to_cents(apps, schema_editor):
+    # One set-based UPDATE per table; nothing is loaded into Python.
+    for model_name, fields in CONVERSIONS:
+        model = apps.get_model("main", model_name)
+        model.objects.update(**{
+            new: Cast(
+                Round(Coalesce(F(old), Value(Decimal("0"))) * 100),
+                BigIntegerField(),
+            )
+            for old, new in fields
+        })
+
+
+def cents_to_decimals(apps, schema_editor):
+    for model_name, fields in CONVERSIONS:
+        model = apps.get_model("main", model_name)
+        model.objects.update(**{
+            # Times 0.01 rather than / 100: SQLite would divide two integers.
+            old: ExpressionWrapper(
+                Cast(F(new), DecimalField(max_digits=14, decimal_places=2)) * Value(Decimal("0.01")),
+                output_field=DecimalField(max_digits=14, decimal_places=2),
+            )
+            for old, new in fields
+        })
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0017_product_reviews'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='price_cents',
+            field=main.money.MoneyField(default=0, verbose_name='price'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='total_cents',
+            field=main.money.MoneyField(default=0, verbose_name='total'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='discount_cents',
+            field=main.money.MoneyField(default=0, verbose_name='discount'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='gift_cents',
+            field=main.money.MoneyField(default=0, verbose_name='gift amount'),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='price_cents',
+            field=main.money.MoneyField(default=0, verbose_name='price'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='giftcertificate',
+            name='amount_cents',
+            field=main.money.MoneyField(default=0, verbose_name='amount'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='dailysales',
+            name='revenue_cents',
+            field=main.money.MoneyField(default=0, verbose_name='revenue'),
+        ),
+        migrations.AddField(
+            model_name='dailysales',
+            name='discount_cents',
+            field=main.money.MoneyField(default=0, verbose_name='discounts'),
+        ),
+        migrations.AddField(
+            model_name='dailysales',
+            name='gift_cents',
+            field=main.money.MoneyField(default=0, verbose_name='gift certificates total'),
+        ),
+        migrations.AddField(
+            model_name='dailyproductsales',
+            name='revenue_cents',
+            field=main.money.MoneyField(default=0, verbose_name='revenue'),
+        ),
+        migrations.AddField(
+            model_name='dailycouponsales',
+            name='discount_cents',
+            field=main.money.MoneyField(default=0, verbose_name='discounts'),
+        ),
+        # Nullable before removal, so unapplying can re-add them to filled tables
+        # (and fill them) before NOT NULL comes back.
+        migrations.AlterField(
+            model_name='orderitem',
+            name='price',
+            field=models.DecimalField(decimal_places=2, max_digits=8, null=True),
+        ),
+        migrations.AlterField(
+            model_name='giftcertificate',
+            name='amount',
+            field=models.DecimalField(decimal_places=2, max_digits=8, null=True),
+        ),
+        migrations.RunPython(decimals_to_cents, cents_to_decimals),
+        migrations.RemoveField(model_name='product', name='price'),
+        migrations.RemoveField(model_name='order', name='total'),
+        migrations.RemoveField(model_name='order', name='discount_amount'),
+        migrations.RemoveField(model_name='order', name='gift_amount'),
+        migrations.RemoveField(model_name='orderitem', name='price'),
+        migrations.RemoveField(model_name='giftcertificate', name='amount'),
+        migrations.RemoveField(model_name='dailysales', name='revenue'),
+        migrations.RemoveField(model_name='dailysales', name='discount_total'),
+        migrations.RemoveField(model_name='dailysales', name='gift_total'),
+        migrations.RemoveField(model_name='dailyproductsales', name='revenue'),
+        migrations.RemoveField(model_name='dailycouponsales', name='discount_total'),
+    ]
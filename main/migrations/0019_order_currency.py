@@ -0,0 +1,23 @@
+# Generated by Django 5.2.4 on 2026-10-19 02:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0018_money_in_cents'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='currency',
+            field=models.CharField(blank=True, default='', max_length=3),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='exchange_rate',
+            field=models.DecimalField(decimal_places=8, default=1, max_digits=16),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-19 03:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0022_slow_query'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='catalogversion',
+            name='listing_version',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+    ]
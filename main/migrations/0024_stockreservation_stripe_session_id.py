@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-19 03:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0023_catalogversion_listing_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='stockreservation',
+            name='stripe_session_id',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=255),
+        ),
+    ]
@@ -1,28 +1,97 @@
+from django.conf import settings
 from django.db import models
 from django.contrib.auth.models import User
-from decimal import Decimal
+from django.utils import timezone
+
+from .money import MoneyField, convert, format_money, percent_of, to_cents
+
+
+class Category(models.Model):
+    name = models.CharField(max_length=60)
+    slug = models.SlugField(max_length=60, unique=True)
+    position = models.PositiveSmallIntegerField(default=0, help_text="Order in the catalog filters.")
+
+    class Meta:
+        ordering = ['position', 'name']
+        verbose_name_plural = 'categories'
+
+    def __str__(self):
+        return self.name
 
 
 class Product(models.Model):
     name = models.CharField(max_length=100)
     description = models.TextField()
-    price = models.DecimalField(max_digits=8, decimal_places=2, null=True, blank=True)
+    price_cents = MoneyField("price", default=0)
+    # No index of its own: the category indexes below lead with it.
+    category = models.ForeignKey(
+        Category, null=True, blank=True, on_delete=models.SET_NULL, related_name='products', db_index=False
+    )
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
     image_url = models.URLField(max_length=500, null=True, blank=True)
+    # None = not stock-tracked (unlimited). Only changed through main/inventory.py.
+    stock = models.PositiveIntegerField(null=True, blank=True)
+
+    # Filled in by the ingest_product_images command (see main/images.py)
+    image_hash = models.CharField(max_length=64, blank=True, default='', editable=False)
+    image_width = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    image_height = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    image_formats = models.CharField(max_length=50, blank=True, default='', editable=False)
+
+    # Review aggregates, kept in step by main/reviews.py so listings can show
+    # stars without touching the reviews table.
+    rating_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
+
+    class Meta:
+        # One per sort of the catalog listing (main/facets.py), alone and
+        # within a category; the trailing id keeps pages stable on ties.
+        indexes = [
+            models.Index(fields=['name', 'id'], name='product_name_idx'),
+            models.Index(fields=['price_cents', 'id'], name='product_price_idx'),
+            models.Index(fields=['-created_at', '-id'], name='product_newest_idx'),
+            models.Index(fields=['category', 'name', 'id'], name='product_cat_name_idx'),
+            models.Index(fields=['category', 'price_cents', 'id'], name='product_cat_price_idx'),
+            models.Index(fields=['category', '-created_at', '-id'], name='product_cat_newest_idx'),
+        ]
 
     def __str__(self):
         return self.name
 
+    @property
+    def average_rating(self):
+        if not self.rating_count:
+            return None
+        return round(self.rating_sum / self.rating_count, 1)
+
+
+class CatalogVersion(models.Model):
+    """Single row bumped whenever a Product changes (see main/catalog.py)."""
+    version = models.PositiveBigIntegerField(default=0)
+    # Bumped instead of version when only ratings or stock badges change.
+    listing_version = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"Catalog v{self.version} ({self.updated_at:%Y-%m-%d %H:%M:%S})"
+
 
 class Cart(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name="cart")
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # Maintenance purges carts idle for a long time.
+            models.Index(fields=["updated_at"], name="cart_updated_idx"),
+        ]
+
     def __str__(self):
         return f"Cart for {self.user.username}"
 
-    def total_price(self):
-        return sum(item.total_price() for item in self.items.all())
+    def total_cents(self):
+        return sum(item.total_cents() for item in self.items.all())
 
 
 class CartItem(models.Model):
@@ -33,54 +102,76 @@ class CartItem(models.Model):
     def __str__(self):
         return f"{self.quantity} × {self.product.name}"
 
-    def total_price(self):
-        return self.product.price * self.quantity
+    def total_cents(self):
+        return self.product.price_cents * self.quantity
+
+
+# What the "freeship" coupon takes off (the flat shipping fee).
+FREE_SHIPPING_CENTS = 500
+# Orders above this ship free (advertised on the cart page).
+FREE_SHIPPING_OVER_CENTS = 5000
 
 
 class Order(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='orders')
     date = models.DateTimeField(auto_now_add=True)
-    total = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal('0.00'))
+    total_cents = MoneyField("total", default=0)
     coupon = models.ForeignKey("Coupon", null=True, blank=True, on_delete=models.SET_NULL, related_name="orders")
-    discount_amount = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal('0.00'))
-    gift_amount = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal('0.00'))
+    discount_cents = MoneyField("discount", default=0)
+    gift_cents = MoneyField("gift amount", default=0)
     gift_recipient = models.CharField(max_length=200, blank=True, default='')
     gift_code = models.CharField(max_length=50, blank=True, default='')
+    # Amounts above are in the base currency (STRIPE_CURRENCY); this is what
+    # the customer saw and paid in. Empty = the base currency.
+    currency = models.CharField(max_length=3, blank=True, default='')
+    exchange_rate = models.DecimalField(max_digits=16, decimal_places=8, default=1)
 
     class Meta:
         ordering = ['-date']
+        indexes = [
+            models.Index(fields=['-date'], name='order_date_idx'),
+            models.Index(fields=['user', '-date'], name='order_user_date_idx'),
+        ]
 
     def __str__(self):
         return f"Order #{self.id} by {self.user.username}"
 
+    @property
+    def charged_currency(self):
+        return self.currency or settings.STRIPE_CURRENCY.lower()
+
+    def charged(self, cents):
+        """A base-currency amount of this order in the currency it was paid in."""
+        return convert(cents, self.exchange_rate)
+
     def recalculate_total(self):
-        subtotal = sum((item.line_total() for item in self.items.all()), Decimal('0.00'))
-        discount = Decimal('0.00')
+        subtotal = sum(item.line_total_cents() for item in self.items.all())
+        discount = 0
 
         if self.coupon and self.coupon.is_valid_now():
             if self.coupon.type == "percent":
-                discount = subtotal * (self.coupon.value / Decimal('100'))
+                discount = percent_of(subtotal, self.coupon.value)
             elif self.coupon.type == "amount":
-                discount = min(self.coupon.value, subtotal)
+                discount = min(to_cents(self.coupon.value), subtotal)
             elif self.coupon.type == "freeship":
-                discount = Decimal('5.00')
+                discount = FREE_SHIPPING_CENTS
 
-        self.discount_amount = discount
-        self.total = subtotal - discount
-        self.save(update_fields=['total', 'discount_amount'])
+        self.discount_cents = discount
+        self.total_cents = subtotal - discount
+        self.save(update_fields=['total_cents', 'discount_cents'])
 
 
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='items')
     product = models.ForeignKey(Product, on_delete=models.PROTECT, related_name='order_items')
     quantity = models.PositiveIntegerField(default=1)
-    price = models.DecimalField(max_digits=8, decimal_places=2)
+    price_cents = MoneyField("price")
 
     def __str__(self):
         return f"{self.quantity} × {self.product.name}"
 
-    def line_total(self):
-        return (self.price or Decimal('0.00')) * Decimal(self.quantity)
+    def line_total_cents(self):
+        return self.price_cents * self.quantity
 
 
 class GiftCertificate(models.Model):
@@ -93,7 +184,7 @@ class GiftCertificate(models.Model):
     code = models.CharField(max_length=20, unique=True, blank=True)
     recipient_name = models.CharField(max_length=120)
     recipient_email = models.EmailField()
-    amount = models.DecimalField(max_digits=8, decimal_places=2)
+    amount_cents = MoneyField("amount")
     message = models.TextField(blank=True)
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default="pending")
     created_at = models.DateTimeField(auto_now_add=True)
@@ -102,7 +193,7 @@ class GiftCertificate(models.Model):
         ordering = ["-created_at"]
 
     def __str__(self):
-        return f"GiftCertificate {self.code or '(pending)'} • ${self.amount}"
+        return f"GiftCertificate {self.code or '(pending)'} • {format_money(self.amount_cents)}"
 
     def save(self, *args, **kwargs):
         if not self.code:
@@ -146,3 +237,180 @@ class Coupon(models.Model):
         if self.usage_limit is not None and self.used_count >= self.usage_limit:
             return False
         return True
+
+
+# --- Reporting rollups ---
+# Maintained incrementally by the update_sales_rollups command so that
+# reports never have to scan Order/OrderItem.
+class DailySales(models.Model):
+    day = models.DateField(unique=True)
+    orders = models.PositiveIntegerField(default=0)
+    units = models.PositiveIntegerField(default=0)
+    revenue_cents = MoneyField("revenue", default=0)
+    discount_cents = MoneyField("discounts", default=0)
+    gift_certificates = models.PositiveIntegerField(default=0)
+    gift_cents = MoneyField("gift certificates total", default=0)
+
+    class Meta:
+        ordering = ["-day"]
+        verbose_name_plural = "daily sales"
+
+    def __str__(self):
+        return f"Sales {self.day}"
+
+
+class DailyProductSales(models.Model):
+    day = models.DateField()
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="daily_sales")
+    units = models.PositiveIntegerField(default=0)
+    revenue_cents = MoneyField("revenue", default=0)
+
+    class Meta:
+        ordering = ["-day", "product_id"]
+        verbose_name_plural = "daily product sales"
+        constraints = [
+            models.UniqueConstraint(fields=["day", "product"], name="uniq_daily_product_sales"),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} on {self.day}"
+
+
+class DailyCouponSales(models.Model):
+    day = models.DateField()
+    coupon = models.ForeignKey("Coupon", on_delete=models.CASCADE, related_name="daily_sales")
+    orders = models.PositiveIntegerField(default=0)
+    discount_cents = MoneyField("discounts", default=0)
+
+    class Meta:
+        ordering = ["-day", "coupon_id"]
+        verbose_name_plural = "daily coupon sales"
+        constraints = [
+            models.UniqueConstraint(fields=["day", "coupon"], name="uniq_daily_coupon_sales"),
+        ]
+
+    def __str__(self):
+        return f"{self.coupon_id} on {self.day}"
+
+
+class RollupWatermark(models.Model):
+    name = models.CharField(max_length=50, unique=True)
+    last_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} @ {self.last_id}"
+
+
+# --- Co-purchase recommendations ---
+# Built by the build_recommendations command from OrderItem history.
+class ProductPairCount(models.Model):
+    """How many orders contained both ``product`` and ``other`` (stored in both directions)."""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="+")
+    other = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="+")
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["product", "other"], name="uniq_product_pair"),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} + {self.other_id}: {self.count}"
+
+
+class ProductRecommendation(models.Model):
+    """Top-K co-purchased product ids for one product, best first."""
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True, related_name="recommendation")
+    related_ids = models.JSONField(default=list)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Recommendations for {self.product_id}"
+
+
+# --- Inventory ---
+class StockReservation(models.Model):
+    """Stock held for an unfinished Stripe checkout (see main/inventory.py)."""
+    token = models.UUIDField(db_index=True)
+    # The checkout it is held for; empty until Stripe has created it.
+    stripe_session_id = models.CharField(max_length=255, blank=True, default="", db_index=True)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="reservations")
+    quantity = models.PositiveIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"{self.quantity} × {self.product_id} until {self.expires_at:%H:%M}"
+
+
+class Review(models.Model):
+    """A customer's rating of a product they have bought (one per product)."""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="reviews")
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="reviews")
+    rating = models.PositiveSmallIntegerField()
+    body = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["-created_at"]
+        constraints = [
+            models.UniqueConstraint(fields=["product", "user"], name="uniq_review_per_user"),
+            models.CheckConstraint(
+                condition=models.Q(rating__gte=1, rating__lte=5), name="review_rating_1_to_5"
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["product", "-created_at"], name="review_product_idx"),
+            models.Index(fields=["-created_at"], name="review_created_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.rating}★ {self.product} by {self.user}"
+
+
+class RequestProfile(models.Model):
+    """A staff-requested cProfile run of one request (see main/profiling.py)."""
+    created_at = models.DateTimeField(auto_now_add=True)
+    user = models.ForeignKey(User, null=True, blank=True, on_delete=models.SET_NULL, related_name="+")
+    method = models.CharField(max_length=10)
+    path = models.CharField(max_length=500)
+    status_code = models.PositiveSmallIntegerField()
+    duration_ms = models.FloatField()
+    query_count = models.PositiveIntegerField()
+    query_ms = models.FloatField()
+    # pstats dump, readable with `python -m pstats` or snakeviz.
+    profile = models.FileField(upload_to="profiles/")
+    summary = models.TextField()
+
+    class Meta:
+        ordering = ["-created_at"]
+
+    def __str__(self):
+        return f"{self.method} {self.path} ({self.duration_ms:.0f} ms)"
+
+
+class SlowQuery(models.Model):
+    """Statements over SLOW_QUERY_MS, one row per fingerprint (see main/slow_queries.py)."""
+    fingerprint = models.CharField(max_length=32, unique=True)
+    sql = models.TextField(help_text="Normalized: literals replaced by ?.")
+    count = models.PositiveIntegerField(default=0)
+    total_ms = models.FloatField(default=0)
+    max_ms = models.FloatField(default=0)
+    first_seen = models.DateTimeField(auto_now_add=True)
+    last_seen = models.DateTimeField()
+    # From the slowest run so far
+    view = models.CharField(max_length=200, blank=True)
+    location = models.CharField(max_length=300, blank=True)
+    explain = models.TextField(blank=True)
+
+    class Meta:
+        ordering = ["-total_ms"]
+        verbose_name_plural = "slow queries"
+
+    def __str__(self):
+        return self.sql[:80]
+
+    @property
+    def avg_ms(self):
+        return self.total_ms / self.count if self.count else 0
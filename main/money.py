@@ -0,0 +1,94 @@
+"""
+Money as integer minor units (cents/öre).
+
+Prices and totals are stored and added up as plain ints, which is what
+Stripe wants (``unit_amount``), and only turned into decimals at the edges:
+form input (``to_cents``), display (the ``money`` template filter) and
+exports (``from_cents``). Amounts in other currencies are cents too; see
+main/currency.py for where the rates come from.
+"""
+from decimal import ROUND_HALF_UP, Decimal
+
+from django import forms
+from django.db import models
+
+CENT = Decimal("0.01")
+
+
+def to_cents(amount):
+    """'2.99', 2.99 or Decimal('2.99') -> 299 (half-up to the cent)."""
+    if amount in (None, ""):
+        return 0
+    return int((Decimal(str(amount)) * 100).quantize(Decimal("1"), rounding=ROUND_HALF_UP))
+
+
+def from_cents(cents):
+    """299 -> Decimal('2.99')."""
+    return (Decimal(cents or 0) / 100).quantize(CENT)
+
+
+def format_money(cents):
+    """299 -> '2.99' without going through Decimal."""
+    cents = cents or 0
+    sign = "-" if cents < 0 else ""
+    units, rest = divmod(abs(cents), 100)
+    return f"{sign}{units}.{rest:02d}"
+
+
+# How amounts are written per currency; others come out as "12.50 XYZ".
+# Only two-decimal currencies are supported.
+PRICE_FORMATS = {
+    "usd": "${}",
+    "eur": "€{}",
+    "gbp": "£{}",
+    "sek": "{} kr",
+    "nok": "{} kr",
+    "dkk": "{} kr",
+}
+
+
+def format_price(cents, currency):
+    """(299, 'usd') -> '$2.99', (3150, 'sek') -> '31.50 kr'."""
+    currency = currency.lower()
+    return PRICE_FORMATS.get(currency, "{} " + currency.upper()).format(format_money(cents))
+
+
+def convert(cents, rate):
+    """Cents times an exchange rate, rounded half-up to whole cents."""
+    if rate == 1:
+        return cents
+    return int((cents * rate).quantize(Decimal("1"), rounding=ROUND_HALF_UP))
+
+
+def percent_of(cents, percent):
+    """``percent`` (e.g. Decimal('12.5')) of ``cents``, rounded half-up."""
+    basis_points = to_cents(percent)
+    return (cents * basis_points + 5000) // 10000
+
+
+class MoneyFormField(forms.DecimalField):
+    """Edits a cents value as a decimal amount ('2.99') and cleans to cents."""
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault("decimal_places", 2)
+        super().__init__(**kwargs)
+
+    def prepare_value(self, value):
+        if isinstance(value, int):
+            return from_cents(value)
+        return value
+
+    def clean(self, value):
+        value = super().clean(value)
+        return None if value is None else to_cents(value)
+
+    def has_changed(self, initial, data):
+        return super().has_changed(self.prepare_value(initial), data)
+
+
+class MoneyField(models.BigIntegerField):
+    description = "Amount in minor currency units (cents)"
+
+    def formfield(self, **kwargs):
+        # Skip IntegerField's min/max, which would be in cents.
+        return models.Field.formfield(self, **{"form_class": MoneyFormField, **kwargs})
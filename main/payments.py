@@ -0,0 +1,41 @@
+"""
+Lazy access to the Stripe SDK.
+
+Importing ``stripe`` is one of the most expensive parts of a worker boot,
+and most requests never touch checkout, so it is imported on first use.
+"""
+import logging
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+_stripe = None
+
+
+def get_stripe():
+    global _stripe
+    if _stripe is None:
+        import stripe
+
+        stripe.api_key = settings.STRIPE_SECRET_KEY
+        _stripe = stripe
+    return _stripe
+
+
+def checkout_status(session_id):
+    """
+    What became of a Checkout Session: "paid", "expired" (can no longer be
+    paid) or "open" (still payable, awaiting an async payment, or Stripe
+    couldn't be asked; try again later).
+    """
+    try:
+        session = get_stripe().checkout.Session.retrieve(session_id)
+    except Exception:
+        logger.exception("Could not look up checkout session %s", session_id)
+        return "open"
+    if session.payment_status in ("paid", "no_payment_required"):
+        return "paid"
+    if session.status == "expired":
+        return "expired"
+    return "open"
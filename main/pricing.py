@@ -0,0 +1,274 @@
+"""
+Bulk price changes as set-based UPDATEs.
+
+An adjustment (a percentage, an amount or a fixed price) plus a rounding
+rule becomes one SQL expression on price_cents. A storewide +10% rounded
+up to whole kronor is then a handful of statements, whatever the catalog
+size:
+
+    UPDATE main_product
+    SET price_cents = (((price_cents * 11000 + 5000) / 10000) + 99) / 100 * 100
+    WHERE id IN (...chunk...) AND NOT (price_cents = <same expression>)
+
+new_price() builds that expression from F("price_cents"), and the dry-run
+preview runs the same function on plain ints, so the preview shows exactly
+what the UPDATE will write. All the arithmetic is on integers (cents and
+basis points) and never goes negative, where SQL and Python integer
+division agree.
+
+Products are updated CHUNK_SIZE ids at a time, one short transaction per
+chunk, so no row locks are held across the whole catalog. save() and the
+post_save signals are skipped; the catalog version is bumped once at the
+end, or after the last committed chunk if one fails.
+"""
+import csv
+import io
+from collections import defaultdict
+from decimal import Decimal, InvalidOperation
+from typing import NamedTuple
+
+from django.db import transaction
+from django.db.models import BigIntegerField, Case, ExpressionWrapper, F, Value, When
+from django.db.models.functions import Greatest
+
+from .catalog import bump_catalog_version
+from .models import Product
+from .money import to_cents
+
+CHUNK_SIZE = 1000
+PREVIEW_ROWS = 100
+# Bounds on imported values, in currency units and percent.
+MAX_PRICE = Decimal("1000000")
+MAX_PERCENT = Decimal("1000")
+
+MODES = (
+    ("percent", "Change by percent"),
+    ("amount", "Change by amount"),
+    ("set", "Set price to"),
+)
+ROUNDINGS = (
+    ("", "No rounding"),
+    ("nearest", "To the nearest multiple of"),
+    ("up", "Up to a multiple of"),
+    ("down", "Down to a multiple of"),
+    ("ending", "Up to a price ending in"),
+)
+
+
+class PriceAdjustment(NamedTuple):
+    mode: str  # one of MODES
+    value: int  # basis points for percent (1000 = 10%), otherwise cents
+    rounding: str = ""  # one of ROUNDINGS
+    rounding_cents: int = 0  # the multiple, or the ending (95 = x.95)
+
+
+def _div(x, n):
+    # x is never negative, so floor (Python) and truncation (SQL) agree.
+    return x // n if isinstance(x, int) else x / Value(n)
+
+
+def _at_least(x, n):
+    return max(x, n) if isinstance(x, int) else Greatest(x, Value(n))
+
+
+def new_price(price, adjustment):
+    """``price`` (cents, or an expression such as F('price_cents')) after ``adjustment``."""
+    mode, value, rounding, step = adjustment
+    if mode == "percent":
+        # Half-up to the cent; value > -10000, so this stays >= 0.
+        price = _div(price * (10000 + value) + 5000, 10000)
+    elif mode == "amount":
+        price = _at_least(price + value, 0)
+    else:
+        price = value
+
+    if rounding == "nearest":
+        price = _div(price + step // 2, step) * step
+    elif rounding == "up":
+        price = _div(price + step - 1, step) * step
+    elif rounding == "down":
+        price = _div(price, step) * step
+    elif rounding == "ending":
+        # The smallest price >= this one whose cents are ``step``.
+        price = _div(_at_least(price - step, 0) + 99, 100) * 100 + step
+    return price
+
+
+def price_expression(adjustment):
+    expression = new_price(F("price_cents"), adjustment)
+    if isinstance(expression, int):
+        expression = Value(expression)
+    return ExpressionWrapper(expression, output_field=BigIntegerField())
+
+
+def _id_chunks(queryset, size=CHUNK_SIZE):
+    ids = queryset.order_by("pk").values_list("pk", flat=True)
+    last = 0
+    while chunk := list(ids.filter(pk__gt=last)[:size]):
+        yield chunk
+        last = chunk[-1]
+
+
+def _update(chunks):
+    """Run (ids, expression) updates, one transaction each; bump the catalog once."""
+    changed = 0
+    try:
+        for ids, expression in chunks:
+            with transaction.atomic():
+                # Rows already at their new price aren't rewritten (or counted).
+                changed += (
+                    Product.objects.filter(pk__in=ids)
+                    .exclude(price_cents=expression)
+                    .update(price_cents=expression)
+                )
+    finally:
+        # Also when a later chunk fails: the earlier ones are committed.
+        if changed:
+            bump_catalog_version()
+    return changed
+
+
+def update_prices(queryset, adjustment):
+    """Apply one adjustment to every product in ``queryset``; returns how many changed."""
+    expression = price_expression(adjustment)
+    return _update((ids, expression) for ids in _id_chunks(queryset))
+
+
+def update_prices_from_rows(rows):
+    """
+    Apply per-product adjustments, ``rows`` being (product id, adjustment)
+    pairs as from parse_csv(). Each chunk is one UPDATE with a CASE over
+    the distinct adjustments in it.
+    """
+
+    def chunks():
+        for start in range(0, len(rows), CHUNK_SIZE):
+            groups = defaultdict(list)
+            for pk, adjustment in rows[start:start + CHUNK_SIZE]:
+                groups[adjustment].append(pk)
+            whens = [When(pk__in=ids, then=price_expression(adj)) for adj, ids in groups.items()]
+            expression = Case(*whens, default=F("price_cents"), output_field=BigIntegerField())
+            yield [pk for ids in groups.values() for pk in ids], expression
+
+    return _update(chunks())
+
+
+def _preview(changes, limit):
+    """Summary of (id, name, old, new) tuples, with the first ``limit`` changes."""
+    result = {"rows": [], "changed": 0, "unchanged": 0, "old_total": 0, "new_total": 0}
+    for pk, name, old, new in changes:
+        result["old_total"] += old
+        result["new_total"] += new
+        if old == new:
+            result["unchanged"] += 1
+            continue
+        result["changed"] += 1
+        if len(result["rows"]) < limit:
+            result["rows"].append({"id": pk, "name": name, "old": old, "new": new, "diff": new - old})
+    return result
+
+
+def preview_prices(queryset, adjustment, limit=PREVIEW_ROWS):
+    """What update_prices() would do, without writing anything."""
+    products = queryset.order_by("pk").values_list("pk", "name", "price_cents").iterator(chunk_size=CHUNK_SIZE)
+    return _preview(
+        ((pk, name, price, new_price(price, adjustment)) for pk, name, price in products), limit
+    )
+
+
+def preview_rows(rows, limit=PREVIEW_ROWS):
+    """What update_prices_from_rows() would do, without writing anything."""
+
+    def changes():
+        for start in range(0, len(rows), CHUNK_SIZE):
+            chunk = rows[start:start + CHUNK_SIZE]
+            products = Product.objects.in_bulk([pk for pk, _ in chunk])
+            for pk, adjustment in chunk:
+                product = products[pk]
+                yield pk, product.name, product.price_cents, new_price(product.price_cents, adjustment)
+
+    return _preview(changes(), limit)
+
+
+def _parse_row(row, id_column, rounding, rounding_cents):
+    """(product id, PriceAdjustment) for one CSV row, or ValueError with the reason."""
+    try:
+        pk = int(row.get(id_column, ""))
+    except ValueError:
+        raise ValueError("no product id.")
+    values = [(column, row[column]) for column in ("price", "percent", "amount") if row.get(column)]
+    if len(values) != 1:
+        raise ValueError("give exactly one of price, percent or amount.")
+    column, value = values[0]
+    try:
+        number = Decimal(value)
+    except InvalidOperation:
+        raise ValueError(f"{value!r} is not a number.")
+    if not number.is_finite():
+        raise ValueError(f"{value!r} is not a number.")
+    if column == "percent" and not -100 < number <= MAX_PERCENT:
+        raise ValueError(f"the percent must be above -100 and at most {MAX_PERCENT}.")
+    if column == "price" and not 0 <= number <= MAX_PRICE:
+        raise ValueError(f"the price must be between 0 and {MAX_PRICE}.")
+    if column == "amount" and abs(number) > MAX_PRICE:
+        raise ValueError(f"the amount must be between -{MAX_PRICE} and {MAX_PRICE}.")
+    # to_cents turns a percent into basis points (12.5 -> 1250).
+    mode = "set" if column == "price" else column
+    return pk, PriceAdjustment(mode, to_cents(number), rounding, rounding_cents)
+
+
+def parse_csv(file, rounding="", rounding_cents=0):
+    """
+    Read a price CSV into ([(product id, PriceAdjustment)], [errors]).
+
+    The header names the columns: ``id`` (or ``product_id``) and, per row,
+    one of ``price`` (new price), ``percent`` (e.g. 10 or -12.5) or
+    ``amount`` (e.g. 5 or -2.50). Other columns, such as a name to keep
+    the file readable, are ignored. ``rounding`` applies to every row.
+    """
+    try:
+        text = file.read().decode("utf-8-sig")
+    except UnicodeDecodeError:
+        return [], ["The file isn't UTF-8 text (save it as \"CSV UTF-8\")."]
+    reader = csv.DictReader(io.StringIO(text, newline=""))
+    try:
+        fields = {name.strip().lower() for name in reader.fieldnames or ()}
+    except csv.Error as e:
+        return [], [f"Line 1: {e}."]
+    id_column = "id" if "id" in fields else "product_id"
+    if id_column not in fields or not fields & {"price", "percent", "amount"}:
+        return [], ["The header needs an id column and a price, percent or amount column."]
+
+    rows, errors, seen = [], [], set()
+    while True:
+        try:
+            raw = next(reader)
+        except StopIteration:
+            break
+        except csv.Error as e:
+            # line_num doesn't count the line that failed.
+            errors.append(f"Line {reader.line_num + 1}: {e}; the rest of the file was not read.")
+            break
+        line = reader.line_num
+        # Values beyond the header's columns are listed under None; ignore them.
+        row = {key.strip().lower(): (value or "").strip() for key, value in raw.items() if key is not None}
+        try:
+            pk, adjustment = _parse_row(row, id_column, rounding, rounding_cents)
+        except ValueError as e:
+            errors.append(f"Line {line}: {e}")
+            continue
+        if pk in seen:
+            errors.append(f"Line {line}: product {pk} is listed twice.")
+            continue
+        seen.add(pk)
+        rows.append((pk, adjustment))
+
+    known = set()
+    for start in range(0, len(rows), CHUNK_SIZE):
+        ids = [pk for pk, _ in rows[start:start + CHUNK_SIZE]]
+        known.update(Product.objects.filter(pk__in=ids).values_list("pk", flat=True))
+    unknown = [pk for pk, _ in rows if pk not in known]
+    if unknown:
+        errors.append(f"Unknown product ids: {', '.join(map(str, unknown[:20]))}{' …' if len(unknown) > 20 else ''}")
+        rows = [(pk, adjustment) for pk, adjustment in rows if pk in known]
+    return rows, errors
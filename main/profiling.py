@@ -0,0 +1,158 @@
+"""
+On-demand profiling of single requests, for staff.
+
+A request is run under cProfile when it asks for it:
+
+- ``?_profile=1`` from a logged-in staff user, or
+- an ``X-Profile`` header carrying a signed, short-lived token for a staff
+  user (shown on the Request profiles admin page), for curl or a load tool.
+
+The profile (a pstats dump plus a text summary, with the request's SQL
+count and time) is saved to default storage under profiles/ and listed in
+the admin; only the newest PROFILE_KEEP are kept. The response says where
+it went in an ``X-Profile-Id`` header.
+
+cProfile can only run one profiler per process at a time, so while one
+request is being profiled, others that ask are served unprofiled with an
+``X-Profile-Skipped`` header instead.
+
+Every other request costs one dict lookup and one substring test.
+"""
+import cProfile
+import io
+import marshal
+import pstats
+import threading
+import time
+import uuid
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core import signing
+from django.core.files.base import ContentFile
+from django.db import connections
+from django.utils.cache import patch_cache_control
+
+from .models import RequestProfile
+
+QUERY_PARAM = "_profile"
+HEADER = "HTTP_X_PROFILE"
+TOKEN_SALT = "main.profiling"
+TOKEN_MAX_AGE = 60 * 60
+SUMMARY_LINES = 40
+
+# Held while a request runs under cProfile (one active profiler per process).
+_profiling = threading.Lock()
+
+
+def make_token(user):
+    """Value for the X-Profile header, valid TOKEN_MAX_AGE seconds."""
+    return signing.TimestampSigner(salt=TOKEN_SALT).sign(str(user.pk))
+
+
+def _token_user(token):
+    try:
+        pk = signing.TimestampSigner(salt=TOKEN_SALT).unsign(token, max_age=TOKEN_MAX_AGE)
+    except signing.BadSignature:
+        return None
+    return User.objects.filter(pk=pk, is_staff=True, is_active=True).first()
+
+
+def profiling_user(request):
+    """The staff user who asked to profile this request, or None."""
+    token = request.META.get(HEADER)
+    if token:
+        return _token_user(token)
+    if QUERY_PARAM in request.META.get("QUERY_STRING", "") and request.GET.get(QUERY_PARAM):
+        user = getattr(request, "user", None)
+        if user is not None and user.is_staff:
+            return user
+    return None
+
+
+class _QueryTimer:
+    """connection.execute_wrapper counting queries and their time."""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - start
+
+
+def save_profile(request, response, user, profiler, elapsed, queries):
+    stats = pstats.Stats(profiler)
+    out = io.StringIO()
+    stats.stream = out
+    stats.sort_stats("cumulative").print_stats(SUMMARY_LINES)
+
+    profile = RequestProfile(
+        user=user,
+        method=request.method,
+        path=request.get_full_path()[:500],
+        status_code=response.status_code,
+        duration_ms=elapsed * 1000,
+        query_count=queries.count,
+        query_ms=queries.seconds * 1000,
+        summary=out.getvalue(),
+    )
+    name = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}.prof"
+    profile.profile.save(name, ContentFile(marshal.dumps(stats.stats)), save=False)
+    profile.save()
+    prune()
+    return profile
+
+
+def prune(keep=None):
+    """Delete all but the newest ``keep`` profiles (files go via post_delete)."""
+    keep = settings.PROFILE_KEEP if keep is None else keep
+    old = RequestProfile.objects.order_by("-created_at", "-id").values_list("pk", flat=True)[keep:]
+    for profile in RequestProfile.objects.filter(pk__in=list(old)):
+        profile.delete()
+
+
+class ProfilingMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if HEADER not in request.META and QUERY_PARAM not in request.META.get("QUERY_STRING", ""):
+            return self.get_response(request)
+        user = profiling_user(request)
+        if user is None:
+            return self.get_response(request)
+        if not _profiling.acquire(blocking=False):
+            response = self.get_response(request)
+            response["X-Profile-Skipped"] = "another request is being profiled"
+            patch_cache_control(response, private=True, no_cache=True)
+            return response
+        try:
+            return self._profile(request, user)
+        finally:
+            _profiling.release()
+
+    def _profile(self, request, user):
+        profiler = cProfile.Profile()
+        queries = _QueryTimer()
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(queries))
+            profiler.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                profiler.disable()
+        elapsed = time.perf_counter() - start
+
+        profile = save_profile(request, response, user, profiler, elapsed, queries)
+        response["X-Profile-Id"] = str(profile.pk)
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
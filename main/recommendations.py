@@ -0,0 +1,173 @@
+"""
+"Customers also bought" index.
+
+update_recommendations() folds new orders into ProductPairCount (pair
+co-occurrence counts) and rewrites ProductRecommendation.related_ids (the
+top-K other products) only for the products those orders touched. Pages
+then read recommendations with a single keyed query.
+"""
+from collections import Counter, defaultdict
+from itertools import combinations
+
+from django.db import connection, transaction
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+
+from .models import (
+    Order,
+    OrderItem,
+    Product,
+    ProductPairCount,
+    ProductRecommendation,
+    RollupWatermark,
+)
+from .rollups import SETTLE_DELAY
+
+WATERMARK = "recommendations"
+DEFAULT_BATCH_SIZE = 5000
+TOP_K = 10
+
+# Orders with more distinct products than this (bulk/wholesale) add noise
+# and quadratic work, so they are skipped.
+MAX_ORDER_PRODUCTS = 50
+
+
+def _pairs_for_orders(order_ids):
+    products_per_order = defaultdict(set)
+    rows = OrderItem.objects.filter(order_id__in=order_ids).values_list("order_id", "product_id")
+    for order_id, product_id in rows:
+        products_per_order[order_id].add(product_id)
+
+    pairs = Counter()
+    for products in products_per_order.values():
+        if len(products) > MAX_ORDER_PRODUCTS:
+            continue
+        for a, b in combinations(sorted(products), 2):
+            pairs[(a, b)] += 1
+            pairs[(b, a)] += 1
+    return pairs
+
+
+def _stored_counts(first_order_id, last_order_id):
+    """
+    Stored counts of the pairs bought together in the order id range.
+
+    An OrderItem self-join on order_id drives the lookup, so only pairs
+    that actually occur are read.
+    """
+    item = OrderItem._meta.db_table
+    pair = ProductPairCount._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT DISTINCT pc.product_id, pc.other_id, pc.count "
+            f"FROM {item} a "
+            f"JOIN {item} b ON b.order_id = a.order_id AND b.product_id <> a.product_id "
+            f"JOIN {pair} pc ON pc.product_id = a.product_id AND pc.other_id = b.product_id "
+            f"WHERE a.order_id BETWEEN %s AND %s",
+            [first_order_id, last_order_id],
+        )
+        return {(a, b): count for a, b, count in cursor.fetchall()}
+
+
+def _add_pair_counts(pairs, order_ids):
+    products = {a for a, _ in pairs}
+    existing = _stored_counts(order_ids[0], order_ids[-1])
+    ProductPairCount.objects.bulk_create(
+        [
+            ProductPairCount(product_id=a, other_id=b, count=existing.get((a, b), 0) + n)
+            for (a, b), n in pairs.items()
+        ],
+        batch_size=1000,
+        update_conflicts=True,
+        unique_fields=["product", "other"],
+        update_fields=["count"],
+    )
+    return products
+
+
+def refresh_top_k(product_ids, k=TOP_K):
+    """Recompute ProductRecommendation for ``product_ids`` in one query."""
+    ranked = (
+        ProductPairCount.objects.filter(product_id__in=product_ids)
+        .annotate(rank=Window(
+            RowNumber(),
+            partition_by=F("product_id"),
+            order_by=[F("count").desc(), F("other_id").asc()],
+        ))
+        .filter(rank__lte=k)
+        .order_by("product_id", "rank")
+        .values_list("product_id", "other_id")
+    )
+    related = defaultdict(list)
+    for product_id, other_id in ranked:
+        related[product_id].append(other_id)
+
+    ProductRecommendation.objects.bulk_create(
+        [ProductRecommendation(product_id=pid, related_ids=related.get(pid, [])) for pid in product_ids],
+        batch_size=1000,
+        update_conflicts=True,
+        unique_fields=["product"],
+        update_fields=["related_ids", "updated_at"],
+    )
+
+
+def update_recommendations(batch_size=DEFAULT_BATCH_SIZE, k=TOP_K, now=None):
+    """Fold settled orders above the watermark into the index. Returns orders processed."""
+    cutoff = (now or timezone.now()) - SETTLE_DELAY
+    processed = 0
+    while True:
+        with transaction.atomic():
+            mark, _ = RollupWatermark.objects.select_for_update().get_or_create(name=WATERMARK)
+            order_ids = list(
+                Order.objects.filter(id__gt=mark.last_id, date__lt=cutoff)
+                .order_by("id")
+                .values_list("id", flat=True)[:batch_size]
+            )
+            if not order_ids:
+                return processed
+            pairs = _pairs_for_orders(order_ids)
+            if pairs:
+                refresh_top_k(sorted(_add_pair_counts(pairs, order_ids)), k=k)
+            mark.last_id = order_ids[-1]
+            mark.save(update_fields=["last_id", "updated_at"])
+        processed += len(order_ids)
+
+
+def rebuild_recommendations(batch_size=DEFAULT_BATCH_SIZE, k=TOP_K, now=None):
+    with transaction.atomic():
+        ProductPairCount.objects.all().delete()
+        ProductRecommendation.objects.all().delete()
+        RollupWatermark.objects.filter(name=WATERMARK).delete()
+    return update_recommendations(batch_size=batch_size, k=k, now=now)
+
+
+def recommended_products(product_ids, exclude=(), limit=4):
+    """
+    Products most often bought together with ``product_ids``, best first.
+
+    One keyed lookup on ProductRecommendation plus one query for the
+    products themselves.
+    """
+    product_ids = list(product_ids)
+    if not product_ids:
+        return []
+    lists = dict(
+        ProductRecommendation.objects.filter(product_id__in=product_ids)
+        .values_list("product_id", "related_ids")
+    )
+
+    # Round-robin over the per-product lists so every cart item contributes.
+    skip = set(product_ids) | set(exclude)
+    ranked = []
+    depth = max((len(ids) for ids in lists.values()), default=0)
+    for i in range(depth):
+        for pid in product_ids:
+            ids = lists.get(pid, [])
+            if i < len(ids) and ids[i] not in skip:
+                skip.add(ids[i])
+                ranked.append(ids[i])
+    ranked = ranked[:limit]
+
+    products = Product.objects.in_bulk(ranked)
+    return [products[pid] for pid in ranked if pid in products]
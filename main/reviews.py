@@ -0,0 +1,108 @@
+"""
+Product reviews and their rating aggregates.
+
+Product.rating_count / rating_sum move with F() updates in the same
+transaction as the review change, so concurrent reviews can't lose an
+update and listings never need AVG/COUNT over the reviews table. Deletes
+(including cascades from a deleted user) are handled by the post_delete
+signal in main/signals.py. ``reconcile_ratings`` rebuilds the aggregates
+if they ever drift, e.g. after raw SQL.
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+
+from .catalog import bump_listing_version
+from .models import OrderItem, Product, Review
+
+
+class ReviewNotAllowed(Exception):
+    pass
+
+
+def has_purchased(user, product_id):
+    return (
+        user.is_authenticated
+        and OrderItem.objects.filter(order__user=user, product_id=product_id).exists()
+    )
+
+
+def adjust_rating(product_id, count, total):
+    Product.objects.filter(pk=product_id).update(
+        rating_count=F("rating_count") + count,
+        rating_sum=F("rating_sum") + total,
+    )
+
+
+def save_review(user, product_id, rating, body=""):
+    """
+    Create or update ``user``'s review of a product they bought.
+
+    Returns (review, created); raises ReviewNotAllowed without a purchase.
+    """
+    if not has_purchased(user, product_id):
+        raise ReviewNotAllowed(product_id)
+    with transaction.atomic():
+        reviews = Review.objects.select_for_update().filter(product_id=product_id, user=user)
+        review = reviews.first()
+        created = False
+        if review is None:
+            try:
+                # A savepoint, so losing the race below leaves the transaction usable.
+                with transaction.atomic():
+                    review = Review.objects.create(product_id=product_id, user=user, rating=rating, body=body)
+                created = True
+            except IntegrityError:
+                # A concurrent request created it first; update that one instead.
+                review = reviews.first()
+                if review is None:
+                    raise
+        if created:
+            adjust_rating(product_id, 1, rating)
+        else:
+            delta = rating - review.rating
+            review.rating, review.body = rating, body
+            review.save(update_fields=["rating", "body"])
+            if delta:
+                adjust_rating(product_id, 0, delta)
+        # Listings show the stars.
+        bump_listing_version()
+    return review, created
+
+
+def reconcile_ratings(batch_size=500):
+    """
+    Recompute every product's aggregates from its reviews, a batch of
+    products per transaction. Returns how many products were corrected.
+
+    The product rows are locked before counting, so a review saved at the
+    same time either is counted here or applies its increment afterwards.
+    """
+    fixed = 0
+    last_id = 0
+    while True:
+        with transaction.atomic():
+            products = list(
+                Product.objects.select_for_update()
+                .filter(pk__gt=last_id)
+                .order_by("pk")
+                .values_list("pk", "rating_count", "rating_sum")[:batch_size]
+            )
+            if not products:
+                break
+            last_id = products[-1][0]
+            actual = {
+                row["product_id"]: (row["count"], row["total"])
+                for row in Review.objects.filter(product_id__in=[p[0] for p in products])
+                .values("product_id")
+                .annotate(count=Count("id"), total=Sum("rating"))
+            }
+            wrong = [
+                Product(pk=pk, rating_count=actual.get(pk, (0, 0))[0], rating_sum=actual.get(pk, (0, 0))[1])
+                for pk, count, total in products
+                if (count, total) != actual.get(pk, (0, 0))
+            ]
+            if wrong:
+                Product.objects.bulk_update(wrong, ["rating_count", "rating_sum"])
+                bump_listing_version()
+            fixed += len(wrong)
+    return fixed
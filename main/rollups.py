@@ -0,0 +1,125 @@
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import BigIntegerField, Count, ExpressionWrapper, F, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import (
+    DailyCouponSales,
+    DailyProductSales,
+    DailySales,
+    Order,
+    OrderItem,
+    RollupWatermark,
+)
+
+WATERMARK = "sales"
+DEFAULT_BATCH_SIZE = 5000
+
+# Orders younger than this may still be getting their lines written by
+# cart_view, so they are left for the next run.
+SETTLE_DELAY = timedelta(minutes=5)
+
+
+def _increment(model, lookup, values):
+    """Add ``values`` to the rollup row identified by ``lookup``."""
+    obj, created = model.objects.select_for_update().get_or_create(**lookup, defaults=values)
+    if not created:
+        model.objects.filter(pk=obj.pk).update(
+            **{field: F(field) + amount for field, amount in values.items()}
+        )
+
+
+def _apply_batch(order_ids):
+    orders = Order.objects.filter(id__in=order_ids)
+    items = OrderItem.objects.filter(order_id__in=order_ids)
+    line_total = ExpressionWrapper(
+        F("price_cents") * F("quantity"),
+        output_field=BigIntegerField(),
+    )
+
+    daily = (
+        orders.annotate(day=TruncDate("date")).values("day")
+        .annotate(
+            n=Count("id"),
+            revenue=Sum("total_cents"),
+            discount=Sum("discount_cents"),
+            gifts=Count("id", filter=Q(gift_cents__gt=0)),
+            gift_total=Sum("gift_cents"),
+        )
+        .order_by()
+    )
+    units_per_day = dict(
+        items.annotate(day=TruncDate("order__date")).values("day")
+        .annotate(units=Sum("quantity"))
+        .order_by()
+        .values_list("day", "units")
+    )
+    for row in daily:
+        _increment(DailySales, {"day": row["day"]}, {
+            "orders": row["n"],
+            "units": units_per_day.get(row["day"]) or 0,
+            "revenue_cents": row["revenue"] or 0,
+            "discount_cents": row["discount"] or 0,
+            "gift_certificates": row["gifts"],
+            "gift_cents": row["gift_total"] or 0,
+        })
+
+    per_product = (
+        items.annotate(day=TruncDate("order__date")).values("day", "product_id")
+        .annotate(units=Sum("quantity"), revenue=Sum(line_total))
+        .order_by()
+    )
+    for row in per_product:
+        _increment(DailyProductSales, {"day": row["day"], "product_id": row["product_id"]}, {
+            "units": row["units"] or 0,
+            "revenue_cents": row["revenue"] or 0,
+        })
+
+    per_coupon = (
+        orders.filter(coupon__isnull=False)
+        .annotate(day=TruncDate("date")).values("day", "coupon_id")
+        .annotate(n=Count("id"), discount=Sum("discount_cents"))
+        .order_by()
+    )
+    for row in per_coupon:
+        _increment(DailyCouponSales, {"day": row["day"], "coupon_id": row["coupon_id"]}, {
+            "orders": row["n"],
+            "discount_cents": row["discount"] or 0,
+        })
+
+
+def update_sales_rollups(batch_size=DEFAULT_BATCH_SIZE, now=None):
+    """
+    Fold every settled order above the watermark into the rollup tables.
+
+    Each batch is applied in its own transaction together with the
+    watermark bump, so an interrupted run never double counts.
+    Returns the number of orders processed.
+    """
+    cutoff = (now or timezone.now()) - SETTLE_DELAY
+    processed = 0
+    while True:
+        with transaction.atomic():
+            mark, _ = RollupWatermark.objects.select_for_update().get_or_create(name=WATERMARK)
+            order_ids = list(
+                Order.objects.filter(id__gt=mark.last_id, date__lt=cutoff)
+                .order_by("id")
+                .values_list("id", flat=True)[:batch_size]
+            )
+            if not order_ids:
+                return processed
+            _apply_batch(order_ids)
+            mark.last_id = order_ids[-1]
+            mark.save(update_fields=["last_id", "updated_at"])
+        processed += len(order_ids)
+
+
+def rebuild_sales_rollups(batch_size=DEFAULT_BATCH_SIZE, now=None):
+    with transaction.atomic():
+        DailySales.objects.all().delete()
+        DailyProductSales.objects.all().delete()
+        DailyCouponSales.objects.all().delete()
+        RollupWatermark.objects.filter(name=WATERMARK).delete()
+    return update_sales_rollups(batch_size=batch_size, now=now)
@@ -0,0 +1,226 @@
+"""
+In-process typeahead index over product names and descriptions.
+
+Each worker holds one immutable SuggestIndex:
+
+- ``terms``: the sorted, distinct words of the catalog. A prefix is a
+  range found with two bisects, which is what a trie would give us
+  without a node object per character.
+- ``postings``: per term, the (product, weight) pairs it occurs in, name
+  hits first and at most MAX_POSTINGS of them. Name words weigh more than
+  description words.
+- ``trigrams``: trigram -> terms, for typo-tolerant matches when no word
+  starts with what was typed.
+
+A background thread builds the index, then re-reads the catalog version
+every SUGGEST_REFRESH_SECONDS and swaps in a freshly built index when it
+has changed. Requests only read the current index, so typeahead traffic
+never touches the database; until the first build is done suggestions are
+empty (gunicorn starts the thread when a worker starts, see
+gunicorn.conf.py, so neither boot nor requests wait for it).
+
+Build time and memory grow with the catalog and are paid by every worker,
+so a catalog larger than SUGGEST_MAX_PRODUCTS only indexes that many
+products, best sellers of the last SALES_DAYS first. Memory and lookup
+time are further bounded by indexing only the first MAX_DESCRIPTION_TERMS
+words of each description, truncating long words and capping postings per
+word: a word in thousands of products only needs to point at enough of
+them to fill a suggestion list.
+"""
+import bisect
+import heapq
+import logging
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import Q, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .catalog import catalog_version
+from .models import Product
+
+logger = logging.getLogger(__name__)
+
+MAX_DESCRIPTION_TERMS = 40
+MAX_TERM_LENGTH = 32
+MAX_POSTINGS = 200
+# A one-letter prefix can match most of the vocabulary; stop expanding there.
+MAX_PREFIX_TERMS = 100
+FUZZY_MIN_LENGTH = 3
+FUZZY_MIN_SIMILARITY = 0.5
+# Sales window that picks the products indexed in a capped index.
+SALES_DAYS = 90
+
+NAME_WEIGHT = 3
+DESCRIPTION_WEIGHT = 1
+
+_WORD = re.compile(r"\w+")
+
+
+def normalize(text):
+    """Lowercase, without accents: 'Söt Lakrits' -> 'sot lakrits'."""
+    text = unicodedata.normalize("NFKD", text.casefold())
+    return "".join(ch for ch in text if not unicodedata.combining(ch))
+
+
+def tokenize(text):
+    return [word[:MAX_TERM_LENGTH] for word in _WORD.findall(normalize(text or ""))]
+
+
+def _trigrams(term):
+    padded = f" {term} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class SuggestIndex:
+    def __init__(self, version, rows):
+        self.version = version
+        self.products = []
+        weights = defaultdict(dict)
+        for pk, name, description in rows:
+            idx = len(self.products)
+            self.products.append((pk, name))
+            for term in tokenize(description)[:MAX_DESCRIPTION_TERMS]:
+                weights[term][idx] = DESCRIPTION_WEIGHT
+            for term in tokenize(name):
+                weights[term][idx] = NAME_WEIGHT
+
+        # Ties in score go alphabetically.
+        by_name = sorted(range(len(self.products)), key=lambda idx: self.products[idx][1].casefold())
+        self.rank = [0] * len(self.products)
+        for position, idx in enumerate(by_name):
+            self.rank[idx] = position
+
+        self.terms = sorted(weights)
+        self.postings = [
+            tuple(sorted(weights[term].items(), key=lambda p: (-p[1], self.rank[p[0]]))[:MAX_POSTINGS])
+            for term in self.terms
+        ]
+        trigrams = defaultdict(list)
+        for term_id, term in enumerate(self.terms):
+            for gram in _trigrams(term):
+                trigrams[gram].append(term_id)
+        self.trigrams = {gram: tuple(ids) for gram, ids in trigrams.items()}
+
+    def _prefix_terms(self, prefix):
+        start = bisect.bisect_left(self.terms, prefix)
+        end = bisect.bisect_left(self.terms, prefix + "\uffff", start)
+        return range(start, min(end, start + MAX_PREFIX_TERMS))
+
+    def _fuzzy_terms(self, word):
+        if len(word) < FUZZY_MIN_LENGTH:
+            return []
+        grams = _trigrams(word)
+        overlap = defaultdict(int)
+        for gram in grams:
+            for term_id in self.trigrams.get(gram, ()):
+                overlap[term_id] += 1
+        matches = []
+        for term_id, shared in overlap.items():
+            # Dice coefficient; a term of n letters has n trigrams.
+            similarity = 2 * shared / (len(grams) + len(self.terms[term_id]))
+            if similarity >= FUZZY_MIN_SIMILARITY:
+                matches.append(term_id)
+        return matches
+
+    def _scores(self, words, expand):
+        scores = None
+        for word in words:
+            word_scores = {}
+            for term_id in expand(word):
+                exact = self.terms[term_id] == word
+                for idx, weight in self.postings[term_id]:
+                    score = weight + exact
+                    if score > word_scores.get(idx, 0):
+                        word_scores[idx] = score
+            if scores is None:
+                scores = word_scores
+            else:
+                # Every word has to match.
+                scores = {idx: scores[idx] + s for idx, s in word_scores.items() if idx in scores}
+            if not scores:
+                return {}
+        return scores or {}
+
+    def suggest(self, query, limit=8):
+        """[(product id, name), ...] best first, for a partly typed query."""
+        words = tokenize(query)
+        if not words:
+            return []
+        scores = self._scores(words, self._prefix_terms) or self._scores(words, self._fuzzy_terms)
+        best = heapq.nsmallest(limit, scores, key=lambda idx: (-scores[idx], self.rank[idx]))
+        return [self.products[idx] for idx in best]
+
+
+def indexed_products(limit=None):
+    """(pk, name, description) rows to index: all, or the ``limit`` best sellers."""
+    limit = settings.SUGGEST_MAX_PRODUCTS if limit is None else limit
+    products = Product.objects.all()
+    if limit and products.count() > limit:
+        since = timezone.localdate() - timedelta(days=SALES_DAYS)
+        products = products.annotate(
+            sold=Coalesce(Sum("daily_sales__units", filter=Q(daily_sales__day__gte=since)), 0)
+        ).order_by("-sold", "-rating_count", "-created_at", "-pk")[:limit]
+    else:
+        products = products.order_by("pk")
+    return products.values_list("pk", "name", "description").iterator(chunk_size=2000)
+
+
+def build_index(version=None, limit=None):
+    version = catalog_version() if version is None else version
+    return SuggestIndex(version, indexed_products(limit))
+
+
+# --- the worker's current index ---
+_index = None
+_owner_pid = None
+_lock = threading.Lock()
+
+
+def _refresh():
+    global _index
+    version = catalog_version()
+    if _index is None or _index.version != version:
+        _index = build_index(version)
+
+
+def _refresh_loop():
+    while True:
+        try:
+            _refresh()
+        except Exception:
+            logger.exception("Rebuilding the suggest index failed; keeping the old one.")
+        finally:
+            connections.close_all()
+        time.sleep(settings.SUGGEST_REFRESH_SECONDS)
+
+
+def start():
+    """Start building and refreshing the index in this process (idempotent, doesn't wait)."""
+    global _owner_pid
+    with _lock:
+        if _owner_pid == os.getpid():
+            return
+        # Threads don't survive fork: each worker starts its own.
+        _owner_pid = os.getpid()
+        threading.Thread(target=_refresh_loop, name="suggest-index", daemon=True).start()
+
+
+def ready():
+    return _index is not None
+
+
+def suggest(query, limit=8):
+    if _owner_pid != os.getpid():
+        # Only without the gunicorn hook (runserver).
+        start()
+    index = _index
+    return index.suggest(query, limit) if index is not None else []
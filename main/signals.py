@@ -0,0 +1,26 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .catalog import bump_catalog_version, bump_listing_version
+from .models import Category, Product, RequestProfile, Review
+from .reviews import adjust_rating
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def product_changed(sender, **kwargs):
+    bump_catalog_version()
+
+
+@receiver(post_delete, sender=Review)
+def review_deleted(sender, instance, **kwargs):
+    # Runs inside the delete's transaction, for admin and cascade deletes too.
+    adjust_rating(instance.product_id, -1, -instance.rating)
+    bump_listing_version()
+
+
+@receiver(post_delete, sender=RequestProfile)
+def request_profile_deleted(sender, instance, **kwargs):
+    instance.profile.delete(save=False)
@@ -0,0 +1,258 @@
+"""
+Slow-query log.
+
+Every database connection gets an execute wrapper (installed when the
+connection opens) that times each statement. One taking SLOW_QUERY_MS or
+longer is:
+
+- logged to the ``main.slow_queries`` logger;
+- fingerprinted: literals become ?, IN lists collapse and whitespace is
+  folded, so one ORM statement with different values is one entry;
+- EXPLAINed on the same connection. Only SELECTs are explained.
+  SLOW_QUERY_EXPLAIN_ANALYZE adds ANALYZE on Postgres, which runs the
+  query a second time;
+- tagged with the view it ran under and the innermost project frame
+  that issued it;
+- added to the SlowQuery row for its fingerprint. The admin lists these
+  rows by total time.
+
+Inside a request, SlowQueryMiddleware writes the rows after the response,
+outside the request's transactions, so logging never adds writes or row
+locks to the transaction being measured. Elsewhere (management commands)
+they wait for the end of the next request or for the process to exit,
+folded per fingerprint and capped at MAX_DEFERRED fingerprints so a
+long-running command can't grow the buffer without bound.
+SLOW_QUERY_MS = 0 turns the log off.
+"""
+import atexit
+import hashlib
+import logging
+import re
+import threading
+import time
+import traceback
+from contextlib import ExitStack
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.backends.signals import connection_created
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .models import SlowQuery
+
+logger = logging.getLogger(__name__)
+
+# Set while we run our own EXPLAIN or writes, so they aren't timed.
+_busy = ContextVar("slow_query_busy", default=False)
+# Entries waiting for the end of the current request.
+_pending = ContextVar("slow_query_pending", default=None)
+_view = ContextVar("slow_query_view", default="")
+# Entries from outside requests, by fingerprint (repeats add to "count"
+# and "total_ms"). Writing them from inside the wrapper could commit under
+# a cursor that is still being read, so they wait for the next request to
+# finish or for the process to exit.
+MAX_DEFERRED = 500
+_deferred = {}
+_dropped = 0
+_deferred_lock = threading.Lock()
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_SPACE = re.compile(r"\s+")
+_STATEMENT = re.compile(r"\s*(SELECT|INSERT|UPDATE|DELETE|WITH)\b", re.IGNORECASE)
+
+
+def normalize(sql):
+    """SQL with literals and placeholders as ?, IN lists as (...)."""
+    sql = _STRING.sub("?", sql)
+    sql = _NUMBER.sub("?", sql.replace("%s", "?"))
+    sql = _IN_LIST.sub("(...)", sql)
+    return _SPACE.sub(" ", sql).strip()
+
+
+def fingerprint(normalized_sql):
+    return hashlib.md5(normalized_sql.encode()).hexdigest()
+
+
+def _location():
+    """'main/views.py:123 in cart_view': the innermost project frame."""
+    base = str(settings.BASE_DIR) + "/"
+    for frame in reversed(traceback.extract_stack()):
+        filename = frame.filename
+        if filename.startswith(base) and "site-packages" not in filename and filename != __file__:
+            return f"{filename[len(base):]}:{frame.lineno} in {frame.name}"[:300]
+    return ""
+
+
+def _explain(connection, sql, params):
+    if not sql.lstrip()[:6].upper() == "SELECT":
+        return ""
+    options = {}
+    if settings.SLOW_QUERY_EXPLAIN_ANALYZE and connection.vendor == "postgresql":
+        options["analyze"] = True
+    try:
+        with ExitStack() as stack:
+            if connection.in_atomic_block:
+                # A savepoint, so a failing EXPLAIN can't break the caller's transaction.
+                stack.enter_context(transaction.atomic(using=connection.alias))
+            with connection.cursor() as cursor:
+                cursor.execute(f"{connection.ops.explain_query_prefix(**options)} {sql}", params)
+                rows = cursor.fetchall()
+    except Exception as e:
+        return f"EXPLAIN failed: {e}"
+    return "\n".join(" ".join(str(col) for col in row) for row in rows)
+
+
+def _slow(sql, params, many, connection, elapsed_ms):
+    token = _busy.set(True)
+    try:
+        normalized = normalize(sql)
+        entry = {
+            "fingerprint": fingerprint(normalized),
+            "sql": normalized,
+            "ms": elapsed_ms,
+            "view": _view.get(),
+            "location": _location(),
+            "explain": "" if many else _explain(connection, sql, params),
+        }
+        logger.warning(
+            "Slow query %.0f ms [%s] %s at %s: %s",
+            elapsed_ms, entry["fingerprint"][:8], entry["view"] or "-", entry["location"] or "-", normalized[:500],
+        )
+        pending = _pending.get()
+        if pending is not None:
+            pending.append(entry)
+        else:
+            _defer(entry)
+    except Exception:
+        logger.exception("Could not record a slow query.")
+    finally:
+        _busy.reset(token)
+
+
+def _defer(entry):
+    global _dropped
+    with _deferred_lock:
+        kept = _deferred.get(entry["fingerprint"])
+        if kept is None:
+            if len(_deferred) >= MAX_DEFERRED:
+                _dropped += 1
+                return
+            _deferred[entry["fingerprint"]] = {**entry, "count": 1, "total_ms": entry["ms"]}
+            return
+        kept["count"] += 1
+        kept["total_ms"] += entry["ms"]
+        if entry["ms"] > kept["ms"]:
+            # Keep the details of the slowest run.
+            kept.update(entry)
+
+
+def _timed(execute, sql, params, many, context):
+    if _busy.get():
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        # Only statements, not BEGIN/SAVEPOINT issued while a transaction starts.
+        if elapsed_ms >= settings.SLOW_QUERY_MS and _STATEMENT.match(sql):
+            _slow(sql, params, many, context["connection"], elapsed_ms)
+
+
+def record(entries):
+    """
+    Add slow statements to their SlowQuery rows. An entry stands for
+    ``count`` runs (default 1) taking ``total_ms`` together, ``ms`` being
+    the slowest.
+    """
+    token = _busy.set(True)
+    try:
+        now = timezone.now()
+        for entry in entries:
+            count, total_ms = entry.get("count", 1), entry.get("total_ms", entry["ms"])
+            rows = SlowQuery.objects.filter(fingerprint=entry["fingerprint"])
+            details = {key: entry[key] for key in ("sql", "view", "location", "explain")}
+            # Keep the details of the slowest run.
+            rows.filter(max_ms__lt=entry["ms"]).update(**details)
+            updated = rows.update(
+                count=F("count") + count,
+                total_ms=F("total_ms") + total_ms,
+                max_ms=Greatest("max_ms", Value(entry["ms"])),
+                last_seen=now,
+            )
+            if updated:
+                continue
+            try:
+                with transaction.atomic():
+                    SlowQuery.objects.create(
+                        fingerprint=entry["fingerprint"], count=count, total_ms=total_ms,
+                        max_ms=entry["ms"], last_seen=now, **details,
+                    )
+            except IntegrityError:
+                # Another worker created it first.
+                rows.update(count=F("count") + count, total_ms=F("total_ms") + total_ms, last_seen=now)
+    finally:
+        _busy.reset(token)
+
+
+def flush():
+    """Write the entries collected outside requests."""
+    global _dropped
+    with _deferred_lock:
+        entries = list(_deferred.values())
+        _deferred.clear()
+        dropped, _dropped = _dropped, 0
+    if dropped:
+        logger.warning(
+            "%d slow queries were not recorded: over %d new fingerprints outside requests.", dropped, MAX_DEFERRED
+        )
+    if entries:
+        try:
+            record(entries)
+        except Exception:
+            logger.exception("Could not record slow queries.")
+
+
+atexit.register(flush)
+
+
+def _install(sender, connection, **kwargs):
+    # First in the list: connection.execute_wrapper() blocks pop from the end.
+    if settings.SLOW_QUERY_MS and _timed not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, _timed)
+
+
+connection_created.connect(_install, dispatch_uid="main.slow_queries.install")
+
+
+class SlowQueryMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        pending = []
+        pending_token = _pending.set(pending)
+        view_token = _view.set(request.path[:200])
+        try:
+            response = self.get_response(request)
+        finally:
+            _view.reset(view_token)
+            _pending.reset(pending_token)
+        if pending:
+            try:
+                record(pending)
+            except Exception:
+                logger.exception("Could not record slow queries.")
+        if _deferred:
+            flush()
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        match = request.resolver_match
+        if match is not None:
+            _view.set(match.view_name[:200])
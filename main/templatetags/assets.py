@@ -0,0 +1,26 @@
+from functools import lru_cache
+
+from django import template
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.utils.safestring import mark_safe
+
+from candy_shop.storage import CRITICAL_OUTPUT
+
+register = template.Library()
+
+
+@lru_cache(maxsize=1)
+def _read_critical_css():
+    if not staticfiles_storage.exists(CRITICAL_OUTPUT):
+        return ""
+    with staticfiles_storage.open(CRITICAL_OUTPUT) as fh:
+        return fh.read().decode("utf-8")
+
+
+@register.simple_tag
+def critical_css():
+    """Critical CSS written by collectstatic, or '' when there is none (local dev)."""
+    if settings.DEBUG:
+        return ""
+    return mark_safe(_read_critical_css())
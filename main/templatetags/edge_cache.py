@@ -0,0 +1,17 @@
+from django import template
+from django.template.defaulttags import CsrfTokenNode
+from django.utils.html import format_html
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def lazy_csrf_token(context):
+    """
+    {% csrf_token %}, except on shared-cached pages where an empty field is
+    rendered and main.js fills it from /session-state/.
+    """
+    request = context.get("request")
+    if getattr(request, "anonymous_cacheable", False):
+        return format_html('<input type="hidden" name="csrfmiddlewaretoken" value="" data-csrf-token>')
+    return CsrfTokenNode().render(context)
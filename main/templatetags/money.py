@@ -0,0 +1,30 @@
+from django import template
+
+from main.currency import get_currency, price_of
+from main.money import format_money, format_price
+
+register = template.Library()
+
+
+@register.filter
+def money(cents, currency=None):
+    """
+    {{ order.total_cents|money }} -> '12.50';
+    {{ line_cents|money:currency }} -> '$12.50' (cents already in ``currency``).
+    """
+    if currency:
+        return format_price(cents, currency)
+    return format_money(cents)
+
+
+@register.simple_tag(takes_context=True)
+def price(context, product):
+    """{% price product %} -> the product's price in the visitor's currency."""
+    currency = get_currency(context["request"])
+    return format_price(price_of(product, currency), currency)
+
+
+@register.filter
+def charged(cents, order):
+    """{{ item.price_cents|charged:order }} -> the amount in what ``order`` was paid in."""
+    return format_price(order.charged(cents), order.charged_currency)
@@ -0,0 +1,21 @@
+from django import template
+
+from main.images import image_sources, thumbnail_height, thumbnail_widths
+
+register = template.Library()
+
+# The product grid renders cards at roughly 300px wide on desktop and full
+# width on phones.
+DEFAULT_SIZES = "(max-width: 600px) 100vw, 300px"
+
+
+@register.inclusion_tag("main/includes/product_image.html")
+def product_image(product, sizes=DEFAULT_SIZES):
+    context = {"product": product, "sources": image_sources(product), "sizes": sizes}
+    if context["sources"]:
+        # Explicit dimensions of the smallest variant let the browser reserve
+        # the right aspect ratio before the image arrives.
+        width = thumbnail_widths(product.image_width)[0]
+        context["width"] = width
+        context["height"] = thumbnail_height(product, width)
+    return context
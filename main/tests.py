@@ -1,3 +1,1115 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import os
+import tempfile
+import tracemalloc
+import uuid
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.contrib.auth.models import User
+from home.models import Message
+from django.core.management import call_command
+from django.db import DatabaseError, connection, connections, router, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.db.models import QuerySet
+from django.http import HttpResponse
+from django.test import Client, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import db_router, facets, inventory, maintenance, memory, profiling, ratelimit, slow_queries
+from .admin import ProductAdmin
+from .catalog import bump_catalog_version, catalog_page_etag
+from .currency import price_of
+from .exports import iter_csv_rows, iter_jsonl_lines, iter_orders_with_items
+from .images import image_sources
+from .models import Category, CatalogVersion, Coupon, DailyCouponSales, DailyProductSales, DailySales, Order, OrderItem, Product, ProductPairCount, Review, RequestProfile, SlowQuery, StockReservation
+from .paginators import ESTIMATE_THRESHOLD, EstimatedCountPaginator
+from .pricing import (
+    PriceAdjustment,
+    new_price,
+    parse_csv,
+    preview_prices,
+    preview_rows,
+    update_prices,
+    update_prices_from_rows,
+)
+from .recommendations import _stored_counts, recommended_products, update_recommendations
+from .reviews import adjust_rating, reconcile_ratings, save_review
+from .rollups import rebuild_sales_rollups, update_sales_rollups
+from .search_index import build_index
+
+FIXTURE = str(settings.BASE_DIR / "products.json")
+
+
+class MoneyMigrationTests(TransactionTestCase):
+    fixtures = [FIXTURE]
+
+    def _migrate(self, target):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(target)
+        return executor.loader.project_state(target).apps
+
+    def test_cents_round_trip(self):
+        Product.objects.filter(pk=1).update(price_cents=137)
+        cents = dict(Product.objects.values_list("pk", "price_cents"))
+        latest = MigrationExecutor(connection).loader.graph.leaf_nodes("main")
+
+        try:
+            old_apps = self._migrate([("main", "0017_product_reviews")])
+            prices = dict(old_apps.get_model("main", "Product").objects.values_list("pk", "price"))
+            self.assertEqual(prices[1], Decimal("1.37"))
+            self.assertEqual({pk: int(price * 100) for pk, price in prices.items()}, cents)
+        finally:
+            self._migrate(latest)
+
+        self.assertEqual(dict(Product.objects.values_list("pk", "price_cents")), cents)
+
+
+class PriceCsvTests(TestCase):
+    fixtures = [FIXTURE]
+
+    def parse(self, data):
+        return parse_csv(io.BytesIO(data))
+
+    def test_valid_rows(self):
+        rows, errors = self.parse(b"id,name,price,percent,amount\n1,x,12.50,,\n2,y,,-10,\n3,z,,,2\n")
+        self.assertEqual(errors, [])
+        self.assertEqual(rows, [
+            (1, PriceAdjustment("set", 1250)),
+            (2, PriceAdjustment("percent", -1000)),
+            (3, PriceAdjustment("amount", 200)),
+        ])
+
+    def test_malformed_files_are_reported_not_raised(self):
+        cases = {
+            # More values than header columns: the extras are ignored.
+            b"id,price\n1,2,3,4\n": [],
+            "id,price\n1,\xe5\n".encode("latin-1"): ["The file isn't UTF-8 text (save it as \"CSV UTF-8\")."],
+            b"id,price\n1,NaN\n2,1e30\n3,Infinity\n": [
+                "Line 2: 'NaN' is not a number.",
+                "Line 3: the price must be between 0 and 1000000.",
+                "Line 4: 'Infinity' is not a number.",
+            ],
+            b"id,percent\n1,-100\n": ["Line 2: the percent must be above -100 and at most 1000."],
+            b"id,price\nabc,1\n1,1\n1,2\n": ["Line 2: no product id.", "Line 4: product 1 is listed twice."],
+            b"id,price\n999999,1\n": ["Unknown product ids: 999999"],
+            b"foo,bar\n1,2\n": ["The header needs an id column and a price, percent or amount column."],
+        }
+        for data, expected in cases.items():
+            with self.subTest(data=data):
+                self.assertEqual(self.parse(data)[1], expected)
+
+    def test_field_too_large_is_a_line_error(self):
+        limit = csv.field_size_limit()
+        csv.field_size_limit(10)
+        try:
+            rows, errors = self.parse(b"id,price\n1,2\n2,\"" + b"9" * 20 + b"\"\n")
+        finally:
+            csv.field_size_limit(limit)
+        self.assertEqual(len(rows), 1)
+        self.assertTrue(errors[0].startswith("Line 3: "))
+
+
+class NewPriceTests(TestCase):
+    def test_rules(self):
+        cases = [
+            (PriceAdjustment("percent", 1000), 299, 329),  # 328.9 half-up
+            (PriceAdjustment("percent", -1250), 200, 175),
+            (PriceAdjustment("percent", -9999), 100, 0),
+            (PriceAdjustment("amount", -500), 299, 0),  # never below zero
+            (PriceAdjustment("amount", 101), 299, 400),
+            (PriceAdjustment("set", 1999), 5, 1999),
+            (PriceAdjustment("set", 1249, "nearest", 100), 0, 1200),
+            (PriceAdjustment("set", 1250, "nearest", 100), 0, 1300),
+            (PriceAdjustment("set", 1201, "up", 50), 0, 1250),
+            (PriceAdjustment("set", 1200, "up", 50), 0, 1200),
+            (PriceAdjustment("set", 1299, "down", 100), 0, 1200),
+            (PriceAdjustment("set", 1201, "ending", 95), 0, 1295),
+            (PriceAdjustment("set", 1295, "ending", 95), 0, 1295),
+            (PriceAdjustment("set", 1296, "ending", 95), 0, 1395),
+            (PriceAdjustment("set", 10, "ending", 95), 0, 95),
+            (PriceAdjustment("set", 1201, "ending", 0), 0, 1300),
+        ]
+        for adjustment, price, expected in cases:
+            with self.subTest(adjustment=adjustment, price=price):
+                self.assertEqual(new_price(price, adjustment), expected)
+
+
+def stored_catalog_version(field="version"):
+    # Not catalog_version(): the cache is only cleared on commit.
+    return getattr(CatalogVersion.objects.get(pk=1), field)
+
+
+class BulkPriceUpdateTests(TestCase):
+    fixtures = [FIXTURE]
+
+    ADJUSTMENTS = [
+        PriceAdjustment("percent", 1000),
+        PriceAdjustment("percent", -1250, "nearest", 100),
+        PriceAdjustment("amount", -250, "up", 50),
+        PriceAdjustment("amount", 333, "down", 100),
+        PriceAdjustment("percent", 733, "ending", 95),
+        PriceAdjustment("set", 1999, "ending", 0),
+    ]
+
+    def prices(self):
+        return dict(Product.objects.values_list("pk", "price_cents"))
+
+    def test_update_matches_preview(self):
+        for adjustment in self.ADJUSTMENTS:
+            with self.subTest(adjustment=adjustment), transaction.atomic():
+                before = self.prices()
+                preview = preview_prices(Product.objects.all(), adjustment)
+                version = stored_catalog_version()
+                changed = update_prices(Product.objects.all(), adjustment)
+
+                after = self.prices()
+                self.assertEqual(after, {pk: new_price(price, adjustment) for pk, price in before.items()})
+                self.assertEqual(changed, preview["changed"])
+                self.assertEqual(sum(after.values()), preview["new_total"])
+                self.assertEqual(stored_catalog_version(), version + 1)
+                transaction.set_rollback(True)
+
+    def test_csv_rows_match_preview(self):
+        rows, errors = parse_csv(io.BytesIO(b"id,price,percent,amount\n1,12.50,,\n2,,-10,\n3,,,2\n4,,10,\n"), "ending", 95)
+        self.assertEqual(errors, [])
+        before = self.prices()
+        preview = preview_rows(rows)
+        self.assertEqual(update_prices_from_rows(rows), preview["changed"])
+        after = self.prices()
+        for pk, adjustment in rows:
+            self.assertEqual(after[pk], new_price(before[pk], adjustment))
+        self.assertEqual({pk: p for pk, p in after.items() if pk > 4}, {pk: p for pk, p in before.items() if pk > 4})
+
+    def test_failed_chunk_still_bumps_catalog(self):
+        version = stored_catalog_version()
+        def failing_chunks(queryset):
+            yield [1, 2]
+            raise DatabaseError("lost connection")
+
+        with mock.patch("main.pricing._id_chunks", failing_chunks):
+            with self.assertRaises(DatabaseError):
+                update_prices(Product.objects.all(), PriceAdjustment("amount", 100))
+        self.assertEqual(stored_catalog_version(), version + 1)
+
+
+class PriceAdminTests(TestCase):
+    fixtures = [FIXTURE]
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser("staff", "staff@example.com", "pw"))
+
+    def prices(self, *pks):
+        return list(Product.objects.filter(pk__in=pks).order_by("pk").values_list("price_cents", flat=True))
+
+    def product_updates(self, queries):
+        return [q["sql"] for q in queries.captured_queries if q["sql"].startswith('UPDATE "main_product"')]
+
+    def adjust(self, button, **data):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse("admin:main_product_changelist"), {
+                "action": "adjust_prices", "_selected_action": [1, 2, 3], button: "1", **data,
+            }, secure=True)
+        return response, self.product_updates(queries)
+
+    def test_adjust_prices_previews_then_applies_one_update(self):
+        data = {"mode": "percent", "value": "10", "rounding": "ending", "rounding_amount": "0.95"}
+        response, updates = self.adjust("_preview", **data)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["preview"]["changed"], 3)
+        self.assertEqual((updates, self.prices(1, 2, 3)), ([], [299, 199, 249]))
+
+        version = stored_catalog_version()
+        response, updates = self.adjust("_apply", **data)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(self.prices(1, 2, 3), [395, 295, 295])
+        self.assertEqual(self.prices(4), [279])
+        self.assertEqual(stored_catalog_version(), version + 1)
+
+    def import_prices(self, data, dry_run=False):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse("admin:main_product_import_prices"), {
+                "file": SimpleUploadedFile("prices.csv", data, content_type="text/csv"),
+                **({"dry_run": "on"} if dry_run else {}),
+            }, secure=True)
+        return response, self.product_updates(queries)
+
+    def test_import_applies_a_file_in_one_case_update(self):
+        data = b"id,price,percent,amount\n1,5.00,,\n2,,-10,\n3,,,1\n4,,-10,\n"
+        response, updates = self.import_prices(data, dry_run=True)
+        self.assertEqual(response.context["preview"]["changed"], 4)
+        self.assertEqual(updates, [])
+
+        response, updates = self.import_prices(data)
+        self.assertRedirects(response, reverse("admin:main_product_changelist"), fetch_redirect_response=False)
+        self.assertEqual(len(updates), 1)
+        self.assertIn("CASE WHEN", updates[0])
+        self.assertEqual(self.prices(1, 2, 3, 4, 5), [500, 179, 349, 251, 349])
+
+    def test_import_with_errors_changes_nothing(self):
+        response, updates = self.import_prices(b"id,price\n1,5.00\n2,abc\n")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["errors"], ["Line 3: 'abc' is not a number."])
+        self.assertEqual((updates, self.prices(1)), ([], [299]))
+
+
+class ReservationTests(TestCase):
+    fixtures = [FIXTURE]
+
+    def stock(self, *pks):
+        return [Product.objects.get(pk=pk).stock for pk in pks]
+
+    def test_reserve_never_oversells(self):
+        Product.objects.filter(pk=1).update(stock=3)
+        self.assertIsNotNone(inventory.reserve([(1, 2)]))
+        with self.assertRaises(inventory.OutOfStock):
+            inventory.reserve([(1, 2)])
+        self.assertEqual(self.stock(1), [1])
+        self.assertEqual(StockReservation.objects.count(), 1)
+
+    def test_reserve_is_all_or_nothing(self):
+        Product.objects.filter(pk=1).update(stock=5)
+        Product.objects.filter(pk=2).update(stock=1)
+        with self.assertRaises(inventory.OutOfStock) as raised:
+            inventory.reserve([(1, 2), (2, 1), (2, 1)])
+        self.assertEqual(raised.exception.product_id, 2)
+        self.assertEqual(self.stock(1, 2), [5, 1])
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_untracked_products_are_not_reserved(self):
+        Product.objects.filter(pk=1).update(stock=None)
+        self.assertIsNone(inventory.reserve([(1, 100)]))
+
+    def test_release_and_confirm(self):
+        Product.objects.filter(pk__in=[1, 2]).update(stock=4)
+        canceled, paid = inventory.reserve([(1, 3)]), inventory.reserve([(2, 3)])
+        inventory.release(canceled)
+        inventory.confirm(paid)
+        self.assertEqual(self.stock(1, 2), [4, 1])
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_expired_reservations_ask_stripe_first(self):
+        Product.objects.filter(pk__in=[1, 2, 3, 4]).update(stock=5)
+        statuses = {"cs_paid": "paid", "cs_expired": "expired", "cs_open": "open"}
+        for pk, session_id in [(1, "cs_paid"), (2, "cs_expired"), (3, "cs_open"), (4, "")]:
+            inventory.attach_session(inventory.reserve([(pk, 2)]), session_id)
+        later = timezone.now() + inventory.CHECKOUT_TTL + inventory.RESERVATION_GRACE + timedelta(minutes=1)
+
+        with mock.patch("main.inventory.checkout_status", side_effect=statuses.get) as lookup:
+            self.assertEqual(inventory.release_expired(now=later), 4)
+        self.assertEqual(sorted(call.args[0] for call in lookup.call_args_list), ["cs_expired", "cs_open", "cs_paid"])
+        # Paid stays taken, expired and session-less come back, open waits.
+        self.assertEqual(self.stock(1, 2, 3, 4), [3, 5, 3, 5])
+        kept = StockReservation.objects.get()
+        self.assertEqual(kept.stripe_session_id, "cs_open")
+        self.assertEqual(kept.expires_at, later + inventory.RECHECK_DELAY)
+
+    @override_settings(STRIPE_WEBHOOK_SECRET="whsec_test")
+    def test_webhook_settles_sessions(self):
+        Product.objects.filter(pk__in=[1, 2]).update(stock=5)
+        inventory.attach_session(inventory.reserve([(1, 2)]), "cs_paid")
+        inventory.attach_session(inventory.reserve([(2, 2)]), "cs_expired")
+        events = [
+            {"type": "checkout.session.completed", "data": {"object": {"id": "cs_paid", "payment_status": "paid"}}},
+            {"type": "checkout.session.expired", "data": {"object": {"id": "cs_expired", "payment_status": "unpaid"}}},
+        ]
+        with mock.patch("stripe.Webhook.construct_event", side_effect=events):
+            for _ in events:
+                response = self.client.post(
+                    reverse("stripe_webhook"), b"{}", content_type="application/json",
+                    HTTP_HOST="localhost", secure=True,
+                )
+                self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.stock(1, 2), [3, 5])
+        self.assertFalse(StockReservation.objects.exists())
+
+
+class RestockTests(TestCase):
+    fixtures = [FIXTURE]
+
+    def test_restock_keeps_reservations(self):
+        Product.objects.filter(pk=1).update(stock=5)
+        inventory.reserve([(1, 2)])
+        self.assertEqual(inventory.restock([1], 10), 1)
+        self.assertEqual(Product.objects.get(pk=1).stock, 13)
+
+    def test_write_off_never_goes_below_zero(self):
+        Product.objects.filter(pk__in=[1, 2]).update(stock=3)
+        Product.objects.filter(pk=2).update(stock=1)
+        self.assertEqual(inventory.restock([1, 2], -2), 1)
+        self.assertEqual(dict(Product.objects.filter(pk__in=[1, 2]).values_list("pk", "stock")), {1: 1, 2: 1})
+
+    def test_sold_out_bumps_only_the_listing_version(self):
+        Product.objects.filter(pk=1).update(stock=2)
+        version, listing = stored_catalog_version(), stored_catalog_version("listing_version")
+        inventory.reserve([(1, 2)])
+        self.assertEqual(stored_catalog_version(), version)
+        self.assertEqual(stored_catalog_version("listing_version"), listing + 1)
+
+    def test_track(self):
+        Product.objects.filter(pk=1).update(stock=None)
+        inventory.restock([1], 4)
+        self.assertIsNone(Product.objects.get(pk=1).stock)
+        inventory.restock([1], 4, track=True)
+        self.assertEqual(Product.objects.get(pk=1).stock, 4)
+
+    def test_admin_change_form_does_not_save_stock(self):
+        staff = User.objects.create_superuser("staff", "staff@example.com", "pw")
+        self.client.force_login(staff)
+        Product.objects.filter(pk=1).update(stock=5)
+        product = Product.objects.get(pk=1)
+        url = reverse("admin:main_product_change", args=[1])
+        self.assertNotContains(self.client.get(url, secure=True), 'name="stock"')
+        self.client.post(url, {
+            "name": product.name, "description": product.description, "price_cents": "2.99",
+            "stock": "100",
+        }, secure=True)
+        self.assertEqual(Product.objects.get(pk=1).stock, 5)
+
+
+def admin_save_during(test, side_effect, **data):
+    """POST the product 1 change form, running ``side_effect`` after the admin loaded the product."""
+    staff = User.objects.create_superuser("staff", "staff@example.com", "pw")
+    test.client.force_login(staff)
+    product = Product.objects.get(pk=1)
+    save_form = ProductAdmin.save_form
+
+    def concurrently(self, request, form, change):
+        side_effect()
+        return save_form(self, request, form, change)
+
+    with mock.patch.object(ProductAdmin, "save_form", concurrently):
+        response = test.client.post(reverse("admin:main_product_change", args=[1]), {
+            "name": product.name, "description": product.description, "price_cents": "2.99", **data,
+        }, secure=True)
+    test.assertEqual(response.status_code, 302)
+
+
+class AdminSaveTests(TestCase):
+    fixtures = [FIXTURE]
+
+    def test_edit_keeps_a_concurrent_reservation(self):
+        Product.objects.filter(pk=1).update(stock=5)
+        admin_save_during(self, lambda: inventory.reserve([(1, 2)]), name="Renamed")
+        product = Product.objects.get(pk=1)
+        self.assertEqual((product.name, product.price_cents, product.stock), ("Renamed", 299, 3))
+
+    def test_edit_keeps_a_concurrent_review(self):
+        buyer = User.objects.create_user("buyer")
+        order = Order.objects.create(user=buyer, total_cents=299)
+        OrderItem.objects.create(order=order, product_id=1, quantity=1, price_cents=299)
+        admin_save_during(self, lambda: save_review(buyer, 1, 4), name="Renamed")
+        product = Product.objects.get(pk=1)
+        self.assertEqual((product.name, product.rating_count, product.rating_sum), ("Renamed", 1, 4))
+        self.assertEqual(reconcile_ratings(), 0)
+
+
+class ImageSourcesTests(TestCase):
+    def product(self):
+        return Product(image_hash="ab" * 32, image_width=600, image_height=300, image_formats="avif,webp")
+
+    @override_settings(MEDIA_PUBLIC=True)
+    def test_sources_when_media_is_served(self):
+        sources = image_sources(self.product())
+        self.assertEqual([mime for mime, _ in sources], ["image/avif", "image/webp"])
+        self.assertIn("/240.webp 240w", sources[1][1])
+
+    @override_settings(MEDIA_PUBLIC=False)
+    def test_no_sources_when_media_is_not_served(self):
+        self.assertEqual(image_sources(self.product()), [])
+
+
+class ExportTests(TestCase):
+    fixtures = [FIXTURE]
+
+    def setUp(self):
+        buyer = User.objects.create_user("buyer", "buyer@example.com")
+        self.orders = []
+        for lines in [[(1, 2)], [(2, 1), (3, 3)], [], [(1, 1)], [(4, 2)]]:
+            order = Order.objects.create(user=buyer, total_cents=500, gift_cents=0 if lines else 2500)
+            OrderItem.objects.bulk_create(
+                [OrderItem(order=order, product_id=pid, quantity=qty, price_cents=150) for pid, qty in lines]
+            )
+            self.orders.append(order.pk)
+
+    def test_pages_by_id_with_one_item_query_per_page(self):
+        # Three pages of orders with their lines, then an empty page.
+        with self.assertNumQueries(7):
+            exported = list(iter_orders_with_items(chunk_size=2))
+        self.assertEqual([order[0] for order, _ in exported], self.orders)
+        self.assertEqual([len(items) for _, items in exported], [1, 2, 0, 1, 1])
+
+    def test_command_writes_a_row_per_line(self):
+        out = io.StringIO()
+        call_command("export_orders", "--chunk-size", "2", stdout=out)
+        header, *rows = csv.reader(io.StringIO(out.getvalue()))
+        rows = [dict(zip(header, row)) for row in rows]
+        self.assertEqual(len(rows), 6)
+        self.assertEqual(
+            [(r["product_id"], r["quantity"], r["unit_price"], r["line_total"]) for r in rows[1:3]],
+            [("2", "1", "1.50", "1.50"), ("3", "3", "1.50", "4.50")],
+        )
+        gift_only = rows[3]
+        self.assertEqual((gift_only["product_id"], gift_only["gift_amount"]), ("", "25.00"))
+
+    def test_admin_action_streams_the_selected_orders(self):
+        self.client.force_login(User.objects.create_superuser("staff", "staff@example.com", "pw"))
+        response = self.client.post(reverse("admin:main_order_changelist"), {
+            "action": "export_jsonl", "_selected_action": self.orders[:2],
+        }, secure=True)
+        self.assertTrue(response.streaming)
+        self.assertIn("attachment;", response["Content-Disposition"])
+        records = [json.loads(line) for line in b"".join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([len(r["items"]) for r in records], [1, 2])
+
+
+class ChangelistTests(TestCase):
+    fixtures = [FIXTURE]
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser("staff", "staff@example.com", "pw"))
+
+    def add_orders(self, count):
+        for n in range(count):
+            order = Order.objects.create(user=User.objects.create_user(f"buyer{Order.objects.count()}"))
+            OrderItem.objects.create(order=order, product_id=n % 5 + 1, price_cents=100)
+
+    def changelist_queries(self, model):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse(f"admin:main_{model}_changelist"), secure=True)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_queries_do_not_grow_with_the_page(self):
+        self.add_orders(2)
+        few = {model: self.changelist_queries(model) for model in ("order", "orderitem")}
+        self.add_orders(8)
+        self.assertEqual({model: self.changelist_queries(model) for model in few}, few)
+
+    def test_estimate_only_for_large_unfiltered_tables(self):
+        self.add_orders(3)
+        big = ESTIMATE_THRESHOLD + 1
+        with mock.patch.object(EstimatedCountPaginator, "_estimated_rows", return_value=big) as estimate:
+            self.assertEqual(EstimatedCountPaginator(Order.objects.all(), 100).count, big)
+            self.assertEqual(EstimatedCountPaginator(Order.objects.filter(total_cents=0), 100).count, 3)
+        self.assertEqual(estimate.call_count, 1)
+        with mock.patch.object(EstimatedCountPaginator, "_estimated_rows", return_value=50):
+            self.assertEqual(EstimatedCountPaginator(Order.objects.all(), 100).count, 3)
+        # SQLite has no planner estimate: exact count.
+        self.assertEqual(EstimatedCountPaginator(Order.objects.all(), 100).count, 3)
+
+
+class SalesRollupTests(TestCase):
+    fixtures = [FIXTURE]
+
+    def setUp(self):
+        self.buyer = User.objects.create_user("buyer")
+        self.coupon = Coupon.objects.create(code="TEN", type="amount", value=1)
+
+    def order(self, lines, **fields):
+        order = Order.objects.create(user=self.buyer, **fields)
+        OrderItem.objects.bulk_create(
+            [OrderItem(order=order, product_id=pid, quantity=qty, price_cents=150) for pid, qty in lines]
+        )
+
+    def rollups(self):
+        return (
+            list(DailySales.objects.values_list(
+                "orders", "units", "revenue_cents", "discount_cents", "gift_certificates", "gift_cents"
+            )),
+            sorted(DailyProductSales.objects.values_list("product_id", "units", "revenue_cents")),
+            list(DailyCouponSales.objects.values_list("coupon_id", "orders", "discount_cents")),
+        )
+
+    def test_incremental_batches_match_a_rebuild(self):
+        later = timezone.now() + timedelta(hours=1)
+        self.order([(1, 2)], total_cents=300)
+        self.order([(1, 1), (2, 3)], total_cents=500, coupon=self.coupon, discount_cents=100)
+        self.assertEqual(update_sales_rollups(batch_size=1, now=later), 2)
+        self.order([], total_cents=0, gift_cents=2500)
+        # Too new: cart_view may still be writing its lines.
+        self.assertEqual(update_sales_rollups(now=timezone.now()), 0)
+        self.assertEqual(update_sales_rollups(batch_size=1, now=later), 1)
+        self.assertEqual(update_sales_rollups(now=later), 0)
+
+        incremental = self.rollups()
+        self.assertEqual(incremental, (
+            [(3, 6, 800, 100, 1, 2500)],
+            [(1, 3, 450), (2, 3, 450)],
+            [(self.coupon.pk, 1, 100)],
+        ))
+        self.assertEqual(rebuild_sales_rollups(now=later), 3)
+        self.assertEqual(self.rollups(), incremental)
+
+    def test_dashboard_reads_the_rollups(self):
+        self.order([(1, 2)], total_cents=300)
+        update_sales_rollups(now=timezone.now() + timedelta(hours=1))
+        self.client.force_login(User.objects.create_superuser("staff", "staff@example.com", "pw"))
+        response = self.client.get(reverse("admin:main_dailysales_changelist"), secure=True)
+        self.assertEqual(response.context["summary"]["revenue_cents"], 300)
+        self.assertEqual(response.context["top_products"][0]["units"], 2)
+
+
+class ConditionalGetTests(TestCase):
+    fixtures = [FIXTURE]
+
+    def setUp(self):
+        cache.clear()
+
+    def get(self, url, **headers):
+        return self.client.get(url, secure=True, headers=headers)
+
+    def bump(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            bump_catalog_version()
+
+    def test_unchanged_catalog_pages_are_not_modified(self):
+        for url in (reverse("product_list"), reverse("product_feed")):
+            with self.subTest(url=url):
+                first = self.get(url)
+                self.assertEqual(first.status_code, 200)
+                self.assertEqual(self.get(url, if_none_match=first["ETag"]).status_code, 304)
+                self.assertEqual(self.get(url, if_modified_since=first["Last-Modified"]).status_code, 304)
+
+    def test_catalog_change_changes_the_etag(self):
+        for url in (reverse("product_list"), reverse("product_feed")):
+            with self.subTest(url=url):
+                etag = self.get(url)["ETag"]
+                self.bump()
+                response = self.get(url, if_none_match=etag)
+                self.assertEqual(response.status_code, 200)
+                self.assertNotEqual(response["ETag"], etag)
+
+    def test_the_cart_badge_is_part_of_a_visitor_etag(self):
+        self.client.force_login(User.objects.create_user("buyer"))
+        etag = self.get(reverse("product_list"))["ETag"]
+        self.assertEqual(self.get(reverse("product_list"), if_none_match=etag).status_code, 304)
+        session = self.client.session
+        session["cart"] = {"1": {"quantity": 2}}
+        session.save()
+        self.assertEqual(self.get(reverse("product_list"), if_none_match=etag).status_code, 200)
+
+
+class EdgeCacheTests(TestCase):
+    fixtures = [FIXTURE]
+
+    def setUp(self):
+        cache.clear()
+        # Secure POSTs need a matching Origin to pass the CSRF check.
+        self.client = Client(enforce_csrf_checks=True, headers={"origin": "https://testserver"})
+
+    def test_anonymous_pages_are_shared_cacheable(self):
+        for url in (reverse("product_list"), reverse("product_detail", args=[1])):
+            with self.subTest(url=url):
+                response = self.client.get(url, secure=True)
+                self.assertIn("public", response["Cache-Control"])
+                self.assertIn(f"s-maxage={settings.ANONYMOUS_CACHE_SECONDS}", response["Cache-Control"])
+                self.assertNotIn("cookie", response.get("Vary", "").lower())
+                self.assertEqual(response.cookies, {})
+        self.assertContains(response, f'data-session-state-url="{reverse("session_state")}"')
+        self.assertContains(
+            response, '<input type="hidden" name="csrfmiddlewaretoken" value="" data-csrf-token>'
+        )
+
+    def test_forms_post_with_the_token_from_session_state(self):
+        state = self.client.get(reverse("session_state"), secure=True)
+        self.assertIn("private", state["Cache-Control"])
+        token = state.json()["csrf_token"]
+        self.assertEqual(self.client.post(reverse("add_to_cart"), {"product_id": 1}, secure=True).status_code, 403)
+        response = self.client.post(
+            reverse("add_to_cart"), {"product_id": 1, "csrfmiddlewaretoken": token}, secure=True
+        )
+        self.assertRedirects(response, reverse("cart"), fetch_redirect_response=False)
+        self.assertEqual(self.client.get(reverse("session_state"), secure=True).json()["cart_item_count"], 1)
+
+    def test_visitors_with_a_session_get_a_private_page(self):
+        self.client.get(reverse("session_state"), secure=True)
+        self.client.post(reverse("add_to_cart"), {
+            "product_id": 1, "csrfmiddlewaretoken": self.client.cookies[settings.CSRF_COOKIE_NAME].value,
+        }, secure=True)
+        response = self.client.get(reverse("product_list"), secure=True)
+        self.assertIn("private", response["Cache-Control"])
+        self.assertNotIn("s-maxage", response["Cache-Control"])
+        self.assertNotContains(response, "data-session-state-url")
+
+
+@override_settings(PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"])
+class RateLimitTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        # The start of a window, so the previous one carries no weight.
+        clock = mock.patch("main.ratelimit.time.time", return_value=60 * 1000.0)
+        clock.start()
+        self.addCleanup(clock.stop)
+
+    def login(self, username, ip="10.0.0.1"):
+        return self.client.post(
+            reverse("account"), {"login": "1", "username": username, "password": "wrong"},
+            secure=True, REMOTE_ADDR=ip,
+        )
+
+    def assertLimited(self, response):
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response["Retry-After"], "60")
+
+    def test_five_attempts_per_username_a_minute(self):
+        for n in range(5):
+            self.assertEqual(self.login("Alice", ip=f"10.0.1.{n}").status_code, 200)
+        with mock.patch("main.views.AuthenticationForm") as form:
+            self.assertLimited(self.login("alice ", ip="10.0.2.1"))
+        form.assert_not_called()
+        self.assertEqual(self.login("bob", ip="10.0.2.1").status_code, 200)
+
+    def test_twenty_attempts_per_ip_a_minute(self):
+        for n in range(20):
+            self.assertEqual(self.login(f"user{n}").status_code, 200)
+        self.assertLimited(self.login("someone-else"))
+        self.assertEqual(self.login("someone-else", ip="10.0.0.2").status_code, 200)
+
+    def test_window_slides(self):
+        for _ in range(10):
+            self.assertFalse(ratelimit.is_limited("test", "k", "10/m", now=60 * 1000.0))
+        self.assertTrue(ratelimit.is_limited("test", "k", "10/m", now=60 * 1000.0 + 59))
+        # Halfway into the next minute half of the last one still counts.
+        now = 60 * 1001.0 + 30
+        for _ in range(5):
+            self.assertFalse(ratelimit.is_limited("test", "k", "10/m", now=now))
+        self.assertTrue(ratelimit.is_limited("test", "k", "10/m", now=now))
+
+
+class FacetCountTests(TestCase):
+    fixtures = [FIXTURE]
+
+    def setUp(self):
+        cache.clear()
+
+    def counts(self, **params):
+        return facets.facet_counts(facets.parse(params))
+
+    def test_counts_match_the_filtered_products(self):
+        counts = self.counts(category="gummies")
+        self.assertEqual(counts["total"], facets.filtered_products(facets.parse({"category": "gummies"})).count())
+        self.assertEqual(counts["total"], 5)
+        self.assertEqual(counts["prices"], {"0-200": 1, "200-300": 4, "300-500": 0, "500-": 0})
+        # Other categories are counted without the category filter.
+        self.assertEqual(counts["categories"][1], 2)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.counts(category="gummies"), counts)
+
+    def test_catalog_changes_invalidate_the_counts(self):
+        before = self.counts(price="500-")
+        product = Product.objects.get(pk=1)
+        product.price_cents = 999
+        with self.captureOnCommitCallbacks(execute=True):
+            product.save()
+        self.assertEqual(self.counts(price="500-")["total"], before["total"] + 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            update_prices(Product.objects.filter(pk=2), PriceAdjustment("set", 599))
+        self.assertEqual(self.counts(price="500-")["total"], before["total"] + 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Category.objects.create(name="Hard", slug="hard")
+        self.assertEqual(len(self.counts()["categories"]), 6)
+
+    def test_stock_changes_keep_the_counts(self):
+        Product.objects.filter(pk=1).update(stock=0)
+        self.counts()
+        with self.captureOnCommitCallbacks(execute=True):
+            inventory.restock([1], 5)
+        self.assertEqual(stored_catalog_version("listing_version"), 1)
+        with self.assertNumQueries(1):  # the versions again, then cached counts
+            self.counts()
+
+
+class RatesTests(TestCase):
+    def write_rates(self, path, sek):
+        with open(path, "w", encoding="utf-8") as fh:
+            json.dump({"base": "usd", "rates": {"sek": sek}}, fh)
+
+    def test_page_etag_changes_with_the_rates(self):
+        request = RequestFactory().get("/products/")
+        request.session = {}
+        request.user = User()
+        with tempfile.TemporaryDirectory() as tmp, override_settings(CURRENCY_RATES_FILE=f"{tmp}/rates.json"):
+            self.write_rates(f"{tmp}/rates.json", "10.60")
+            before = catalog_page_etag(request)
+            self.write_rates(f"{tmp}/rates.json", "11.20")
+            # The file is re-read when its mtime changes.
+            os.utime(f"{tmp}/rates.json", ns=(1, 1))
+            self.assertNotEqual(catalog_page_etag(request), before)
+
+    def test_exports_include_the_charged_currency(self):
+        user = User.objects.create_user("buyer")
+        Order.objects.create(user=user, total_cents=1000, currency="sek", exchange_rate=Decimal("10.6"))
+        Order.objects.create(user=user, total_cents=500)
+        header, *rows = iter_csv_rows()
+        columns = [dict(zip(header, row)) for row in rows]
+        self.assertEqual([(c["currency"], c["exchange_rate"]) for c in columns], [("sek", "10.60000000"), ("usd", "1.00000000")])
+        record = json.loads(next(iter_jsonl_lines()))
+        self.assertEqual((record["currency"], record["exchange_rate"]), ("sek", "10.60000000"))
+
+
+class ReviewTests(TestCase):
+    fixtures = [FIXTURE]
+
+    def setUp(self):
+        self.user = User.objects.create_user("buyer")
+        order = Order.objects.create(user=self.user, total_cents=299)
+        OrderItem.objects.create(order=order, product_id=1, quantity=1, price_cents=299)
+
+    def test_reviews_bump_only_the_listing_version(self):
+        version, listing = stored_catalog_version(), stored_catalog_version("listing_version")
+        review, created = save_review(self.user, 1, 4)
+        self.assertTrue(created)
+        review, created = save_review(self.user, 1, 2)
+        self.assertFalse(created)
+        review.delete()
+        self.assertEqual(stored_catalog_version(), version)
+        self.assertEqual(stored_catalog_version("listing_version"), listing + 3)
+        product = Product.objects.get(pk=1)
+        self.assertEqual((product.rating_count, product.rating_sum), (0, 0))
+
+
+    def test_concurrent_first_review_becomes_an_update(self):
+        first = QuerySet.first
+
+        def miss_once(queryset):
+            # Another request commits its first review right after our lookup.
+            if not Review.objects.exists():
+                Review.objects.create(product_id=1, user=self.user, rating=5)
+                adjust_rating(1, 1, 5)
+                return None
+            return first(queryset)
+
+        with mock.patch.object(QuerySet, "first", autospec=True, side_effect=miss_once):
+            review, created = save_review(self.user, 1, 3)
+        self.assertFalse(created)
+        self.assertEqual(Review.objects.get(product_id=1, user=self.user).rating, 3)
+        product = Product.objects.get(pk=1)
+        self.assertEqual((product.rating_count, product.rating_sum), (1, 3))
+
+
+class RecommendationTests(TestCase):
+    fixtures = [FIXTURE]
+
+    def setUp(self):
+        self.buyer = User.objects.create_user("buyer")
+
+    def order(self, *product_ids):
+        order = Order.objects.create(user=self.buyer)
+        OrderItem.objects.bulk_create(
+            [OrderItem(order=order, product_id=pid, price_cents=100) for pid in product_ids]
+        )
+        return order.pk
+
+    def update(self):
+        return update_recommendations(now=timezone.now() + timedelta(hours=1))
+
+    def test_counts_accumulate_across_batches(self):
+        self.order(1, 2, 3)
+        self.assertEqual(self.update(), 1)
+        self.order(1, 2)
+        self.order(4, 5)
+        self.assertEqual(self.update(), 2)
+        counts = {(p.product_id, p.other_id): p.count for p in ProductPairCount.objects.all()}
+        self.assertEqual((counts[(1, 2)], counts[(2, 1)], counts[(1, 3)], counts[(4, 5)]), (2, 2, 1, 1))
+        self.assertEqual([p.pk for p in recommended_products([1])], [2, 3])
+
+    def test_reads_only_pairs_bought_together(self):
+        self.order(1, 2)
+        self.update()
+        # Products 1 and 2 are both in the next batch, but not in one order.
+        first, last = self.order(1, 3), self.order(2, 4)
+        self.assertEqual(_stored_counts(first, last), {})
+        self.assertEqual(_stored_counts(first, self.order(2, 1)), {(1, 2): 1, (2, 1): 1})
+
+
+class SuggestIndexTests(TestCase):
+    fixtures = [FIXTURE]
+
+    def test_capped_index_keeps_the_best_sellers(self):
+        DailyProductSales.objects.create(day=timezone.localdate(), product_id=3, units=5)
+        DailyProductSales.objects.create(day=timezone.localdate(), product_id=2, units=9)
+        index = build_index(limit=2)
+        self.assertEqual(sorted(pk for pk, _ in index.products), [2, 3])
+        self.assertEqual(len(build_index(limit=0).products), Product.objects.count())
+
+
+class MaintenanceTests(TestCase):
+    fixtures = [FIXTURE]
+
+    def test_reservations_are_released_in_paced_batches(self):
+        Product.objects.filter(pk__in=[1, 2, 3]).update(stock=0)
+        expired = timezone.now() - timedelta(minutes=1)
+        StockReservation.objects.bulk_create([
+            StockReservation(token=uuid.uuid4(), product_id=pk, quantity=2, expires_at=expired) for pk in (1, 2, 3)
+        ])
+        throttle = maintenance.Throttle()
+        with mock.patch.object(throttle, "pause") as pause:
+            self.assertEqual(list(maintenance.run_task("reservations", timezone.now(), 2, throttle)), [2, 1])
+        self.assertEqual(pause.call_count, 2)
+        self.assertEqual(set(Product.objects.filter(pk__in=[1, 2, 3]).values_list("stock", flat=True)), {2})
+
+    def test_reservations_stop_when_the_time_budget_is_spent(self):
+        StockReservation.objects.create(
+            token=uuid.uuid4(), product_id=1, quantity=1, expires_at=timezone.now() - timedelta(minutes=1)
+        )
+        throttle = maintenance.Throttle(max_seconds=1)
+        with mock.patch.object(throttle, "expired", return_value=True):
+            self.assertEqual(list(maintenance.run_task("reservations", timezone.now(), 10, throttle)), [])
+        self.assertEqual(StockReservation.objects.count(), 1)
+
+    def test_only_read_or_expired_messages_are_due(self):
+        now = timezone.now()
+        for days, is_read in [(400, True), (400, False), (30, True), (1200, False)]:
+            message = Message.objects.create(name="x", email="x@example.com", message="hi", is_read=is_read)
+            Message.objects.filter(pk=message.pk).update(created_at=now - timedelta(days=days))
+        due = maintenance.TASKS["messages"][0](now)
+        self.assertEqual(sorted(due.values_list("is_read", flat=True)), [False, True])
+        self.assertEqual(maintenance.pending("messages", now), 2)
+
+    def test_archive_names_the_file_after_the_messages_still_there(self):
+        ids = [
+            Message.objects.create(name="x", email="x@example.com", message=str(n)).pk for n in range(3)
+        ]
+        Message.objects.filter(pk__in=[ids[0], ids[2]]).delete()
+        with tempfile.TemporaryDirectory() as media, override_settings(MEDIA_ROOT=media):
+            maintenance._archive_messages(ids)
+            self.assertEqual(
+                os.listdir(f"{media}/{maintenance.MESSAGE_ARCHIVE_DIR}"), [f"messages-{ids[1]}-{ids[1]}.jsonl.gz"]
+            )
+            Message.objects.all().delete()
+            maintenance._archive_messages(ids)
+            self.assertEqual(len(os.listdir(f"{media}/{maintenance.MESSAGE_ARCHIVE_DIR}")), 1)
+        self.assertFalse(Message.objects.exists())
+
+
+@override_settings(MEMORY_SAMPLE_EVERY=1)
+class MemoryDiagnosticsTests(TestCase):
+    fixtures = [FIXTURE]
+
+    def setUp(self):
+        memory.reset()
+        self.url = reverse("memory_diagnostics")
+
+    def tearDown(self):
+        if tracemalloc.is_tracing():
+            memory.stop_tracing()
+
+    def test_staff_only(self):
+        self.assertEqual(self.client.get(self.url, secure=True).status_code, 302)
+        self.client.force_login(User.objects.create_user("buyer"))
+        self.assertEqual(self.client.get(self.url, secure=True).status_code, 302)
+
+    def test_reports_growth_per_view(self):
+        self.client.force_login(User.objects.create_user("staff", is_staff=True))
+        self.client.get(reverse("product_list"), secure=True)
+        report = self.client.get(self.url, secure=True).json()
+        self.assertFalse(report["tracing"])
+        self.assertEqual({row["view"]: row["requests"] for row in report["views"]}["product_list"], 1)
+        self.assertIn("product_list", memory.summary())
+
+    def test_tracing_samples_allocation_sites(self):
+        self.client.force_login(User.objects.create_user("staff", is_staff=True))
+        self.assertTrue(self.client.post(self.url, {"action": "start"}, secure=True).json()["tracing"])
+        self.client.get(reverse("product_list"), secure=True)
+        report = self.client.get(self.url, secure=True).json()
+        row = next(row for row in report["views"] if row["view"] == "product_list")
+        self.assertEqual(row["sampled"], 1)
+        self.assertGreater(row["max_peak"], 0)
+        self.assertIn("top_sites_since_baseline", report)
+
+        self.assertFalse(self.client.post(self.url, {"action": "stop"}, secure=True).json()["tracing"])
+        self.assertEqual(self.client.post(self.url, {"action": "dump"}, secure=True).status_code, 400)
+
+
+class ProfilingTests(TestCase):
+    fixtures = [FIXTURE]
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+        self.client.force_login(User.objects.create_user("staff", is_staff=True))
+
+    def test_profiles_a_staff_request(self):
+        response = self.client.get("/products/?_profile=1", secure=True)
+        self.assertEqual(response["X-Profile-Id"], str(RequestProfile.objects.get().pk))
+
+    def test_second_profile_at_once_is_served_unprofiled(self):
+        with profiling._profiling:
+            response = self.client.get("/products/?_profile=1", secure=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("X-Profile-Skipped", response)
+        self.assertNotIn("X-Profile-Id", response)
+        self.assertFalse(RequestProfile.objects.exists())
+
+
+class DeferredSlowQueryTests(TestCase):
+    def entry(self, sql, ms):
+        return {"fingerprint": slow_queries.fingerprint(sql), "sql": sql, "ms": ms,
+                "view": "", "location": "", "explain": ""}
+
+    def test_repeats_are_folded_and_new_fingerprints_capped(self):
+        with mock.patch.object(slow_queries, "MAX_DEFERRED", 2):
+            for ms in (10, 30, 20):
+                slow_queries._defer(self.entry("SELECT a", ms))
+            for sql in ("SELECT b", "SELECT c", "SELECT d"):
+                slow_queries._defer(self.entry(sql, 5))
+            self.assertEqual(len(slow_queries._deferred), 2)
+            with self.assertLogs("main.slow_queries", "WARNING"):
+                slow_queries.flush()
+
+        row = SlowQuery.objects.get(sql="SELECT a")
+        self.assertEqual((row.count, row.total_ms, row.max_ms), (3, 60, 30))
+        self.assertEqual(sorted(SlowQuery.objects.values_list("sql", flat=True)), ["SELECT a", "SELECT b"])
+        self.assertEqual(slow_queries._deferred, {})
+
+
+class CheckoutPriceTests(TestCase):
+    fixtures = [FIXTURE]
+
+    def setUp(self):
+        self.client = self.client_class(HTTP_HOST="localhost")
+        self.client.force_login(User.objects.create_user("buyer"))
+        session = self.client.session
+        session["cart"] = {"1": {"name": "x", "image_url": None, "quantity": 2}}
+        session.save()
+
+    def test_checkout_charges_the_live_price(self):
+        product = Product.objects.get(pk=1)
+        shown = price_of(product, "usd")
+        # No signal, so the catalog version (and the display table) stays as it was.
+        Product.objects.filter(pk=1).update(price_cents=shown + 100)
+        self.assertEqual(price_of(product, "usd"), shown)
+
+        stripe = mock.Mock()
+        stripe.checkout.Session.create.return_value.url = "https://stripe.test/pay"
+        with mock.patch("main.views.get_stripe", return_value=stripe):
+            self.client.post(reverse("create_checkout_session"), secure=True)
+        line = stripe.checkout.Session.create.call_args.kwargs["line_items"][0]
+        self.assertEqual(line["price_data"]["unit_amount"], shown + 100)
+        self.assertEqual(line["quantity"], 2)
+
+
+@override_settings(DATABASE_ROUTERS=["main.db_router.ReplicaRouter"], REPLICA_MAX_LAG=5)
+class ReplicaRouterTests(TransactionTestCase):
+    """Routing against a real second SQLite database standing in for the replica."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Settings only mirror the replica in tests, and the runner only sets
+        # up configured aliases, so this class adds its own after setup.
+        configured = connections.configure_settings({
+            "default": connections.settings["default"],
+            db_router.REPLICA: {"ENGINE": "django.db.backends.sqlite3", "NAME": ":memory:"},
+        })
+        cls._saved_replica = connections.settings.get(db_router.REPLICA)
+        cls._saved_connection = None
+        if cls._saved_replica is not None:
+            # A configured replica mirrors default; set its connection aside.
+            cls._saved_connection = connections[db_router.REPLICA]
+            del connections[db_router.REPLICA]
+        connections.settings[db_router.REPLICA] = configured[db_router.REPLICA]
+        cls.databases = cls.databases | {db_router.REPLICA}
+        with connections[db_router.REPLICA].schema_editor() as editor:
+            editor.create_model(Category)
+            editor.create_model(Product)
+
+    @classmethod
+    def tearDownClass(cls):
+        connections[db_router.REPLICA].close()
+        del connections[db_router.REPLICA]
+        if cls._saved_replica is None:
+            del connections.settings[db_router.REPLICA]
+        else:
+            connections.settings[db_router.REPLICA] = cls._saved_replica
+            connections[db_router.REPLICA] = cls._saved_connection
+        cls.databases = cls.databases - {db_router.REPLICA}
+        super().tearDownClass()
+
+    def setUp(self):
+        Product.objects.bulk_create([Product(pk=1, name="primary", description="", price_cents=100)])
+        Product.objects.using(db_router.REPLICA).bulk_create(
+            [Product(pk=1, name="replica", description="", price_cents=100)]
+        )
+        CatalogVersion.objects.update_or_create(
+            pk=1, defaults={"updated_at": timezone.now() - timedelta(minutes=5)}
+        )
+        cache.clear()
+        db_router._lag_state.update(checked=float("-inf"), lag=None)
+
+    def tearDown(self):
+        # Not .delete(): that would collect related rows from tables the replica lacks.
+        with connections[db_router.REPLICA].cursor() as cursor:
+            cursor.execute(f"DELETE FROM {Product._meta.db_table}")
+
+    def request(self, method="get", cookies=None, during=None):
+        """Run a request through ReplicaMiddleware; returns (name read, response)."""
+        request = getattr(RequestFactory(), method)("/products/")
+        request.COOKIES.update(cookies or {})
+        seen = []
+
+        def view(request):
+            if during:
+                during()
+            seen.append(Product.objects.get(pk=1).name)
+            return HttpResponse()
+
+        response = db_router.ReplicaMiddleware(view)(request)
+        return seen[0], response
+
+    def test_get_reads_from_the_replica(self):
+        self.assertEqual(self.request()[0], "replica")
+        self.assertEqual(router.db_for_read(Order), "default")  # outside requests
+
+    def test_post_and_atomic_blocks_read_from_the_primary(self):
+        self.assertEqual(self.request("post")[0], "primary")
+
+        def atomic_read():
+            with transaction.atomic():
+                self.atomic_name = Product.objects.get(pk=1).name
+
+        self.request(during=atomic_read)
+        self.assertEqual(self.atomic_name, "primary")
+
+    def test_writers_are_pinned_to_the_primary(self):
+        name, response = self.request(during=lambda: Product.objects.filter(pk=1).update(price_cents=200))
+        self.assertEqual(name, "primary")
+        cookie = response.cookies[db_router.STICKY_COOKIE]
+        self.assertEqual((cookie.value, cookie["max-age"]), ("1", 15))
+        self.assertEqual(self.request(cookies={db_router.STICKY_COOKIE: "1"})[0], "primary")
+        self.assertNotIn(db_router.STICKY_COOKIE, self.request()[1].cookies)
+
+    def test_lagging_or_unreachable_replica_falls_back_to_the_primary(self):
+        for lag in (30.0, None):
+            db_router._lag_state.update(checked=float("-inf"))
+            with self.subTest(lag=lag), mock.patch("main.db_router._measure_lag", return_value=lag):
+                self.assertEqual(self.request()[0], "primary")
+
+    def test_fresh_catalog_changes_read_the_catalog_from_the_primary(self):
+        with transaction.atomic():
+            bump_catalog_version()
+        self.assertEqual(self.request()[0], "primary")
+        # Order history isn't affected by catalog changes.
+        self.request(during=lambda: setattr(self, "order_db", router.db_for_read(Order)))
+        self.assertEqual(self.order_db, db_router.REPLICA)
+
+    def test_migrate_leaves_the_replica_alone(self):
+        self.assertIs(router.allow_migrate(db_router.REPLICA, "main"), False)
+        self.assertIs(router.allow_migrate("default", "main"), True)
+        call_command("migrate", "main", database=db_router.REPLICA, verbosity=0)
+        tables = connections[db_router.REPLICA].introspection.table_names()
+        self.assertNotIn(Order._meta.db_table, tables)
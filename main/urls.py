@@ -8,15 +8,25 @@ from . import views
 urlpatterns = [
     # Home, Products, About, Contact pages
     path('products/', views.product_list, name='product_list'),
+    path('products/feed.json', views.product_feed, name='product_feed'),
+    path('products/suggest/', views.product_suggest, name='product_suggest'),
+    path('products/<int:pk>/', views.product_detail, name='product_detail'),
     path('shipping/', views.shipping, name='shipping'),
     path('reviews/', views.reviews, name='reviews'),
+    path('products/<int:pk>/review/', views.submit_review, name='submit_review'),
+    path('reviews/<int:pk>/delete/', views.delete_review, name='delete_review'),
     path('blog/', views.blog, name='blog'),
     path('recipes/', views.recipes, name='recipes'), 
     
+    # CSRF token + cart badge for anonymous-cached pages
+    path('session-state/', views.session_state, name='session_state'),
+    path('currency/', views.set_currency, name='set_currency'),
+
     # Cart-related URLs
     path('add-to-cart/', views.add_to_cart, name='add_to_cart'),
     path('cart/', views.cart_view, name='cart'),
     path('create-checkout-session/', views.create_checkout_session, name='create_checkout_session'),
+    path('stripe/webhook/', views.stripe_webhook, name='stripe_webhook'),
 
     # Cart item quantity management URLs
     path('cart/increase/<path:item_id>/', views.cart_increase, name='cart_increase'),
@@ -37,6 +47,9 @@ urlpatterns = [
 
     # Purchase history page (under 'account' section)
     path('account/purchase-history/', views.purchase_history, name='purchase_history'),
+
+    # Staff-only memory diagnostics for the serving worker
+    path('diagnostics/memory/', views.memory_diagnostics, name='memory_diagnostics'),
 ]
 
 # Static files handling when DEBUG is False
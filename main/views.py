@@ -3,39 +3,233 @@ from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth import login, logout
 from django.contrib.auth.forms import AuthenticationForm
-from django.views.decorators.http import require_POST
+from django.views.decorators.http import require_POST, condition
+from django.views.decorators.cache import cache_control, never_cache
+from django.views.decorators.csrf import csrf_exempt
 from django.contrib.auth.decorators import login_required
-
-from .forms import RegistrationForm
-from .models import Product, Order, GiftCertificate, OrderItem
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse, JsonResponse
+from django.middleware.csrf import get_token
+from django.urls import reverse
+from django.utils.cache import patch_cache_control
+from django.utils.http import url_has_allowed_host_and_scheme
+
+from .catalog import (
+    catalog_version,
+    catalog_page_etag,
+    catalog_page_last_modified,
+    catalog_feed_etag,
+    catalog_feed_last_modified,
+)
+from .context_processors import cart_item_count
+from .edge_cache import anonymous_cache_page, is_anonymous_cacheable
+from .forms import RegistrationForm, ReviewForm
+from .currency import base_currency, convert_to, get_currency, normalize, rates
+from .models import FREE_SHIPPING_OVER_CENTS, Product, Order, GiftCertificate, OrderItem, Review
+from .money import format_money, format_price, to_cents
+from .paginators import KnownCountPaginator
+from .ratelimit import ratelimit
+from .recommendations import recommended_products
+from .reviews import ReviewNotAllowed, has_purchased, save_review
+from . import facets, inventory, memory, search_index
 
 from decimal import Decimal
+import json
 import time
-import stripe
 
-# Stripe
-stripe.api_key = settings.STRIPE_SECRET_KEY
+# Stripe (imported on first checkout, see payments.py)
+from .payments import get_stripe
+
+PRODUCTS_PER_PAGE = 24
+
+
+def _is_gift(key, item):
+    return str(key).startswith("gift:") or item.get("type") == "gift_certificate"
+
+
+def _gift_cents(item):
+    # Carts saved before amounts were kept in cents only have "amount".
+    if "amount_cents" in item:
+        return int(item["amount_cents"])
+    return to_cents(item.get("amount"))
+
 
+def _cart_products(cart):
+    """The cart's products in one query, keyed by id."""
+    ids = [int(key) for key, item in cart.items() if not _is_gift(key, item) and str(key).isdigit()]
+    return Product.objects.in_bulk(ids)
 
-def to_cents(amount) -> int:
-    d = Decimal(str(amount)).quantize(Decimal("0.01"))
-    return int(d * 100)
 
+def _price_bucket_label(low, high, currency):
+    low_label = format_price(convert_to(low, currency), currency)
+    if high is None:
+        return f"{low_label}+"
+    high_label = format_price(convert_to(high, currency), currency)
+    return f"Under {high_label}" if not low else f"{low_label} – {high_label}"
 
-# Product list + search
+
+# Product list: search, facets (category, price) and sorting
+@anonymous_cache_page
+@condition(etag_func=catalog_page_etag, last_modified_func=catalog_page_last_modified)
 def product_list(request):
-    query = request.GET.get('q', '').strip()
-    products = Product.objects.filter(name__icontains=query) if query else Product.objects.all()
-    no_results = bool(query) and not products.exists()
+    filters = facets.parse(request.GET)
+    counts = facets.facet_counts(filters)
+    page = KnownCountPaginator(
+        facets.filtered_products(filters), PRODUCTS_PER_PAGE, counts['total']
+    ).get_page(request.GET.get('page'))
+    currency = get_currency(request)
     return render(request, 'main/product_list.html', {
-        'products': products,
-        'search_query': query,
-        'no_results': no_results,
+        'products': page.object_list,
+        'page': page,
+        'search_query': filters['q'],
+        'no_results': bool(filters['q']) and not counts['total'],
+        'filters': filters,
+        'counts': counts,
+        'category_facets': [
+            (category, counts['categories'].get(category.pk, 0)) for category in facets.categories()
+        ],
+        'price_facets': [
+            (key, _price_bucket_label(low, high, currency), counts['prices'][key])
+            for key, low, high in facets.PRICE_BUCKETS
+        ],
+        'sorts': [(key, label) for key, (label, _) in facets.SORTS.items()],
+    })
+
+
+# Product detail + "customers also bought"
+@anonymous_cache_page
+def product_detail(request, pk):
+    product = get_object_or_404(Product, pk=pk)
+    user_review = None
+    can_review = False
+    # request.user reads the session, which would add Vary: Cookie to a
+    # shared-cached page; without a session cookie nobody is logged in.
+    if not is_anonymous_cacheable(request) and request.user.is_authenticated:
+        user_review = Review.objects.filter(product=product, user=request.user).first()
+        can_review = user_review is not None or has_purchased(request.user, product.id)
+    return render(request, 'main/product_detail.html', {
+        'product': product,
+        'recommendations': recommended_products([product.id]),
+        'reviews': product.reviews.select_related('user')[:10],
+        'user_review': user_review,
+        'review_form': ReviewForm(initial={
+            'rating': user_review.rating if user_review else 5,
+            'body': user_review.body if user_review else '',
+        }) if can_review else None,
+    })
+
+
+# Product JSON feed for integrations (304 while the catalog is unchanged)
+@cache_control(public=True, no_cache=True)
+@condition(etag_func=catalog_feed_etag, last_modified_func=catalog_feed_last_modified)
+def product_feed(request):
+    version = catalog_version()
+    cache_key = f"catalog:feed:{version}"
+    body = cache.get(cache_key)
+    if body is None:
+        products = [
+            {'id': pk, 'name': name, 'description': description,
+             'price': format_money(price_cents), 'image_url': image_url}
+            for pk, name, description, price_cents, image_url in Product.objects.order_by('id').values_list(
+                'id', 'name', 'description', 'price_cents', 'image_url'
+            )
+        ]
+        body = json.dumps(
+            {'version': version, 'currency': base_currency(), 'products': products}, cls=DjangoJSONEncoder
+        )
+        cache.set(cache_key, body, 60 * 60)
+    return HttpResponse(body, content_type='application/json')
+
+
+# Typeahead for the search box, answered from the worker's in-memory index
+def product_suggest(request):
+    query = request.GET.get('q', '')[:100]
+    try:
+        limit = max(1, min(int(request.GET.get('limit', 8)), 20))
+    except ValueError:
+        limit = 8
+    response = JsonResponse({
+        'query': query,
+        'results': [
+            {'id': pk, 'name': name, 'url': reverse('product_detail', args=[pk])}
+            for pk, name in search_index.suggest(query, limit)
+        ],
+    })
+    # Empty while this worker is still building its index: don't cache that.
+    if search_index.ready():
+        patch_cache_control(response, public=True, max_age=60)
+    else:
+        patch_cache_control(response, no_cache=True)
+    return response
+
+
+# Per-visitor bits of cached pages (CSRF token + cart badge), fetched by main.js
+@never_cache
+def session_state(request):
+    return JsonResponse({
+        'csrf_token': get_token(request),
+        'cart_item_count': cart_item_count(request)['cart_item_count'],
+        'authenticated': request.user.is_authenticated,
     })
 
 
+# Display currency (cookie, so choosing one doesn't start a session)
+@require_POST
+def set_currency(request):
+    currency = normalize(request.POST.get('currency'))
+    next_url = request.POST.get('next') or request.META.get('HTTP_REFERER')
+    if not url_has_allowed_host_and_scheme(next_url, {request.get_host()}, request.is_secure()):
+        next_url = '/'
+    response = redirect(next_url)
+    if currency == base_currency():
+        # Back to the default: pages can be shared-cached again.
+        response.delete_cookie(settings.CURRENCY_COOKIE_NAME)
+    else:
+        response.set_cookie(
+            settings.CURRENCY_COOKIE_NAME, currency,
+            max_age=365 * 24 * 60 * 60, secure=request.is_secure(), httponly=True, samesite='Lax',
+        )
+    return response
+
+
 def reviews(request):
-    return render(request, 'main/reviews.html')
+    page = Paginator(
+        Review.objects.select_related('product', 'user'), 20
+    ).get_page(request.GET.get('page'))
+    return render(request, 'main/reviews.html', {'page': page})
+
+
+@login_required(login_url='account')
+@require_POST
+@ratelimit("10/h", key="user")
+def submit_review(request, pk):
+    product = get_object_or_404(Product, pk=pk)
+    form = ReviewForm(request.POST)
+    if not form.is_valid():
+        messages.error(request, "Välj ett betyg mellan 1 och 5.")
+        return redirect('product_detail', pk=pk)
+    try:
+        _, created = save_review(
+            request.user, product.id, form.cleaned_data['rating'], form.cleaned_data['body']
+        )
+    except ReviewNotAllowed:
+        messages.error(request, "Du kan bara recensera produkter du har köpt.")
+        return redirect('product_detail', pk=pk)
+    messages.success(request, "Tack för din recension!" if created else "Din recension är uppdaterad.")
+    return redirect('product_detail', pk=pk)
+
+
+@login_required(login_url='account')
+@require_POST
+def delete_review(request, pk):
+    review = get_object_or_404(Review, pk=pk, user=request.user)
+    product_id = review.product_id
+    review.delete()
+    messages.success(request, "Din recension är borttagen.")
+    return redirect('product_detail', pk=product_id)
 
 
 def blog(request):
@@ -47,6 +241,8 @@ def recipes(request):
 
 
 @require_POST
+@ratelimit("30/m", key="ip")
+@ratelimit("30/m", key="user")
 def add_to_cart(request):
     product_id = request.POST.get("product_id")
     product = get_object_or_404(Product, id=product_id)
@@ -54,6 +250,11 @@ def add_to_cart(request):
     cart = request.session.get("cart", {})
     product_id_str = str(product_id)
 
+    in_cart = cart.get(product_id_str, {}).get("quantity", 0)
+    if product.stock is not None and product.stock <= in_cart:
+        messages.error(request, f'"{product.name}" är slutsåld')
+        return redirect(request.META.get("HTTP_REFERER") or "product_list")
+
     item = cart.get(product_id_str, {
         "name": product.name,
         "image_url": product.image_url,
@@ -75,57 +276,56 @@ def cart_view(request):
         cart = request.session.get('cart', {})
 
         if request.user.is_authenticated and cart:
-            order = Order.objects.create(
-                user=request.user,
-                total=Decimal('0.00'),
-            )
-
-            gift_total = Decimal('0.00')
+            order = Order.objects.create(user=request.user)
+            products = _cart_products(cart)
+            gift_total = 0
 
             for key, item in cart.items():
                 # PRESENTKORT
-                if str(key).startswith("gift:") or item.get("type") == "gift_certificate":
-                    amount = Decimal(item.get("amount", "0") or "0")
+                if _is_gift(key, item):
+                    amount = _gift_cents(item)
                     recipient_name = item.get("recipient_name") or "Okänd mottagare"
                     recipient_email = item.get("recipient_email") or "no@email"
 
                     gift_cert = GiftCertificate.objects.create(
                         recipient_name=recipient_name,
                         recipient_email=recipient_email,
-                        amount=amount,
+                        amount_cents=amount,
                         message=item.get("message", ""),
                         status="issued",
                     )
 
-                    order.gift_amount = amount
+                    order.gift_cents = amount
                     order.gift_recipient = f"{gift_cert.recipient_name} ({gift_cert.recipient_email})"
                     order.gift_code = gift_cert.code
-                    order.save(update_fields=['gift_amount', 'gift_recipient', 'gift_code'])
+                    order.save(update_fields=['gift_cents', 'gift_recipient', 'gift_code'])
 
                     gift_total += amount
                     continue
 
                 # VANLIGA PRODUKTER
-                try:
-                    product = Product.objects.get(id=int(key))
-                except (ValueError, Product.DoesNotExist):
+                product = products.get(int(key)) if str(key).isdigit() else None
+                if product is None:
                     continue
 
-                qty = int(item.get("quantity", 1))
-                price = Decimal(product.price or 0)
-
                 OrderItem.objects.create(
                     order=order,
                     product=product,
-                    quantity=qty,
-                    price=price,
+                    quantity=int(item.get("quantity", 1)),
+                    price_cents=product.price_cents,
                 )
 
             order.recalculate_total()
             if gift_total > 0:
-                order.total += gift_total
+                order.total_cents += gift_total
+            order.currency, order.exchange_rate = request.session.pop(
+                'checkout_currency', (base_currency(), '1')
+            )
             order.save()
 
+        # Lagret är redan draget – släpp bara reservationen
+        inventory.confirm(request.session.pop('stock_reservation', None))
+
         # TÖM KUNDVAGNEN HELT
         if 'cart' in request.session:
             del request.session['cart']
@@ -136,6 +336,7 @@ def cart_view(request):
 
     # AVBRUTEN BETALNING
     if request.GET.get('canceled') == '1':
+        inventory.release(request.session.pop('stock_reservation', None))
         messages.warning(request, "Betalningen avbröts. Dina varor finns kvar i korgen.")
         return redirect('cart')
 
@@ -143,52 +344,51 @@ def cart_view(request):
     cart = request.session.get('cart', {})
     public_key = getattr(settings, 'STRIPE_PUBLIC_KEY', '')
     items = []
-    subtotal = Decimal('0.00')
-    currency = getattr(settings, 'STRIPE_CURRENCY', 'usd').upper()
+    subtotal = 0
+    currency = get_currency(request)
+    products = _cart_products(cart)
 
     for key, item in cart.items():
-        if str(key).startswith("gift:") or item.get("type") == "gift_certificate":
-            qty = int(item.get("quantity", 1))
-            unit_price = Decimal(item.get("amount", "0") or "0")
-            line_total = unit_price * qty
+        qty = int(item.get("quantity", 1))
+        if _is_gift(key, item):
+            unit_cents = convert_to(_gift_cents(item), currency)
             items.append({
                 "id": key,
                 "name": item.get("name", "Presentkort"),
                 "quantity": qty,
-                "unit_price": unit_price,
-                "line_total": line_total,
+                "unit_cents": unit_cents,
+                "line_cents": unit_cents * qty,
                 "is_gift": True,
             })
-            subtotal += line_total
         else:
-            try:
-                product = Product.objects.get(id=int(key))
-            except (ValueError, Product.DoesNotExist):
+            product = products.get(int(key)) if str(key).isdigit() else None
+            if product is None:
                 continue
-            qty = int(item.get("quantity", 1))
-            unit_price = Decimal(product.price or 0)
-            line_total = unit_price * qty
+            # From the row just loaded, like checkout (not the display table).
+            unit_cents = convert_to(product.price_cents, currency)
             items.append({
                 "id": key,
                 "name": product.name,
-                "description": getattr(product, "description", ""),
+                "description": product.description,
                 "quantity": qty,
-                "unit_price": unit_price,
-                "line_total": line_total,
+                "unit_cents": unit_cents,
+                "line_cents": unit_cents * qty,
                 "is_gift": False,
             })
-            subtotal += line_total
+        subtotal += unit_cents * qty
 
-    total = subtotal.quantize(Decimal('0.01'))
+    cart_product_ids = [int(it['id']) for it in items if not it['is_gift']]
 
     return render(request, 'main/cart.html', {
         'cart': cart,
         'STRIPE_PUBLIC_KEY': public_key,
         'items': items,
         'has_items': bool(items),
-        'subtotal': subtotal.quantize(Decimal('0.01')),
-        'total': total,
-        'currency': currency,
+        'subtotal_cents': subtotal,
+        'shipping_cents': 0,
+        'total_cents': subtotal,
+        'free_shipping_over_cents': convert_to(FREE_SHIPPING_OVER_CENTS, currency),
+        'recommendations': recommended_products(cart_product_ids),
     })
 
 
@@ -200,11 +400,14 @@ def create_checkout_session(request):
         return redirect('cart')
 
     line_items = []
-    currency = getattr(settings, "STRIPE_CURRENCY", "usd")
+    stock_lines = []
+    # Charge in the currency the cart was shown in, at the same prices.
+    currency = get_currency(request)
+    products = _cart_products(cart)
 
     for key, item in cart.items():
-        if str(key).startswith("gift:") or item.get("type") == "gift_certificate":
-            amt_cents = to_cents(item.get("amount", "0"))
+        if _is_gift(key, item):
+            amt_cents = convert_to(_gift_cents(item), currency)
             if amt_cents <= 0:
                 continue
             line_items.append({
@@ -216,13 +419,12 @@ def create_checkout_session(request):
                 "quantity": 1,
             })
         else:
-            try:
-                product = Product.objects.get(id=int(key))
-            except (ValueError, Product.DoesNotExist):
+            product = products.get(int(key)) if str(key).isdigit() else None
+            if product is None:
                 continue
             qty = int(item.get("quantity", 1))
-            unit_price = getattr(product, "price", 0)
-            unit_cents = to_cents(unit_price)
+            # The row just loaded, as the order will record it on success.
+            unit_cents = convert_to(product.price_cents, currency)
             if unit_cents <= 0 or qty <= 0:
                 continue
             line_items.append({
@@ -233,24 +435,64 @@ def create_checkout_session(request):
                 },
                 "quantity": qty,
             })
+            stock_lines.append((product.id, qty))
 
     if not line_items:
         return redirect('cart')
 
+    # Reserve limited stock before sending the buyer to Stripe
+    inventory.release(request.session.pop('stock_reservation', None))
     try:
-        session = stripe.checkout.Session.create(
+        token = inventory.reserve(stock_lines)
+    except inventory.OutOfStock as e:
+        name = Product.objects.filter(pk=e.product_id).values_list('name', flat=True).first()
+        messages.error(request, f'Tyvärr, "{name}" finns inte i lager i önskat antal.')
+        return redirect('cart')
+    if token:
+        request.session['stock_reservation'] = str(token)
+    request.session['checkout_currency'] = (currency, str(rates()[currency]))
+
+    try:
+        session = get_stripe().checkout.Session.create(
             mode="payment",
             line_items=line_items,
-            success_url=request.build_absolute_uri("/account/"),
-            cancel_url=request.build_absolute_uri("/cart/"),
+            success_url=request.build_absolute_uri("/cart/?success=1"),
+            cancel_url=request.build_absolute_uri("/cart/?canceled=1"),
+            expires_at=int(time.time() + inventory.CHECKOUT_TTL.total_seconds()),
         )
     except Exception as e:
+        inventory.release(request.session.pop('stock_reservation', None))
         messages.error(request, f"Betalningsfel: {e}")
         return redirect('cart')
+    # Lets the sweeper ask Stripe before giving the stock back
+    inventory.attach_session(token, session.id)
 
     return redirect(session.url, code=303)
 
 
+# Stripe webhook: settles stock reservations even if the buyer never returns
+@csrf_exempt
+@require_POST
+def stripe_webhook(request):
+    if not settings.STRIPE_WEBHOOK_SECRET:
+        return HttpResponse(status=404)
+    stripe = get_stripe()
+    try:
+        event = stripe.Webhook.construct_event(
+            request.body, request.headers.get('Stripe-Signature', ''), settings.STRIPE_WEBHOOK_SECRET
+        )
+    except (ValueError, stripe.SignatureVerificationError):
+        return HttpResponse(status=400)
+
+    session = event['data']['object']
+    if event['type'] in ('checkout.session.completed', 'checkout.session.async_payment_succeeded'):
+        if session.get('payment_status') in ('paid', 'no_payment_required'):
+            inventory.confirm_session(session['id'])
+    elif event['type'] in ('checkout.session.expired', 'checkout.session.async_payment_failed'):
+        inventory.release_session(session['id'])
+    return HttpResponse(status=200)
+
+
 def cart_increase(request, item_id):
     cart = request.session.get('cart', {})
     item_id = str(item_id)
@@ -293,6 +535,8 @@ def logout_view(request):
     return redirect('account')
 
 
+@ratelimit("20/m", key="ip")
+@ratelimit("5/m", key="username")
 def account(request):
     if request.user.is_authenticated:
         orders = Order.objects.filter(user=request.user).prefetch_related('items__product')
@@ -344,18 +588,19 @@ def gift_certificates(request):
             messages.error(request, "Beloppet måste vara ett giltigt nummer.")
             return redirect('gift_certificates')
 
-        if amount < 1:
-            messages.error(request, "Minsta belopp är 1 kr.")
+        amount_cents = to_cents(amount)
+        if amount_cents < 100:
+            messages.error(request, f"Minsta belopp är {format_price(100, base_currency())}.")
             return redirect('gift_certificates')
 
         cart = request.session.get("cart", {})
         gc_key = f"gift:{int(time.time())}"
         cart[gc_key] = {
             "type": "gift_certificate",
-            "name": f"Presentkort till {name} ({amount} kr)",
+            "name": f"Presentkort till {name} ({format_price(amount_cents, base_currency())})",
             "image_url": "",
             "quantity": 1,
-            "amount": str(amount),
+            "amount_cents": amount_cents,
             "recipient_email": email,
         }
         request.session["cart"] = cart
@@ -364,15 +609,15 @@ def gift_certificates(request):
         GiftCertificate.objects.create(
             recipient_name=name,
             recipient_email=email,
-            amount=amount,
+            amount_cents=amount_cents,
             message="",
             status="pending",
         )
 
-        messages.success(request, f"Presentkort ({amount} kr) tillagt i korgen!")
+        messages.success(request, f"Presentkort ({format_price(amount_cents, base_currency())}) tillagt i korgen!")
         return redirect('cart')
 
-    return render(request, 'main/gift_certificates.html')
+    return render(request, 'main/gift_certificates.html', {'base_currency': base_currency()})
 
 
 @login_required(login_url='account')
@@ -382,4 +627,25 @@ def purchase_history(request):
 
 
 def shipping(request):
-    return render(request, 'main/shipping.html')
\ No newline at end of file
+    return render(request, 'main/shipping.html')
+
+
+# Memory diagnostics of the worker that serves the request (see memory.py)
+@never_cache
+@staff_member_required
+def memory_diagnostics(request):
+    if request.method == 'POST':
+        action = request.POST.get('action')
+        if action == 'start':
+            memory.start_tracing()
+        elif action == 'stop':
+            memory.stop_tracing()
+        elif action == 'reset':
+            memory.reset()
+        else:
+            return JsonResponse({'error': 'action must be start, stop or reset'}, status=400)
+    try:
+        limit = min(int(request.GET.get('limit', memory.TOP_SITES)), 100)
+    except ValueError:
+        limit = memory.TOP_SITES
+    return JsonResponse(memory.report(limit))